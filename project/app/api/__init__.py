@@ -0,0 +1,41 @@
+"""
+The routers
+
+FastAPI 0.62 clones a route's response model, with every model nested in it, for
+each route and again for each include_router(), which made building the routes
+most of the import time. The routers use SharedModelRoute, which shares the
+clones between routes, the way later FastAPI versions do it.
+"""
+from typing import Any, Callable, Optional, Type
+from weakref import WeakKeyDictionary
+
+from fastapi.routing import APIRoute, request_response
+from fastapi.utils import create_cloned_field, create_response_field
+
+_cloned_types: "WeakKeyDictionary" = WeakKeyDictionary()
+
+
+class SharedModelRoute(APIRoute):
+    """APIRoute whose response model clone is built once per model"""
+
+    def __init__(
+        self,
+        path: str,
+        endpoint: Callable[..., Any],
+        *,
+        response_model: Optional[Type[Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        # Without a response model the base class builds no clone
+        super().__init__(path, endpoint, **kwargs)
+        if response_model is None:
+            return
+        self.response_model = response_model
+        self.response_field = create_response_field(
+            name="Response_" + self.unique_id, type_=response_model
+        )
+        # A new model still, so subclasses of the response model aren't sent as is
+        self.secure_cloned_response_field = create_cloned_field(
+            self.response_field, cloned_types=_cloned_types
+        )
+        self.app = request_response(self.get_route_handler())
@@ -1,17 +1,23 @@
 import logging
+from typing import TYPE_CHECKING
 
-import google_auth_oauthlib.flow
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import RedirectResponse
 from fastapi_jwt_auth import AuthJWT
-from google.auth.transport import requests
-from google.oauth2 import id_token
 
+from app import google_calendar
+from app.api import SharedModelRoute
+from app.api.user import forget_user
 from app.config import Settings, get_settings
 from app.models.pydnatic import SwapCodeIn
 from app.models.tortoise import Credentials, User, User_Pydnatic, UserCreate
+from app.models.utils import invalidate_counts
+from app.response_cache import response_cache
 
-router = APIRouter(prefix="/auth", tags=["auth"])
+if TYPE_CHECKING:
+    from google_auth_oauthlib.flow import Flow
+
+router = APIRouter(prefix="/auth", tags=["auth"], route_class=SharedModelRoute)
 
 logger = logging.getLogger("uvicorn")
 
@@ -41,7 +47,7 @@ def get_google_info(settings: Settings = Depends(get_settings)):
 
 @router.get("/code/client")
 def get_client_auth(request: Request, google_info=Depends(get_google_info)):
-    flow = google_auth_oauthlib.flow.Flow.from_client_config(google_info, scopes=SCOPES)
+    flow = create_flow(google_info)
     flow.redirect_uri = request.url_for("callback")
 
     authorization_url, _ = flow.authorization_url(
@@ -61,9 +67,17 @@ def get_auth_url(google_info=Depends(get_google_info)):
     return {"scopes": SCOPES, "client_id": google_info["web"]["client_id"]}
 
 
-def verify_creds(
-    flow: google_auth_oauthlib.flow.Flow, google_info, settings: Settings
-) -> dict:
+def create_flow(google_info) -> "Flow":
+    # The Google libraries are slow to import and only needed to log in
+    import google_auth_oauthlib.flow
+
+    return google_auth_oauthlib.flow.Flow.from_client_config(google_info, scopes=SCOPES)
+
+
+def verify_creds(flow: "Flow", google_info, settings: Settings) -> dict:
+    from google.auth.transport import requests
+    from google.oauth2 import id_token
+
     creds = flow.credentials
 
     req = requests.Request()
@@ -88,11 +102,15 @@ async def swap_code(
     settings: Settings = Depends(get_settings),
     Authorize: AuthJWT = Depends(),
 ):
-    flow = google_auth_oauthlib.flow.Flow.from_client_config(google_info, scopes=SCOPES)
+    flow = create_flow(google_info)
     flow.redirect_uri = swap_info.redirect_uri
-    flow.fetch_token(code=swap_info.code)
+    await google_calendar.timed_call(
+        "oauth2.token.exchange", flow.fetch_token, code=swap_info.code
+    )
 
-    info = verify_creds(flow, google_info, settings)
+    info = await google_calendar.timed_call(
+        "oauth2.id_token.verify", verify_creds, flow, google_info, settings
+    )
 
     return await get_or_create_user(flow, info, Authorize)
 
@@ -104,19 +122,23 @@ async def callback(
     settings: Settings = Depends(get_settings),
     Authorize: AuthJWT = Depends(),
 ):
-    flow = google_auth_oauthlib.flow.Flow.from_client_config(google_info, scopes=SCOPES)
+    flow = create_flow(google_info)
     flow.redirect_uri = request.url_for("callback")
 
-    flow.fetch_token(authorization_response=str(request.url))
+    await google_calendar.timed_call(
+        "oauth2.token.exchange",
+        flow.fetch_token,
+        authorization_response=str(request.url),
+    )
 
-    info = verify_creds(flow, google_info, settings)
+    info = await google_calendar.timed_call(
+        "oauth2.id_token.verify", verify_creds, flow, google_info, settings
+    )
 
     return await get_or_create_user(flow, info, Authorize)
 
 
-async def get_or_create_user(
-    flow: google_auth_oauthlib.flow.Flow, info, Authorize: AuthJWT
-) -> UserCreate:
+async def get_or_create_user(flow: "Flow", info, Authorize: AuthJWT) -> UserCreate:
     google_creds = flow.credentials
 
     user = await User.get_or_none(email=info["email"]).first()
@@ -133,6 +155,10 @@ async def get_or_create_user(
     creds, bo = await Credentials.get_or_create(user=user)
     creds.json_field = google_creds.to_json()
     await creds.save()
+    forget_user(user_id=user.id, email=user.email)
+    invalidate_counts(User)
+    await response_cache.invalidate(User, user.id)
+    google_calendar.service_cache.invalidate(user.id)
 
     return UserCreate(
         user=await User_Pydnatic.from_tortoise_orm(user),
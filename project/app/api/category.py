@@ -1,40 +1,101 @@
-from typing import List
+import datetime
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.responses import JSONResponse
+from tortoise.timezone import now
 
+from app import availability
+from app.api import SharedModelRoute
 from app.api.user import find_current_superuser, find_current_user
-from app.models.pydnatic import CategoryFilters
+from app.directory import tutor_directory
+from app.models.pydnatic import Availability, CategoryFilters
 from app.models.tortoise import Category, Category_Pydnatic, CategoryIn_Pydnatic, User
-from app.models.utils import PaginateModel
+from app.models.utils import (
+    Page,
+    PaginateModel,
+    etag_matches,
+    fetch_detail,
+    invalidate_counts,
+    sparse_fields,
+)
+from app.response_cache import response_cache
 
-router = APIRouter(prefix="/category", tags=["category"])
+router = APIRouter(prefix="/category", tags=["category"], route_class=SharedModelRoute)
 
-pageinate_category = PaginateModel(Category, CategoryFilters)
+pageinate_category = PaginateModel(Category, CategoryFilters, count="cached", fast=True)
 
 
 # GET /
 # Must be normal user (find_current_user)
 # Get all categories
 @router.get("/", response_model=List[Category_Pydnatic])
+@response_cache.cached(Category_Pydnatic)
 async def get_categories(
     response: Response,
     current_user: User = Depends(find_current_user),
-    categories=Depends(pageinate_category),
+    categories: Page = Depends(pageinate_category),
 ):
-    len_categories = await categories.count()
-    response.headers["X-Total-Count"] = f"{len_categories}"
-    return await Category_Pydnatic.from_queryset(categories)
+    return await categories.fetch(response, Category_Pydnatic)
 
 
 # GET /{id}
 # Must be normal user
 # Get category by ID
 @router.get("/{category_id}", response_model=Category_Pydnatic)
+@response_cache.cached(Category_Pydnatic, id_param="category_id")
 async def get_category_id(
-    category_id: int, current_user: User = Depends(find_current_user)
+    category_id: int,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(find_current_user),
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields),
 ):
-    return await Category_Pydnatic.from_queryset_single(Category.get(id=category_id))
+    return await fetch_detail(
+        request, response, Category.get(id=category_id), Category_Pydnatic, fields
+    )
+
+
+# GET /{id}/tutors
+# Must be normal user
+# Ids of the tutors listed under a category, served from memory with an ETag
+@router.get("/{category_id}/tutors")
+async def get_category_tutors(
+    category_id: int,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(find_current_user),
+):
+    found = await tutor_directory.response(category_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Category {category_id} not found")
+    body, etag = found
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# GET /{id}/availability
+# Must be normal user
+# Tutors of a category free for duration minutes between time_min and time_max,
+# by default for the whole window
+@router.get("/{category_id}/availability", response_model=Availability)
+async def get_category_availability(
+    category_id: int,
+    time_min: datetime.datetime = Query(...),
+    time_max: datetime.datetime = Query(...),
+    duration: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(find_current_user),
+):
+    # Naive times are local ones, like on the schedule
+    time_min = time_min.astimezone(datetime.timezone.utc)
+    time_max = time_max.astimezone(datetime.timezone.utc)
+    if time_max <= time_min:
+        raise HTTPException(status_code=400, detail="time_max must be after time_min")
+    window = time_max - time_min
+    if duration is not None:
+        window = datetime.timedelta(minutes=duration)
+    return await availability.search(category_id, time_min, time_max, window)
 
 
 # POST /
@@ -43,6 +104,9 @@ async def get_category_id(
 @router.post("/", response_model=Category_Pydnatic)
 async def create_category(category: CategoryIn_Pydnatic):
     category_obj = await Category.create(**category.dict(exclude_unset=True))
+    invalidate_counts(Category)
+    await response_cache.invalidate(Category, category_obj.id)
+    tutor_directory.add_category(category_obj.id)
     return await Category_Pydnatic.from_tortoise_orm(category_obj)
 
 
@@ -55,7 +119,11 @@ async def put_category_id(
     category_id: int,
     current_superuser: User = Depends(find_current_superuser),
 ):
-    await Category.filter(id=category_id).update(**category.dict(exclude_unset=True))
+    await Category.filter(id=category_id).update(
+        **category.dict(exclude_unset=True), updated_at=now()
+    )
+    invalidate_counts(Category)
+    await response_cache.invalidate(Category, category_id)
     return await Category_Pydnatic.from_queryset_single(Category.get(id=category_id))
 
 
@@ -67,6 +135,9 @@ async def delete_category(
     category_id: int, current_superuser: User = Depends(find_current_superuser)
 ):
     deleted_category = await Category.filter(id=category_id).delete()
+    invalidate_counts(Category)
+    await response_cache.invalidate(Category, category_id)
+    tutor_directory.remove_category(category_id)
     if not deleted_category:
         raise HTTPException(status_code=404, detail=f"Category {category_id} not found")
     return JSONResponse(content={"message": f"Category deleted {category_id}"})
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+
+from app import metrics
+from app.api import SharedModelRoute
+
+router = APIRouter(route_class=SharedModelRoute)
+
+
+# GET /metrics for Prometheus to scrape
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    return metrics.render()
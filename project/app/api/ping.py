@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends
 
+from app.api import SharedModelRoute
 from app.config import Settings, get_settings
 
-router = APIRouter()
+router = APIRouter(route_class=SharedModelRoute)
 
 
 @router.get("/ping")
@@ -1,16 +1,35 @@
-from typing import List
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import JSONResponse
+from tortoise.timezone import now
 
+from app import moderation
+from app.api import SharedModelRoute
 from app.api.user import find_current_superuser, find_current_user
+from app.db import reading_from_replica
 from app.models.pydnatic import ReportFilters
-from app.models.tortoise import Report, Report_Pydnatic, ReportIn_Pydnatic, User
-from app.models.utils import PaginateModel
+from app.models.tortoise import (
+    Report,
+    Report_Pydnatic,
+    ReportGroup_Pydnatic,
+    ReportIn_Pydnatic,
+    ReportType,
+    User,
+)
+from app.models.utils import (
+    Page,
+    PaginateModel,
+    decode_cursor,
+    encode_cursor,
+    fetch_detail,
+    sparse_fields,
+)
+from app.response_cache import response_cache
 
-router = APIRouter(prefix="/reports", tags=["reports"])
+router = APIRouter(prefix="/reports", tags=["reports"], route_class=SharedModelRoute)
 
-pageinate_report = PaginateModel(Report, ReportFilters)
+pageinate_report = PaginateModel(Report, ReportFilters, fast=True)
 
 
 # GET /
@@ -18,24 +37,59 @@ pageinate_report = PaginateModel(Report, ReportFilters)
 # Get all reports
 # try to use the pagination thing like in user and categories
 @router.get("/", response_model=List[Report_Pydnatic])
+@response_cache.cached(Report_Pydnatic)
 async def get_reports(
     response: Response,
     current_superuser: User = Depends(find_current_superuser),
-    reports=Depends(pageinate_report),
+    reports: Page = Depends(pageinate_report),
 ):
-    len_reports = await reports.count()
-    response.headers["X-Total-Count"] = f"{len_reports}"
-    return await Report_Pydnatic.from_queryset(reports)
+    return await reports.fetch(response, Report_Pydnatic)
+
+
+# GET /queue
+# must be superuser
+# Reports grouped by what they report, the most recently reported first
+@router.get("/queue", response_model=List[ReportGroup_Pydnatic])
+async def get_report_queue(
+    request: Request,
+    response: Response,
+    type: Optional[ReportType] = None,
+    limit: int = Query(20, ge=1, le=100),
+    _cursor: Optional[str] = None,
+    current_superuser: User = Depends(find_current_superuser),
+):
+    until = before = None
+    if _cursor:
+        until, before = decode_cursor(_cursor)
+        if not isinstance(before, int) or not isinstance(until or 0, int):
+            raise HTTPException(400, "Invalid cursor")
+    with reading_from_replica(request):
+        groups = await moderation.report_queue(type, before, until, limit)
+    if len(groups) == limit:
+        # Later pages leave out what was reported after the first one
+        if until is None:
+            until = groups[0]["latest_report_id"]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            until, groups[-1]["latest_report_id"]
+        )
+    return groups
 
 
 # GET /
 # must by superuser user
 # Get report by id
 @router.get("/{report_id}", response_model=Report_Pydnatic)
+@response_cache.cached(Report_Pydnatic, id_param="report_id")
 async def get_report_id(
-    report_id: int, current_superuser: User = Depends(find_current_superuser)
+    report_id: int,
+    request: Request,
+    response: Response,
+    current_superuser: User = Depends(find_current_superuser),
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields),
 ):
-    return await Report_Pydnatic.from_queryset_single(Report.get(id=report_id))
+    return await fetch_detail(
+        request, response, Report.get(id=report_id), Report_Pydnatic, fields
+    )
 
 
 # POST /
@@ -46,6 +100,7 @@ async def create_report(
     report: ReportIn_Pydnatic, current_user: User = Depends(find_current_user)
 ):
     report_obj = await Report.create(**report.dict(exclude_unset=True))
+    await response_cache.invalidate(Report, report_obj.id)
     return await Report_Pydnatic.from_tortoise_orm(report_obj)
 
 
@@ -58,7 +113,10 @@ async def update_report(
     report_id: int,
     current_superuser: User = Depends(find_current_superuser),
 ):
-    await Report.filter(id=report_id).update(**report.dict(exclude_unset=True))
+    await Report.filter(id=report_id).update(
+        **report.dict(exclude_unset=True), updated_at=now()
+    )
+    await response_cache.invalidate(Report, report_id)
     return await Report_Pydnatic.from_queryset_single(Report.get(id=report_id))
 
 
@@ -70,6 +128,7 @@ async def delete_report(
     report_id: int, current_superuser: User = Depends(find_current_superuser)
 ):
     deleted_report = await Report.filter(id=report_id).delete()
+    await response_cache.invalidate(Report, report_id)
     if not deleted_report:
         raise HTTPException(status_code=404, detail=f"Report {report_id} not found")
     return JSONResponse(content={"message": f"Report deleted {report_id}"})
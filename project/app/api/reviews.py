@@ -1,40 +1,51 @@
-from typing import List
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
+from tortoise.timezone import now
+from tortoise.transactions import in_transaction
 
-from app.api.user import find_current_superuser, find_current_user
+from app.api import SharedModelRoute
+from app.api.user import find_current_superuser, find_current_user, forget_user
 from app.models.pydnatic import ReviewFilters
 from app.models.tortoise import Review, Review_Pydnatic, ReviewIn_Pydnatic, User
-from app.models.utils import PaginateModel
+from app.models.utils import Page, PaginateModel, fetch_detail, sparse_fields
+from app.ratings import apply_ratings
+from app.response_cache import response_cache
 
-router = APIRouter(prefix="/reviews", tags=["reviews"])
+router = APIRouter(prefix="/reviews", tags=["reviews"], route_class=SharedModelRoute)
 
-pageinate_review = PaginateModel(Review, ReviewFilters)
+pageinate_review = PaginateModel(Review, ReviewFilters, fast=True)
 
 
 # GET /
 # must by normal user
 # Get all reviews
 @router.get("/", response_model=List[Review_Pydnatic])
+@response_cache.cached(Review_Pydnatic)
 async def get_reviews(
     response: Response,
     current_user: User = Depends(find_current_user),
-    reviews=Depends(pageinate_review),
+    reviews: Page = Depends(pageinate_review),
 ):
-    len_reviews = await reviews.count()
-    response.headers["X-Total-Count"] = f"{len_reviews}"
-    return await Review_Pydnatic.from_queryset(reviews)
+    return await reviews.fetch(response, Review_Pydnatic)
 
 
 # GET /{review_id}
 # must by normal user
 # Get reviews by id
 @router.get("/{review_id}", response_model=Review_Pydnatic)
+@response_cache.cached(Review_Pydnatic, id_param="review_id")
 async def get_review_id(
-    review_id: int, current_user: User = Depends(find_current_user)
+    review_id: int,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(find_current_user),
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields),
 ):
-    return await Review_Pydnatic.from_queryset_single(Review.get(id=review_id))
+    return await fetch_detail(
+        request, response, Review.get(id=review_id), Review_Pydnatic, fields
+    )
 
 
 # POST /
@@ -42,7 +53,16 @@ async def get_review_id(
 # make a new review
 @router.post("/", response_model=Review_Pydnatic)
 async def create_review(review: ReviewIn_Pydnatic):
-    review_obj = await Review.create(**review.dict(exclude_unset=True))
+    async with in_transaction(Review._meta.default_connection) as connection:
+        review_obj = await Review.create(
+            **review.dict(exclude_unset=True), using_db=connection
+        )
+        await apply_ratings(
+            connection, [(review_obj.reviewee_id, review_obj.rating, 1)]
+        )
+    forget_user(user_id=review_obj.reviewee_id)
+    await response_cache.invalidate(Review, review_obj.id)
+    await response_cache.invalidate(User, review_obj.reviewee_id)
     return await Review_Pydnatic.from_tortoise_orm(review_obj)
 
 
@@ -55,7 +75,22 @@ async def put_review_id(
     review_id: int,
     current_superuser: User = Depends(find_current_superuser),
 ):
-    await Review.filter(id=review_id).update(**review.dict(exclude_unset=True))
+    async with in_transaction(Review._meta.default_connection) as connection:
+        old = await Review.filter(id=review_id).using_db(connection).select_for_update()
+        if not old:
+            raise HTTPException(status_code=404, detail=f"Review {review_id} not found")
+        await Review.filter(id=review_id).using_db(connection).update(
+            **review.dict(exclude_unset=True), updated_at=now()
+        )
+        new = await Review.get(id=review_id).using_db(connection)
+        await apply_ratings(
+            connection,
+            [(old[0].reviewee_id, old[0].rating, -1), (new.reviewee_id, new.rating, 1)],
+        )
+    forget_user(user_id=old[0].reviewee_id)
+    forget_user(user_id=new.reviewee_id)
+    await response_cache.invalidate(Review, review_id)
+    await response_cache.invalidate(User, old[0].reviewee_id, new.reviewee_id)
     return await Review_Pydnatic.from_queryset_single(Review.get(id=review_id))
 
 
@@ -66,7 +101,17 @@ async def put_review_id(
 async def delete_review(
     review_id: int, current_superuser: User = Depends(find_current_superuser)
 ):
-    deleted_count = await Review.filter(id=review_id).delete()
-    if not deleted_count:
-        raise HTTPException(status_code=404, detail=f"User {review_id} not found")
+    async with in_transaction(Review._meta.default_connection) as connection:
+        deleted = (
+            await Review.filter(id=review_id).using_db(connection).select_for_update()
+        )
+        if not deleted:
+            raise HTTPException(status_code=404, detail=f"User {review_id} not found")
+        await Review.filter(id=review_id).using_db(connection).delete()
+        await apply_ratings(
+            connection, [(deleted[0].reviewee_id, deleted[0].rating, -1)]
+        )
+    forget_user(user_id=deleted[0].reviewee_id)
+    await response_cache.invalidate(Review, review_id)
+    await response_cache.invalidate(User, deleted[0].reviewee_id)
     return JSONResponse(content={"message": f"Review deleted {review_id}"})
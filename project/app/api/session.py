@@ -1,13 +1,18 @@
-import datetime
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Response
-from googleapiclient.errors import HttpError
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from tortoise.query_utils import Q
+from tortoise.transactions import in_transaction
 
+from app import booking
+from app.api import SharedModelRoute
 from app.api.user import find_current_superuser, find_current_user
 from app.models.pydnatic import SessionFilters
 from app.models.tortoise import (
+    Booking_Pydnatic,
+    BookingStatus,
+    CalendarOutbox,
     Category,
     Session,
     Session_Pydnatic,
@@ -15,11 +20,17 @@ from app.models.tortoise import (
     StudentSessions,
     User,
 )
-from app.models.utils import PaginateModel
+from app.models.utils import (
+    Page,
+    PaginateModel,
+    fetch_detail,
+    fetch_fields,
+    sparse_fields,
+)
 
-router = APIRouter(prefix="/session", tags=["sessions"])
+router = APIRouter(prefix="/session", tags=["sessions"], route_class=SharedModelRoute)
 
-paginate_sessions = PaginateModel(Session, SessionFilters)
+paginate_sessions = PaginateModel(Session, SessionFilters, count="estimate", fast=True)
 
 log = logging.getLogger("uvicorn")
 
@@ -28,31 +39,89 @@ log = logging.getLogger("uvicorn")
 async def get_sessions(
     response: Response,
     current_user: User = Depends(find_current_superuser),
-    sessions=Depends(paginate_sessions),
+    sessions: Page = Depends(paginate_sessions),
 ):
-    len_sessions = await sessions.count()
-    response.headers["X-Total-Count"] = f"{len_sessions}"
-    return await Session_Pydnatic.from_queryset(sessions.prefetch_related("students"))
+    return await sessions.fetch(response, Session_Pydnatic)
+
+
+@router.get("/me", response_model=List[Session_Pydnatic])
+async def get_my_sessions(
+    response: Response,
+    role: Optional[str] = Query(None, regex="^(tutor|student)$"),
+    current_user: User = Depends(find_current_user),
+    sessions: Page = Depends(paginate_sessions),
+):
+    """
+    The sessions the current user tutors or attends, only one of them with role
+
+    start_time__gte=now and _sort=start_time give the upcoming ones
+    """
+    criteria = []
+    if role != "student":
+        criteria.append(Q(tutor_id=current_user.id))
+    if role != "tutor":
+        # Read off the (user_id, session_id) index alone
+        session_ids = await StudentSessions.filter(user_id=current_user.id).values_list(
+            "session_id", flat=True
+        )
+        criteria.append(Q(id__in=session_ids))
+    return await sessions.where(Q(*criteria, join_type="OR")).fetch(
+        response, Session_Pydnatic
+    )
 
 
 @router.get("/{session_id}", response_model=Session_Pydnatic)
 async def get_session(
-    session_id: int, current_user: User = Depends(find_current_superuser)
+    session_id: int,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(find_current_superuser),
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields),
 ):
-    return await Session_Pydnatic.from_queryset_single(
-        Session.get(id=session_id).prefetch_related("students")
+    return await fetch_detail(
+        request, response, Session.get(id=session_id), Session_Pydnatic, fields
+    )
+
+
+@router.get("/{session_id}/booking", response_model=Booking_Pydnatic)
+async def get_booking(session_id: int, current_user: User = Depends(find_current_user)):
+    """
+    The status of the current user's booking of the session, pending until the
+    student is added to the tutor's calendar event
+    """
+    student_session = await StudentSessions.get_or_none(
+        session_id=session_id, user_id=current_user.id
+    )
+    if student_session is None:
+        raise HTTPException(status_code=404, detail=f"Booking {session_id} not found")
+
+    outbox = await CalendarOutbox.get_or_none(session_id=session_id)
+    confirmed = student_session.status == BookingStatus.confirmed
+    return Booking_Pydnatic(
+        session_id=session_id,
+        status=student_session.status,
+        attempts=0 if outbox is None else outbox.attempts,
+        error=None if outbox is None or confirmed else outbox.last_error,
     )
 
 
-@router.post("/", response_model=Session_Pydnatic)
+@router.post("/", response_model=Session_Pydnatic, status_code=202)
 async def create_session(
     session_in: SessionIn_Pydnatic, current_user: User = Depends(find_current_user)
 ):
+    """
+    Book the tutor's calendar event for the current user
+
+    The booking is pending until a worker of app.booking added the student to the
+    event, GET /session/{session_id}/booking tells when it is confirmed
+    """
     tutor: User = await User.get_or_none(id=session_in.tutor_id)
     if tutor is None:
         raise HTTPException(
             status_code=404, detail=f"Tutor {session_in.tutor_id} not found"
         )
+    if tutor.google_calendar_id is None:
+        raise HTTPException(status_code=404, detail="No Calendar found")
 
     category = await Category.get_or_none(id=session_in.category_id)
 
@@ -61,56 +130,32 @@ async def create_session(
             status_code=404, detail=f"Category {session_in.category_id} not found"
         )
 
-    tutor_calendar = await tutor.get_calendar_service()
-    try:
-        event = (
-            tutor_calendar.events()
-            .get(calendarId=tutor.google_calendar_id, eventId=session_in.event_id)
-            .execute()
-        )
-    except HttpError as e:
-        log.info(e)
-        raise HTTPException(status_code=404, detail="Calendar w/ id not found")
-
-    event["summary"] = "[SU Guidance] Session"
-    attendees = event.get("attendees", [])
-    attendees.append({"email": current_user.email})
-    event["attendees"] = attendees
-
-    try:
-        new_event = (
-            tutor_calendar.events()
-            .update(
-                calendarId=tutor.google_calendar_id,
-                eventId=event["id"],
-                body=event,
-                sendUpdates="all",
-            )
-            .execute()
-        )
-    except HttpError as e:
-        log.info(e.uri)
-        log.info(e.content)
-        raise HTTPException(
-            status_code=404, detail="Calendar w/ id not found when creating"
-        )
-
-    log.info(new_event)
+    # A typo or forged id is turned away before any row is written
+    start_time = await booking.event_start(tutor, session_in.event_id)
 
-    if "summary" not in new_event:
-        raise HTTPException(
-            status_code=500, detail=f"Event {session_in.event_id} not updated"
+    async with in_transaction(Session._meta.default_connection) as connection:
+        session, _ = await Session.get_or_create(
+            tutor=tutor,
+            event_id=session_in.event_id,
+            defaults={"start_time": start_time},
+            using_db=connection,
         )
-
-    start = new_event["start"].get("dateTime")
-    start = start[:-9]
-    start = datetime.datetime.strptime(start, "%Y-%m-%dT%H:%M")
-
-    session, created = await Session.get_or_create(
-        tutor=tutor, event_id=new_event["id"], start_time=start
+        student_session, created = await StudentSessions.get_or_create(
+            session=session,
+            user=current_user,
+            defaults={"category": category, "status": BookingStatus.pending},
+            using_db=connection,
+        )
+        # Booking again after the calendar update was given up on retries it
+        if not created and student_session.status == BookingStatus.failed:
+            student_session.category = category
+            student_session.status = BookingStatus.pending
+            await student_session.save(using_db=connection)
+        if student_session.status == BookingStatus.pending:
+            await booking.enqueue(session, connection)
+    booking.workers.notify()
+
+    session = await Session.get(id=session.id).prefetch_related(
+        *fetch_fields(Session_Pydnatic, Session)
     )
-    # await session.save()
-
-    await StudentSessions.create(session=session, category=category, user=current_user)
-
-    return await Session_Pydnatic.from_queryset_single(Session.get(id=session.id))
+    return Session_Pydnatic.from_orm(session)
@@ -1,23 +1,79 @@
+import asyncio
 import datetime
 import logging
-from typing import List
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.security import HTTPBearer
 from fastapi_jwt_auth import AuthJWT
+from tortoise.timezone import now
+from tortoise.transactions import in_transaction
 
-from app.models.pydnatic import NormalUserUpdate, UserFilters
-from app.models.tortoise import Category, User, User_Pydnatic, UserIn_Pydnatic
-from app.models.utils import PaginateModel
+from app import google_calendar, schedule, search
+from app.api import SharedModelRoute
+from app.cache import TTLCache
+from app.config import get_settings
+from app.directory import tutor_directory
+from app.models.pydnatic import NormalUserUpdate, UserBulkUpdate, UserFilters
+from app.models.tortoise import User, User_Pydnatic, UserIn_Pydnatic
+from app.models.utils import (
+    Page,
+    PaginateModel,
+    fetch_detail,
+    fetch_fields,
+    invalidate_counts,
+    sparse_fields,
+)
+from app.response_cache import response_cache
 
-router = APIRouter(prefix="/user", tags=["user"])
+router = APIRouter(prefix="/user", tags=["user"], route_class=SharedModelRoute)
 
 bearer = HTTPBearer()
 
-pageinate_user = PaginateModel(User, UserFilters)
+pageinate_user = PaginateModel(User, UserFilters, count="cached", fast=True)
 
 log = logging.getLogger("uvicorn")
 
+# JWT subject -> column values of the user row, so authenticated requests
+# don't have to hit the database just to turn the token back into a User
+user_cache = TTLCache(
+    maxsize=get_settings().user_cache_size, ttl=get_settings().user_cache_ttl
+)
+
+
+def cache_user(subject: str, user: User) -> None:
+    user_cache.set(
+        subject,
+        {
+            column: getattr(user, field)
+            for field, column in User._meta.fields_db_projection.items()
+        },
+    )
+
+
+def forget_user(user_id: Optional[int] = None, email: Optional[str] = None) -> None:
+    """Drop a user from the cache after a write changed their row"""
+    if email is not None:
+        user_cache.invalidate(email)
+    if user_id is not None:
+        user_cache.invalidate_where(lambda _, values: values["id"] == user_id)
+
+
+async def create_calendars(users: List[User]) -> None:
+    """
+    Give the new tutors among users their calendar, after their update committed
+
+    Google failing doesn't fail the update, the calendar is created on the user's
+    next update instead
+    """
+    results = await asyncio.gather(
+        *(user.update_calendar() for user in users), return_exceptions=True
+    )
+    for user, result in zip(users, results):
+        if isinstance(result, Exception):
+            log.warning(f"Could not create the calendar of user {user.id}: {result!r}")
+
 
 async def find_current_user(
     Authorize: AuthJWT = Depends(), bearer=Depends(bearer)
@@ -26,11 +82,18 @@ async def find_current_user(
 
     access_token_subject = Authorize.get_jwt_subject()
 
+    values = user_cache.get(access_token_subject)
+    if values is not None:
+        # Build a fresh instance each time so relations fetched by one
+        # request never leak into another
+        return User._init_from_db(**values)
+
     user = await User.get_or_none(email=access_token_subject).first()
 
     if user is None:
         raise HTTPException(403, "JWT subject not found")
 
+    cache_user(access_token_subject, user)
     return user
 
 
@@ -53,14 +116,57 @@ async def get_current_user(current_user: User = Depends(find_current_user)):
 async def patch_current_user(
     user_update: NormalUserUpdate, current_user: User = Depends(find_current_user)
 ):
-    await User.get(id=current_user.id).update(**user_update.dict(exclude_unset=True))
+    await User.filter(id=current_user.id).update(
+        **user_update.dict(exclude_unset=True), updated_at=now()
+    )
+    forget_user(email=current_user.email)
+    invalidate_counts(User)
+    await response_cache.invalidate(User, current_user.id)
+    if user_update.is_tutor is not None:
+        await tutor_directory.refresh_users([current_user.id])
     return await User_Pydnatic.from_queryset_single(User.get(id=current_user.id))
 
 
+# GET /user/cache/stats hit/miss counters of the user, calendar, response and
+# schedule caches
+@router.get("/cache/stats")
+async def get_user_cache_stats(
+    current_superuser: User = Depends(find_current_superuser),
+):
+    return {
+        "users": user_cache.stats(),
+        "calendar": google_calendar.stats(),
+        "responses": response_cache.stats(),
+        "schedules": schedule.stats(),
+    }
+
+
+# GET /user/search?q= users and tutors by name, email or category, best match first
+@router.get("/search", response_model=List[User_Pydnatic])
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=100),
+    is_tutor: Optional[bool] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(find_current_user),
+):
+    users = await search.search_users(q, is_tutor=is_tutor, limit=limit)
+    await User.fetch_for_list(users, *fetch_fields(User_Pydnatic, User))
+    return [User_Pydnatic.from_orm(user) for user in users]
+
+
 # GET /user/{user_id}
 @router.get("/{user_id}", response_model=User_Pydnatic)
-async def get_user_id(user_id: int, current_user: User = Depends(find_current_user)):
-    return await User_Pydnatic.from_queryset_single(User.get(id=user_id))
+@response_cache.cached(User_Pydnatic, id_param="user_id")
+async def get_user_id(
+    user_id: int,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(find_current_user),
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields),
+):
+    return await fetch_detail(
+        request, response, User.get(id=user_id), User_Pydnatic, fields
+    )
 
 
 # GET /user/{user_id}
@@ -71,22 +177,17 @@ async def get_user_schedule(
     time_min: datetime.datetime = Query(...),
     time_max: datetime.datetime = Query(...),
 ):
-    user = await User.get(id=user_id)
-    if not user.is_tutor:
-        raise HTTPException(405, "User is not a tutor")
-
-    return await user.get_events(time_min, time_max)
+    return await schedule.read_schedule(user_id, time_min, time_max)
 
 
 @router.get("/", response_model=List[User_Pydnatic])
+@response_cache.cached(User_Pydnatic)
 async def get_all_users(
     response: Response,
     current_user: User = Depends(find_current_user),
-    users=Depends(pageinate_user),
+    users: Page = Depends(pageinate_user),
 ):
-    len_users = await users.count()
-    response.headers["X-Total-Count"] = f"{len_users}"
-    return await User_Pydnatic.from_queryset(users)
+    return await users.fetch(response, User_Pydnatic)
 
 
 @router.put("/{user_id}", response_model=User_Pydnatic)
@@ -96,11 +197,75 @@ async def put_user_id(
     current_superuser: User = Depends(find_current_superuser),
 ):
     update_dict = user_in.dict(exclude_unset=True)
-    del update_dict["categories_ids"]
-    await User.filter(id=user_id).update(**update_dict)
-    user = await User.filter(id=user_id).prefetch_related("creds").first()
-    await user.update_calendar()
-    await user.categories.clear()
-    categories = await Category.filter(id__in=user_in.categories_ids).all()
-    await user.categories.add(*categories)
+    categories_ids = update_dict.pop("categories_ids", None)
+    async with in_transaction(User._meta.default_connection) as connection:
+        # Locked so concurrent updates of the user can't interleave their diffs
+        user = await User.filter(id=user_id).using_db(connection).select_for_update()
+        if not user:
+            raise HTTPException(status_code=404, detail=f"User {user_id} not found")
+        if update_dict:
+            await User.filter(id=user_id).using_db(connection).update(
+                **update_dict, updated_at=now()
+            )
+        if categories_ids is not None:
+            await User.set_categories({user_id: categories_ids}, using_db=connection)
+    user = user[0].update_from_dict(update_dict)
+    # Outside the transaction, rows shouldn't stay locked while Google answers
+    await create_calendars([user])
+    forget_user(user_id=user_id)
+    invalidate_counts(User)
+    await response_cache.invalidate(User, user_id)
+    await tutor_directory.refresh_users([user_id])
     return await User_Pydnatic.from_queryset_single(User.get(id=user_id))
+
+
+# PATCH / update many users at once, each with its own fields and categories
+@router.patch("/", response_model=List[User_Pydnatic])
+async def patch_users(
+    updates: List[UserBulkUpdate],
+    current_superuser: User = Depends(find_current_superuser),
+):
+    ids = [update.id for update in updates]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Each user can only appear once")
+
+    # Users getting the same field values are updated with a single UPDATE
+    groups: Dict[Tuple, List[int]] = defaultdict(list)
+    wanted_categories = {}
+    for update in updates:
+        fields = update.dict(exclude_unset=True, exclude={"id", "categories_ids"})
+        if fields:
+            groups[tuple(sorted(fields.items()))].append(update.id)
+        if update.categories_ids is not None:
+            wanted_categories[update.id] = update.categories_ids
+
+    async with in_transaction(User._meta.default_connection) as connection:
+        found = (
+            await User.filter(id__in=ids)
+            .using_db(connection)
+            .select_for_update()
+            .values_list("id", flat=True)
+        )
+        missing = set(ids) - set(found)
+        if missing:
+            raise HTTPException(
+                status_code=404, detail=f"Users {sorted(missing)} not found"
+            )
+        for fields, user_ids in groups.items():
+            await User.filter(id__in=user_ids).using_db(connection).update(
+                **dict(fields), updated_at=now()
+            )
+        if wanted_categories:
+            await User.set_categories(wanted_categories, using_db=connection)
+
+    # New tutors get their calendar the way put_user_id gives it to them
+    await create_calendars(
+        await User.filter(id__in=ids, is_tutor=True, google_calendar_id__isnull=True)
+    )
+
+    for user_id in ids:
+        forget_user(user_id=user_id)
+    invalidate_counts(User)
+    await response_cache.invalidate(User, *ids)
+    await tutor_directory.refresh_users(ids)
+    return await User_Pydnatic.from_queryset(User.filter(id__in=ids).order_by("id"))
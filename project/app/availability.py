@@ -0,0 +1,163 @@
+"""
+Which tutors of a category are free in a time window, answered by Google's freebusy
+
+The tutors are looked up through user_categories. Every tutor's calendar lives in
+the tutor's own Google account, so each one is queried with the tutor's own
+credentials, concurrently but at most freebusy_max_concurrency queries per process.
+Tutors whose credentials or calendar fail are reported as unknown. The busy times
+of every calendar and window are cached for availability_cache_ttl seconds.
+"""
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app import google_calendar
+from app.cache import TTLCache
+from app.config import get_settings
+from app.models.tortoise import Category, User, _parse_event_time
+
+log = logging.getLogger("uvicorn")
+
+Interval = Tuple[datetime.datetime, datetime.datetime]
+
+# (calendar id, time_min, time_max) -> busy intervals of the calendar
+busy_cache = TTLCache(
+    maxsize=get_settings().availability_cache_size,
+    ttl=get_settings().availability_cache_ttl,
+)
+
+# The event loop and the semaphore made on it, asyncio primitives stick to the
+# loop they were made on
+_slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+
+def _freebusy_slots() -> asyncio.Semaphore:
+    global _slots
+    loop = asyncio.get_event_loop()
+    if _slots is None or _slots[0] is not loop:
+        _slots = (loop, asyncio.Semaphore(get_settings().freebusy_max_concurrency))
+    return _slots[1]
+
+
+async def _query_tutor(
+    tutor: User, time_min: datetime.datetime, time_max: datetime.datetime
+) -> Optional[List[Interval]]:
+    from google.auth.exceptions import GoogleAuthError
+    from googleapiclient.errors import HttpError
+
+    calendar_id = tutor.google_calendar_id
+    body = {
+        "timeMin": time_min.isoformat(),
+        "timeMax": time_max.isoformat(),
+        "items": [{"id": calendar_id}],
+    }
+    try:
+        async with _freebusy_slots():
+            # The calendar is the tutor's own, other users can't see it
+            service = await tutor.get_calendar_service()
+            response = await google_calendar.execute(
+                service.freebusy().query(body=body)
+            )
+    except (GoogleAuthError, HttpError, HTTPException) as e:
+        # The other tutors still answer
+        log.warning(f"Freebusy of tutor {tutor.id} failed: {e}")
+        return None
+
+    calendar = response.get("calendars", {}).get(calendar_id)
+    # A calendar gone from the tutor's account comes back with errors
+    if calendar is None or calendar.get("errors"):
+        return None
+    busy = [
+        (_parse_event_time(period["start"]), _parse_event_time(period["end"]))
+        for period in calendar.get("busy", [])
+    ]
+    busy_cache.set((calendar_id, time_min, time_max), busy)
+    return busy
+
+
+async def busy_times(
+    tutors: List[User], time_min: datetime.datetime, time_max: datetime.datetime
+) -> Dict[str, Optional[List[Interval]]]:
+    """
+    The busy intervals of every tutor's calendar, None for the ones Google didn't
+    answer for
+
+    tutors : Tutors with a google_calendar_id
+    """
+    found: Dict[str, Optional[List[Interval]]] = {}
+    missing = []
+    for tutor in tutors:
+        busy = busy_cache.get((tutor.google_calendar_id, time_min, time_max))
+        if busy is None:
+            missing.append(tutor)
+        else:
+            found[tutor.google_calendar_id] = busy
+
+    answered = await asyncio.gather(
+        *(_query_tutor(tutor, time_min, time_max) for tutor in missing)
+    )
+    for tutor, busy in zip(missing, answered):
+        found[tutor.google_calendar_id] = busy
+    return found
+
+
+def free_intervals(
+    busy: List[Interval], time_min: datetime.datetime, time_max: datetime.datetime
+) -> List[Interval]:
+    """The parts of the window not covered by the busy intervals"""
+    free = []
+    start = time_min
+    for busy_start, busy_end in sorted(busy):
+        if busy_start > start:
+            free.append((start, min(busy_start, time_max)))
+        start = max(start, busy_end)
+        if start >= time_max:
+            return free
+    if start < time_max:
+        free.append((start, time_max))
+    return free
+
+
+async def search(
+    category_id: int,
+    time_min: datetime.datetime,
+    time_max: datetime.datetime,
+    duration: datetime.timedelta,
+) -> Dict:
+    """
+    The tutors of the category free for at least duration in the window
+    """
+    tutors = await User.filter(
+        is_tutor=True,
+        categories__id=category_id,
+        google_calendar_id__isnull=False,
+    ).order_by("id")
+    if not tutors and not await Category.exists(id=category_id):
+        raise HTTPException(status_code=404, detail=f"Category {category_id} not found")
+
+    busy = await busy_times(tutors, time_min, time_max)
+
+    available, unknown = [], []
+    for tutor in tutors:
+        if busy[tutor.google_calendar_id] is None:
+            unknown.append(tutor.id)
+            continue
+        free = [
+            {"start": start, "end": end}
+            for start, end in free_intervals(
+                busy[tutor.google_calendar_id], time_min, time_max
+            )
+            if end - start >= duration
+        ]
+        if free:
+            available.append({"id": tutor.id, "free": free})
+    return {
+        "category_id": category_id,
+        "time_min": time_min,
+        "time_max": time_max,
+        "tutors": available,
+        "unknown": unknown,
+    }
@@ -0,0 +1,297 @@
+"""
+Bookings of sessions, reserved locally and pushed to the tutor's calendar later
+
+POST /session/ checks the event is in the synced copy of the tutor's calendar,
+then only writes the booking, as pending, and schedules the session's
+CalendarOutbox row in the same transaction. The workers started with the app lease
+the due rows, add the students to the calendar event and confirm their bookings,
+backing off exponentially while Google fails. Every app process runs its own
+workers, the lease is taken with a conditional UPDATE so a row is pushed by one of
+them at a time.
+"""
+import asyncio
+import datetime
+import logging
+from typing import List, Optional
+
+from fastapi import HTTPException
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.query_utils import Q
+from tortoise.timezone import now
+from tortoise.transactions import in_transaction
+
+from app import google_calendar, metrics, schedule
+from app.config import get_settings
+from app.models.tortoise import (
+    BookingStatus,
+    CalendarEvent,
+    CalendarOutbox,
+    CalendarSync,
+    Session,
+    StudentSessions,
+    User,
+    _parse_event_time,
+)
+
+log = logging.getLogger("uvicorn")
+
+# Google answers these when retrying can't help
+PERMANENT_STATUSES = (400, 404, 410)
+# Due rows looked at per claim, the ones other workers win are skipped
+CLAIM_BATCH = 10
+
+
+async def event_start(tutor: User, event_id: str) -> datetime.datetime:
+    """
+    When the tutor's event starts, checked before a booking of it is written
+
+    Only the synced copy of the calendar is looked at, so booking never waits on
+    Google: the bookable events are the ones GET /user/{id}/schedule shows. Others
+    are a 404, events deleted since the last sync fail in the worker
+
+    tutor : The tutor whose calendar has the event
+    event_id : The Google Calendar id of the event
+    """
+    event = await CalendarEvent.get_or_none(tutor_id=tutor.id, event_id=event_id)
+    if event is None:
+        raise HTTPException(
+            status_code=404, detail=f"Event {event_id} not found in the schedule"
+        )
+    return event.start_time
+
+
+async def enqueue(session: Session, using_db: BaseDBAsyncClient) -> None:
+    """
+    Schedule a push of the session's pending bookings
+
+    session : The session booked
+    using_db : The transaction writing the booking
+    """
+    outbox, created = await CalendarOutbox.get_or_create(
+        session=session, defaults={"next_attempt_at": now()}, using_db=using_db
+    )
+    if not created:
+        # A worker pushing the session locks the row before it looks for pending
+        # bookings, so it either waits for this booking or gets rescheduled by it
+        await CalendarOutbox.filter(id=outbox.id).using_db(using_db).update(
+            next_attempt_at=now()
+        )
+
+
+def _due(at: datetime.datetime) -> Q:
+    unclaimed = Q(locked_until__isnull=True) | Q(locked_until__lt=at)
+    return Q(next_attempt_at__lte=at) & unclaimed
+
+
+async def claim() -> Optional[CalendarOutbox]:
+    """Lease the most overdue outbox row no other worker holds"""
+    at = now()
+    lease = datetime.timedelta(seconds=get_settings().booking_lease)
+    candidates = (
+        await CalendarOutbox.filter(_due(at))
+        .order_by("next_attempt_at")
+        .limit(CLAIM_BATCH)
+        .values_list("id", flat=True)
+    )
+    for outbox_id in candidates:
+        # Of the workers racing for a row only one updates it
+        leased = await CalendarOutbox.filter(_due(at), id=outbox_id).update(
+            locked_until=at + lease
+        )
+        if leased:
+            return await CalendarOutbox.get(id=outbox_id)
+    return None
+
+
+async def push(outbox: CalendarOutbox) -> None:
+    """Add the students of the session's pending bookings to its calendar event"""
+    session = await Session.get(id=outbox.session_id).prefetch_related("tutor")
+    bookings = await StudentSessions.filter(
+        session_id=session.id, status=BookingStatus.pending
+    ).prefetch_related("user")
+    try:
+        if bookings:
+            await _update_event(session, bookings)
+    except Exception as e:
+        await _retry_later(outbox, session, bookings, e)
+        return
+
+    await _finish(outbox, session, bookings, BookingStatus.confirmed)
+    if bookings:
+        metrics.booking_pushes.labels("confirmed").inc()
+        # Make the next schedule read pull the booking into the local store
+        await CalendarSync.filter(user_id=session.tutor.id).update(synced_at=None)
+        schedule.forget_schedules(session.tutor.id)
+
+
+async def push_next() -> bool:
+    """Push the next due outbox row, False when none is due"""
+    outbox = await claim()
+    if outbox is None:
+        return False
+    await push(outbox)
+    return True
+
+
+async def drain() -> int:
+    """Push the due outbox rows until none is left, returns how many were pushed"""
+    pushed = 0
+    while await push_next():
+        pushed += 1
+    return pushed
+
+
+async def _update_event(session: Session, bookings: List[StudentSessions]) -> None:
+    tutor = session.tutor
+    if tutor.google_calendar_id is None:
+        raise HTTPException(404, "No Calendar found")
+
+    service = await tutor.get_calendar_service()
+    event = await google_calendar.execute(
+        service.events().get(
+            calendarId=tutor.google_calendar_id, eventId=session.event_id
+        )
+    )
+
+    event["summary"] = "[SU Guidance] Session"
+    attendees = event.get("attendees", [])
+    # A push retried after Google took the update already adds nobody twice
+    invited = {attendee.get("email") for attendee in attendees}
+    attendees.extend(
+        {"email": booking.user.email}
+        for booking in bookings
+        if booking.user.email not in invited
+    )
+    event["attendees"] = attendees
+
+    event = await google_calendar.execute(
+        service.events().update(
+            calendarId=tutor.google_calendar_id,
+            eventId=session.event_id,
+            body=event,
+            sendUpdates="all",
+        )
+    )
+    if session.start_time is None:
+        session.start_time = _parse_event_time(event["start"]["dateTime"])
+
+
+async def _finish(
+    outbox: CalendarOutbox,
+    session: Session,
+    bookings: List[StudentSessions],
+    status: BookingStatus,
+    error: Optional[str] = None,
+) -> None:
+    booking_ids = [booking.id for booking in bookings]
+    async with in_transaction(CalendarOutbox._meta.default_connection) as connection:
+        # Waits for the bookings of the session being written to commit
+        await CalendarOutbox.filter(id=outbox.id).using_db(
+            connection
+        ).select_for_update()
+        if booking_ids:
+            await StudentSessions.filter(id__in=booking_ids).using_db(
+                connection
+            ).update(status=status)
+        # The pushed ones aren't pending anymore, these were booked meanwhile
+        booked_since = (
+            await StudentSessions.filter(
+                session_id=session.id, status=BookingStatus.pending
+            )
+            .using_db(connection)
+            .exists()
+        )
+        if error is None:
+            outbox.attempts = 0
+        outbox.next_attempt_at = now() if booked_since else None
+        outbox.locked_until = None
+        outbox.last_error = error
+        await outbox.save(using_db=connection)
+        if session.start_time is not None:
+            await Session.filter(id=session.id, start_time__isnull=True).using_db(
+                connection
+            ).update(start_time=session.start_time)
+
+
+def _is_permanent(error: Exception) -> bool:
+    from googleapiclient.errors import HttpError
+
+    if isinstance(error, HttpError):
+        return error.resp.status in PERMANENT_STATUSES
+    # No calendar for the tutor, timeouts are 504s and retried
+    return isinstance(error, HTTPException) and error.status_code == 404
+
+
+async def _retry_later(
+    outbox: CalendarOutbox,
+    session: Session,
+    bookings: List[StudentSessions],
+    error: Exception,
+) -> None:
+    settings = get_settings()
+    attempts = outbox.attempts + 1
+    message = f"{type(error).__name__}: {error}"
+    if _is_permanent(error) or attempts >= settings.booking_max_attempts:
+        log.warning(f"Giving up on the calendar of session {session.id}: {message}")
+        metrics.booking_pushes.labels("failed").inc()
+        outbox.attempts = attempts
+        await _finish(outbox, session, bookings, BookingStatus.failed, message)
+        return
+
+    log.info(f"Calendar of session {session.id} not updated, retrying: {message}")
+    metrics.booking_pushes.labels("retried").inc()
+    delay = min(
+        settings.booking_retry_delay * 2 ** (attempts - 1),
+        settings.booking_retry_max_delay,
+    )
+    outbox.attempts = attempts
+    outbox.next_attempt_at = now() + datetime.timedelta(seconds=delay)
+    outbox.locked_until = None
+    outbox.last_error = message
+    await outbox.save()
+
+
+class OutboxWorkers:
+    """The workers of this process pushing the outbox rows, see the module docstring"""
+
+    def __init__(self):
+        self._tasks: List[asyncio.Future] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.ensure_future(self._work())
+            for _ in range(get_settings().booking_workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Wake the idle workers up instead of waiting for their next poll"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _work(self) -> None:
+        interval = get_settings().booking_poll_interval
+        while True:
+            try:
+                pushed = await push_next()
+            except Exception:
+                # The row stays leased and is picked up again when the lease ends
+                log.exception("Pushing the booking outbox failed")
+                pushed = False
+            if pushed:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+workers = OutboxWorkers()
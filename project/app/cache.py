@@ -0,0 +1,109 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Small in-process LRU cache where every entry expires after ttl seconds
+
+    maxsize : The most entries kept before the least recently used one is evicted
+    ttl : How many seconds an entry is served before it has to be looked up again
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[1]
+        # Expired entries are dropped lazily when they are looked up
+        if entry is not None:
+            del self._data[key]
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Drop every entry where predicate(key, value) is true and return how many"""
+        keys = [key for key, entry in self._data.items() if predicate(key, entry[1])]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+        }
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one in-flight call
+
+    The first caller for a key runs func, everyone arriving before it finishes
+    waits for and shares that result (or exception)
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = asyncio.ensure_future(func())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so one cancelled waiter doesn't cancel the call for the others
+        return await asyncio.shield(flight)
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Whether do(key, ...) would wait for a call already running"""
+        return key in self._flights
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+        }
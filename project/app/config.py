@@ -3,7 +3,7 @@ import json
 import logging
 import os
 from functools import lru_cache
-from typing import List
+from typing import List, Optional
 
 from pydantic import AnyUrl, BaseSettings
 
@@ -21,10 +21,64 @@ class Settings(BaseSettings):
         os.getenv("GOOGLE_REDIRECT_URIS", "[]")
     )
     google_js_origins: List[str] = json.loads(os.getenv("GOOGLE_JS_ORIGINS", "[]"))
+    # Point the Calendar API and the token refreshes somewhere else than Google,
+    # e.g. the fake server of benchmarks/load.py
+    google_api_endpoint: Optional[str] = os.getenv("GOOGLE_API_ENDPOINT")
+    google_token_uri: Optional[str] = os.getenv("GOOGLE_TOKEN_URI")
     top_domain: str = os.getenv("TOP_DOMAIN")
     authjwt_secret_key: str = "secret"
     authjwt_refresh_token_expires = False
     authjwt_access_token_expires = datetime.timedelta(hours=12)
+    database_replica_url: Optional[str] = os.getenv("DATABASE_REPLICA_URL")
+    db_pool_min_size: int = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+    db_pool_max_size: int = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+    db_command_timeout: float = float(os.getenv("DB_COMMAND_TIMEOUT", 30))
+    # 0 disables asyncpg's prepared statement cache, needed behind pgbouncer
+    db_statement_cache_size: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+    replica_stickiness: float = float(os.getenv("REPLICA_STICKINESS", 5))
+    count_cache_size: int = int(os.getenv("COUNT_CACHE_SIZE", 1024))
+    count_cache_ttl: float = float(os.getenv("COUNT_CACHE_TTL", 5 * 60))
+    # Worker processes serving the app, gunicorn.conf.py passes gunicorn's count on
+    web_concurrency: int = int(os.getenv("WEB_CONCURRENCY", 1))
+    # Invalidations only reach their own process, so with several workers the
+    # response cache is off unless RESPONSE_CACHE_SIZE turns it on
+    response_cache_size: int = int(
+        os.getenv("RESPONSE_CACHE_SIZE", 2048 if web_concurrency == 1 else 0)
+    )
+    response_cache_ttl: float = float(os.getenv("RESPONSE_CACHE_TTL", 30))
+    tutor_directory_ttl: float = float(os.getenv("TUTOR_DIRECTORY_TTL", 60))
+    user_cache_size: int = int(os.getenv("USER_CACHE_SIZE", 1024))
+    user_cache_ttl: float = float(os.getenv("USER_CACHE_TTL", 60))
+    calendar_max_concurrency: int = int(os.getenv("CALENDAR_MAX_CONCURRENCY", 10))
+    calendar_timeout: float = float(os.getenv("CALENDAR_TIMEOUT", 10))
+    calendar_service_cache_size: int = int(
+        os.getenv("CALENDAR_SERVICE_CACHE_SIZE", 256)
+    )
+    calendar_service_cache_ttl: float = float(
+        os.getenv("CALENDAR_SERVICE_CACHE_TTL", 30 * 60)
+    )
+    calendar_token_refresh_margin: float = float(
+        os.getenv("CALENDAR_TOKEN_REFRESH_MARGIN", 5 * 60)
+    )
+    calendar_sync_interval: float = float(os.getenv("CALENDAR_SYNC_INTERVAL", 60))
+    calendar_sync_lookback_days: int = int(os.getenv("CALENDAR_SYNC_LOOKBACK_DAYS", 30))
+    # How far ahead full syncs store events, reads past it go to Google
+    calendar_sync_horizon_days: int = int(os.getenv("CALENDAR_SYNC_HORIZON_DAYS", 180))
+    # Reads of the same tutor's schedule share a load and its result for this long
+    schedule_cache_size: int = int(os.getenv("SCHEDULE_CACHE_SIZE", 1024))
+    schedule_cache_ttl: float = float(os.getenv("SCHEDULE_CACHE_TTL", 2))
+    # Availability search, see app.availability. One freebusy query per tutor, the
+    # rest of the calendar threads are left to the other calls
+    freebusy_max_concurrency: int = int(os.getenv("FREEBUSY_MAX_CONCURRENCY", 8))
+    availability_cache_size: int = int(os.getenv("AVAILABILITY_CACHE_SIZE", 4096))
+    availability_cache_ttl: float = float(os.getenv("AVAILABILITY_CACHE_TTL", 30))
+    # The booking outbox, see app.booking
+    booking_workers: int = int(os.getenv("BOOKING_WORKERS", 4))
+    booking_poll_interval: float = float(os.getenv("BOOKING_POLL_INTERVAL", 1))
+    booking_lease: float = float(os.getenv("BOOKING_LEASE", 60))
+    booking_max_attempts: int = int(os.getenv("BOOKING_MAX_ATTEMPTS", 8))
+    booking_retry_delay: float = float(os.getenv("BOOKING_RETRY_DELAY", 2))
+    booking_retry_max_delay: float = float(os.getenv("BOOKING_RETRY_MAX_DELAY", 300))
 
 
 @lru_cache()
@@ -1,15 +1,43 @@
 import logging
 import os
+from contextlib import contextmanager
+from typing import Iterator, Optional, Union
+from urllib.parse import urlparse
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from tortoise import Tortoise, run_async
+from tortoise.backends.base.config_generator import expand_db_url
 from tortoise.contrib.fastapi import register_tortoise
+from tortoise.transactions import current_transaction_map
+
+from app.cache import TTLCache
+from app.config import get_settings
 
 log = logging.getLogger("uvicorn")
 
 
+def connection_config(url: Optional[str]) -> Union[str, dict, None]:
+    """
+    A connection for TORTOISE_ORM, Postgres ones get the pool settings
+
+    Parameters given in the URL's query string (?maxsize=20) win over the settings
+    """
+    if not url or urlparse(url).scheme != "postgres":
+        return url
+    settings = get_settings()
+    config = expand_db_url(url)
+    credentials = config["credentials"]
+    credentials.setdefault("minsize", settings.db_pool_min_size)
+    credentials.setdefault("maxsize", settings.db_pool_max_size)
+    credentials["command_timeout"] = float(
+        credentials.get("command_timeout", settings.db_command_timeout)
+    )
+    credentials.setdefault("statement_cache_size", settings.db_statement_cache_size)
+    return config
+
+
 TORTOISE_ORM = {
-    "connections": {"default": os.environ.get("DATABASE_URL")},
+    "connections": {"default": connection_config(os.environ.get("DATABASE_URL"))},
     "apps": {
         "models": {
             "models": ["app.models.tortoise", "aerich.models"],
@@ -17,6 +45,53 @@ TORTOISE_ORM = {
         },
     },
 }
+if get_settings().database_replica_url:
+    TORTOISE_ORM["connections"]["replica"] = connection_config(
+        get_settings().database_replica_url
+    )
+
+# Authorization header -> its last write, those clients keep reading from the
+# primary until the replica has caught up with what they wrote
+recent_writers = TTLCache(maxsize=10000, ttl=get_settings().replica_stickiness)
+
+
+def has_replica() -> bool:
+    return "replica" in Tortoise._connections
+
+
+def remember_writer(request: Request) -> None:
+    authorization = request.headers.get("authorization")
+    if authorization is not None and has_replica():
+        recent_writers.set(authorization, True)
+
+
+@contextmanager
+def reading_from_replica(request: Request) -> Iterator[None]:
+    """
+    Send the block's queries to the read replica, when there is one
+
+    Only GET requests are routed, and only when the client didn't write recently.
+    The block must not write, in_transaction() would open its transaction on the
+    replica as well.
+    """
+    authorization = request.headers.get("authorization")
+    wrote = authorization is not None and authorization in recent_writers
+    if not has_replica() or request.method != "GET" or wrote:
+        yield
+        return
+    # Models look their connection up in these context variables, so does every
+    # queryset awaited in the block
+    replica = Tortoise.get_connection("replica")
+    tokens = [
+        (connection, connection.set(replica))
+        for name, connection in current_transaction_map.items()
+        if name != "replica"
+    ]
+    try:
+        yield
+    finally:
+        for connection, token in tokens:
+            connection.reset(token)
 
 
 def init_db(app: FastAPI) -> None:
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from app.cache import SingleFlight
+from app.config import get_settings
+from app.models.tortoise import Category, User
+
+
+class TutorDirectory:
+    """
+    In-memory category id -> tutor ids index behind GET /category/{id}/tutors
+
+    Built from the database on first use, then kept current by the write
+    handlers. It is rebuilt every ttl seconds anyway, so writes handled by other
+    worker processes show up too.
+
+    ttl : Seconds before the index is rebuilt from the database
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.loaded_at: Optional[float] = None
+        self.tutors: Dict[int, Set[int]] = {}
+        self.categories: Dict[int, Set[int]] = defaultdict(set)
+        # category id -> (body, etag) of the last response
+        self._responses: Dict[int, Tuple[bytes, str]] = {}
+        self._loads = SingleFlight()
+
+    def clear(self) -> None:
+        self.loaded_at = None
+        self.tutors = {}
+        self.categories = defaultdict(set)
+        self._responses = {}
+
+    async def load(self) -> None:
+        category_ids = await Category.all().values_list("id", flat=True)
+        links = await User.filter(is_tutor=True).values_list("id", "categories__id")
+        tutors: Dict[int, Set[int]] = {
+            category_id: set() for category_id in category_ids
+        }
+        categories: Dict[int, Set[int]] = defaultdict(set)
+        for user_id, category_id in links:
+            # Tutors without categories come back with a NULL category
+            if category_id in tutors:
+                tutors[category_id].add(user_id)
+                categories[user_id].add(category_id)
+        self.tutors, self.categories = tutors, categories
+        self._responses = {}
+        self.loaded_at = time.monotonic()
+
+    async def ensure_loaded(self) -> None:
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl:
+            await self._loads.do("load", self.load)
+
+    def update_user(
+        self, user_id: int, is_tutor: bool, category_ids: Iterable[int]
+    ) -> None:
+        """Move a user to the categories they are now listed under"""
+        if self.loaded_at is None:
+            return
+        before = self.categories.pop(user_id, set())
+        after = set(category_ids) & self.tutors.keys() if is_tutor else set()
+        for category_id in before - after:
+            self.tutors[category_id].discard(user_id)
+            self._responses.pop(category_id, None)
+        for category_id in after - before:
+            self.tutors[category_id].add(user_id)
+            self._responses.pop(category_id, None)
+        if after:
+            self.categories[user_id] = after
+
+    async def refresh_users(self, user_ids: Iterable[int]) -> None:
+        """Re-read the tutor flag and categories of users after they were updated"""
+        if self.loaded_at is None:
+            return
+        rows = await User.filter(id__in=list(user_ids)).values_list(
+            "id", "is_tutor", "categories__id"
+        )
+        users: Dict[int, Tuple[bool, Set[int]]] = {}
+        for user_id, is_tutor, category_id in rows:
+            users.setdefault(user_id, (is_tutor, set()))[1].add(category_id)
+        for user_id, (is_tutor, category_ids) in users.items():
+            self.update_user(user_id, is_tutor, category_ids)
+
+    def add_category(self, category_id: int) -> None:
+        if self.loaded_at is not None:
+            self.tutors.setdefault(category_id, set())
+
+    def remove_category(self, category_id: int) -> None:
+        for user_id in self.tutors.pop(category_id, set()):
+            self.categories[user_id].discard(category_id)
+        self._responses.pop(category_id, None)
+
+    async def response(self, category_id: int) -> Optional[Tuple[bytes, str]]:
+        """The JSON body and ETag for a category, None when there is no such category"""
+        await self.ensure_loaded()
+        if category_id not in self.tutors:
+            return None
+        cached = self._responses.get(category_id)
+        if cached is None:
+            body = json.dumps(
+                {
+                    "category_id": category_id,
+                    "tutor_ids": sorted(self.tutors[category_id]),
+                },
+                separators=(",", ":"),
+            ).encode()
+            # Derived from the content, so every worker hands out the same ETag
+            etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+            cached = self._responses[category_id] = (body, etag)
+        return cached
+
+
+tutor_directory = TutorDirectory(ttl=get_settings().tutor_directory_ttl)
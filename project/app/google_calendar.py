@@ -0,0 +1,154 @@
+import asyncio
+import datetime
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from app import metrics
+from app.cache import SingleFlight, TTLCache
+from app.config import get_settings
+
+if TYPE_CHECKING:
+    from google_auth_httplib2 import AuthorizedHttp
+
+log = logging.getLogger("uvicorn")
+
+# The Google client libraries only offer blocking calls, so they run on this
+# pool instead of the event loop. Its size is the cap on concurrent calls.
+executor = ThreadPoolExecutor(
+    max_workers=get_settings().calendar_max_concurrency,
+    thread_name_prefix="google-calendar",
+)
+
+# user id -> (credentials, calendar service) so repeated schedule reads for the
+# same tutor skip both the Credentials query and building the service
+service_cache = TTLCache(
+    maxsize=get_settings().calendar_service_cache_size,
+    ttl=get_settings().calendar_service_cache_ttl,
+)
+
+# Concurrent cache misses for the same user share one credentials load/refresh
+service_loads = SingleFlight()
+
+token_stats = {"refreshes_performed": 0, "writes_skipped": 0}
+
+
+def token_is_fresh(creds) -> bool:
+    """Whether the access token stays valid for longer than the refresh margin"""
+    if not creds.token:
+        return False
+    if creds.expiry is None:
+        return True
+    # google-auth keeps expiry as naive UTC
+    margin = datetime.timedelta(seconds=get_settings().calendar_token_refresh_margin)
+    return creds.expiry - margin > datetime.datetime.utcnow()
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        **token_stats,
+        "refreshes_coalesced": service_loads.coalesced,
+        "service_cache": service_cache.stats(),
+    }
+
+
+async def run_blocking(
+    func: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs
+) -> Any:
+    """
+    Run a blocking Google client call on the calendar thread pool
+
+    func : The blocking callable to run
+    timeout : Seconds to wait for the result, defaults to the calendar_timeout setting
+    """
+    if timeout is None:
+        timeout = get_settings().calendar_timeout
+
+    loop = asyncio.get_event_loop()
+    future = loop.run_in_executor(executor, partial(func, *args, **kwargs))
+    metrics.google_in_flight.inc()
+    future.add_done_callback(lambda _: metrics.google_in_flight.dec())
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        log.warning(f"Google call {getattr(func, '__qualname__', func)} timed out")
+        raise HTTPException(504, "Google Calendar did not respond in time")
+
+
+async def execute(request, timeout: Optional[float] = None) -> Any:
+    """Execute a googleapiclient HttpRequest without blocking the event loop"""
+    creds = getattr(getattr(request, "http", None), "credentials", None)
+    # Services are shared between requests but httplib2 connections are not
+    # thread safe, so every call gets its own transport
+    kwargs = {} if creds is None else {"http": authorized_http(creds)}
+    return await timed_call(
+        getattr(request, "methodId", "unknown"),
+        request.execute,
+        timeout=timeout,
+        **kwargs,
+    )
+
+
+async def timed_call(
+    method: str,
+    func: Callable[..., Any],
+    *args,
+    timeout: Optional[float] = None,
+    **kwargs,
+) -> Any:
+    """
+    run_blocking for a call to a Google API, recorded in the metrics
+
+    method : What the call is reported as, e.g. calendar.events.list
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        return await run_blocking(func, *args, timeout=timeout, **kwargs)
+    except HTTPException as e:
+        status = str(e.status_code)
+        raise
+    except Exception as e:
+        # HttpError carries the response Google sent
+        status = str(getattr(getattr(e, "resp", None), "status", "error"))
+        raise
+    finally:
+        metrics.observe_google_call(method, status, time.perf_counter() - start)
+
+
+# The Google client libraries are imported where they are used, they take a good
+# part of a second to import and most requests never talk to Google
+
+
+def authorized_http(creds) -> "AuthorizedHttp":
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+
+    # Socket level timeout so a hung connection also frees its pool thread
+    return AuthorizedHttp(
+        creds, http=httplib2.Http(timeout=get_settings().calendar_timeout)
+    )
+
+
+@lru_cache()
+def calendar_discovery() -> Dict:
+    """The Calendar v3 discovery document bundled with googleapiclient, parsed once"""
+    from googleapiclient.discovery_cache import get_static_doc
+
+    return json.loads(get_static_doc("calendar", "v3"))
+
+
+def build_service(creds):
+    from googleapiclient.discovery import build_from_document
+
+    endpoint = get_settings().google_api_endpoint
+    return build_from_document(
+        calendar_discovery(),
+        http=authorized_http(creds),
+        client_options={"api_endpoint": endpoint} if endpoint else None,
+    )
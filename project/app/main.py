@@ -6,9 +6,12 @@ from fastapi.responses import JSONResponse
 from fastapi_jwt_auth import AuthJWT
 from fastapi_jwt_auth.exceptions import AuthJWTException
 
-from app.api import auth, category, ping, reports, reviews, session, user
+from app import booking, metrics
+from app.api import auth, category
+from app.api import metrics as metrics_api
+from app.api import ping, reports, reviews, session, user
 from app.config import get_settings
-from app.db import init_db
+from app.db import init_db, remember_writer
 
 log = logging.getLogger("uvicorn")
 
@@ -17,6 +20,7 @@ def create_application() -> FastAPI:
     application = FastAPI()
 
     application.include_router(ping.router)
+    application.include_router(metrics_api.router)
     application.include_router(auth.router)
     application.include_router(user.router)
     application.include_router(category.router)
@@ -30,7 +34,20 @@ def create_application() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-        expose_headers=["X-Total-Count"],
+        expose_headers=["X-Total-Count", "X-Next-Cursor", "ETag"],
+    )
+
+    @application.middleware("http")
+    async def keep_writers_on_primary(request: Request, call_next):
+        response = await call_next(request)
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            remember_writer(request)
+        return response
+
+    metrics.instrument_tortoise()
+    # Added last so it is the outermost middleware and times all the others
+    application.middleware("http")(
+        metrics.middleware(metrics.RouteNames(application.routes))
     )
 
     @AuthJWT.load_config
@@ -49,12 +66,18 @@ def create_application() -> FastAPI:
 app = create_application()
 
 
-@app.on_event("startup")
-async def startup_event():
-    log.info("Starting up...")
-    init_db(app)
-
-
 @app.on_event("shutdown")
 async def shutdown_event():
     log.info("Shutting down...")
+    # Registered before init_db's handler, which closes the connections they use
+    await booking.workers.stop()
+
+
+# Tortoise's startup handler has to run before the workers', which need the database
+init_db(app)
+
+
+@app.on_event("startup")
+async def startup_event():
+    log.info("Starting up...")
+    await booking.workers.start()
@@ -0,0 +1,253 @@
+"""
+Prometheus metrics of the app, served on GET /metrics
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(gunicorn.conf.py sets it up) and a scrape of any worker adds them all up.
+Without the variable, e.g. under a single uvicorn process, the metrics are the
+ones of the process answering the scrape.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import BaseRoute
+from tortoise import Tortoise
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+http_requests = Counter(
+    "http_requests_total", "Requests answered", ["method", "route", "status"]
+)
+http_latency = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response started",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+db_queries = Counter("db_queries_total", "Queries sent to the database")
+db_query_latency = Histogram(
+    "db_query_duration_seconds", "Time of a single query", buckets=QUERY_BUCKETS
+)
+db_queries_per_request = Histogram(
+    "db_queries_per_request",
+    "Queries a request sent",
+    ["route"],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+db_time_per_request = Histogram(
+    "db_time_per_request_seconds",
+    "Time a request spent waiting on queries",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+db_pool_connections = Gauge(
+    "db_pool_connections",
+    "Connections of the pool by state",
+    ["connection", "state"],
+    multiprocess_mode="livesum",
+)
+db_pool_max_connections = Gauge(
+    "db_pool_max_connections",
+    "Size limit of the pool",
+    ["connection"],
+    multiprocess_mode="livesum",
+)
+google_requests = Counter(
+    "google_api_requests_total", "Calls to Google APIs", ["method", "status"]
+)
+google_latency = Histogram(
+    "google_api_request_duration_seconds",
+    "Time of a call to a Google API",
+    ["method"],
+    buckets=LATENCY_BUCKETS,
+)
+google_in_flight = Gauge(
+    "google_api_requests_in_flight",
+    "Calls to Google APIs running on the calendar thread pool",
+    multiprocess_mode="livesum",
+)
+token_refreshes = Counter(
+    "calendar_token_refreshes_total",
+    "Google access tokens refreshed by get_calendar_service",
+)
+schedule_reads = Counter(
+    "schedule_reads_total",
+    "Schedule reads by how they were answered, all but loaded saved a load",
+    ["outcome"],
+)
+booking_pushes = Counter(
+    "booking_calendar_pushes_total",
+    "Calendar updates of the booking outbox by outcome",
+    ["outcome"],
+)
+
+# [query count, seconds] of the request being handled
+_request_db: ContextVar[Optional[List[float]]] = ContextVar("request_db", default=None)
+# The lists of the capture_queries() blocks being run
+_captures: ContextVar[Tuple[List[str], ...]] = ContextVar("captures", default=())
+
+# The query methods of the tortoise clients, every query goes through one of them
+QUERY_METHODS = (
+    "execute_insert",
+    "execute_many",
+    "execute_query",
+    "execute_query_dict",
+    "execute_script",
+)
+
+# Pool gauges are refreshed at most this often per worker
+POOL_SAMPLE_INTERVAL = 1.0
+_pool_sampled_at = float("-inf")
+
+
+def _timed_query(method: Callable) -> Callable:
+    @wraps(method)
+    async def timed(client, query, *args, **kwargs):
+        for queries in _captures.get():
+            queries.append(query)
+        start = time.perf_counter()
+        try:
+            return await method(client, query, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            db_queries.inc()
+            db_query_latency.observe(elapsed)
+            totals = _request_db.get()
+            if totals is not None:
+                totals[0] += 1
+                totals[1] += elapsed
+
+    timed.timed_query = True
+    return timed
+
+
+def instrument_tortoise() -> None:
+    """Count and time the queries of every tortoise client, once per process"""
+    from tortoise.backends.asyncpg import client as asyncpg_client
+    from tortoise.backends.sqlite import client as sqlite_client
+
+    for client in (
+        asyncpg_client.AsyncpgDBClient,
+        asyncpg_client.TransactionWrapper,
+        sqlite_client.SqliteClient,
+        sqlite_client.TransactionWrapper,
+    ):
+        for name in QUERY_METHODS:
+            # Only the methods the class defines itself, inherited ones are
+            # wrapped on the parent already
+            method = client.__dict__.get(name)
+            if method is not None and not getattr(method, "timed_query", False):
+                setattr(client, name, _timed_query(method))
+
+
+@contextmanager
+def capture_queries() -> Iterator[List[str]]:
+    """
+    Collect the SQL of every query sent by the code run inside the block, also
+    from the tasks it starts
+
+    Needs instrument_tortoise() to have been called, create_application() does
+    """
+    queries: List[str] = []
+    token = _captures.set(_captures.get() + (queries,))
+    try:
+        yield queries
+    finally:
+        _captures.reset(token)
+
+
+def sample_pools() -> None:
+    """Set the pool gauges from the asyncpg pools of this process"""
+    global _pool_sampled_at
+    _pool_sampled_at = time.monotonic()
+    for name, client in Tortoise._connections.items():
+        pool = getattr(client, "_pool", None)
+        if pool is None:
+            continue
+        # asyncpg 0.21 has no public accessors for these
+        holders = pool._holders
+        idle = pool._queue.qsize() if pool._queue is not None else 0
+        opened = sum(1 for holder in holders if holder._con is not None)
+        db_pool_connections.labels(name, "in_use").set(len(holders) - idle)
+        db_pool_connections.labels(name, "open").set(opened)
+        db_pool_max_connections.labels(name).set(pool._maxsize)
+
+
+class RouteNames:
+    """The path template of the route that handled a request, as the route label"""
+
+    def __init__(self, routes: List[BaseRoute]):
+        self.routes = routes
+        self._names: Dict[Callable, str] = {}
+
+    def __call__(self, request: Request) -> str:
+        endpoint = request.scope.get("endpoint")
+        if endpoint is None:
+            # Nothing matched, keep unknown paths from making new series
+            return "unmatched"
+        if not self._names:
+            self._names = {
+                route.endpoint: route.path
+                for route in self.routes
+                if hasattr(route, "endpoint")
+            }
+        return self._names.get(endpoint, "unmatched")
+
+
+def middleware(route_names: RouteNames) -> Callable:
+    """The http middleware recording the request metrics"""
+
+    async def record_metrics(request: Request, call_next):
+        totals = [0, 0.0]
+        token = _request_db.set(totals)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_db.reset(token)
+            route = route_names(request)
+            http_requests.labels(request.method, route, status).inc()
+            http_latency.labels(request.method, route).observe(elapsed)
+            db_queries_per_request.labels(route).observe(totals[0])
+            db_time_per_request.labels(route).observe(totals[1])
+            if time.monotonic() - _pool_sampled_at > POOL_SAMPLE_INTERVAL:
+                sample_pools()
+
+    return record_metrics
+
+
+def observe_google_call(method: str, status: str, seconds: float) -> None:
+    google_requests.labels(method, status).inc()
+    google_latency.labels(method).observe(seconds)
+
+
+def render() -> Response:
+    """The metrics of every worker in the Prometheus text format"""
+    sample_pools()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,21 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "calendar_event" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "event_id" VARCHAR(255) NOT NULL,
+    "summary" TEXT,
+    "start_time" TIMESTAMPTZ NOT NULL,
+    "end_time" TIMESTAMPTZ NOT NULL,
+    "tutor_id" BIGINT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_calendar_ev_tutor_i_e8a7f1" UNIQUE ("tutor_id", "event_id")
+);
+CREATE INDEX IF NOT EXISTS "idx_calendar_ev_tutor_i_336d34" ON "calendar_event" ("tutor_id", "start_time");;
+CREATE TABLE IF NOT EXISTS "calendar_sync" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "sync_token" TEXT,
+    "synced_from" TIMESTAMPTZ,
+    "synced_at" TIMESTAMPTZ,
+    "user_id" BIGINT NOT NULL UNIQUE REFERENCES "user" ("id") ON DELETE CASCADE
+);;
+-- downgrade --
+DROP TABLE IF EXISTS "calendar_event";
+DROP TABLE IF EXISTS "calendar_sync";
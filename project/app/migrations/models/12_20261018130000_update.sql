@@ -0,0 +1,13 @@
+-- upgrade --
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS "idx_user_search_tsv" ON "user" USING GIN (to_tsvector('simple', COALESCE("first_name", '') || ' ' || COALESCE("last_name", '') || ' ' || COALESCE("email", '')));
+CREATE INDEX IF NOT EXISTS "idx_user_search_trgm" ON "user" USING GIN ((COALESCE("first_name", '') || ' ' || COALESCE("last_name", '') || ' ' || COALESCE("email", '')) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS "idx_category_search_tsv" ON "category" USING GIN (to_tsvector('simple', "name"));
+CREATE INDEX IF NOT EXISTS "idx_category_name_trgm" ON "category" USING GIN ("name" gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS "idx_user_catego_categor_2b1d4e" ON "user_categories" ("category_id");
+-- downgrade --
+DROP INDEX IF EXISTS "idx_user_catego_categor_2b1d4e";
+DROP INDEX IF EXISTS "idx_category_name_trgm";
+DROP INDEX IF EXISTS "idx_category_search_tsv";
+DROP INDEX IF EXISTS "idx_user_search_trgm";
+DROP INDEX IF EXISTS "idx_user_search_tsv";
@@ -0,0 +1,17 @@
+-- upgrade --
+ALTER TABLE "user" ADD "rating_count" INT NOT NULL  DEFAULT 0;
+ALTER TABLE "user" ADD "rating_sum" INT NOT NULL  DEFAULT 0;
+ALTER TABLE "user" ADD "rating_avg" DOUBLE PRECISION NOT NULL  DEFAULT 0;
+ALTER TABLE "user" ADD "rating_histogram" JSONB NOT NULL  DEFAULT '{}';
+CREATE INDEX "idx_user_rating__3f6d1c" ON "user" ("rating_avg");
+UPDATE "user" SET "rating_count" = "agg"."count", "rating_sum" = "agg"."sum", "rating_avg" = "agg"."sum"::DOUBLE PRECISION / "agg"."count", "rating_histogram" = "agg"."histogram" FROM (
+    SELECT "reviewee_id", SUM("count") AS "count", SUM("rating" * "count") AS "sum", jsonb_object_agg("rating"::TEXT, "count") AS "histogram"
+    FROM (SELECT "reviewee_id", "rating", COUNT(*) AS "count" FROM "review" GROUP BY "reviewee_id", "rating") AS "ratings"
+    GROUP BY "reviewee_id"
+) AS "agg" WHERE "agg"."reviewee_id" = "user"."id";
+-- downgrade --
+DROP INDEX "idx_user_rating__3f6d1c";
+ALTER TABLE "user" DROP COLUMN "rating_count";
+ALTER TABLE "user" DROP COLUMN "rating_sum";
+ALTER TABLE "user" DROP COLUMN "rating_avg";
+ALTER TABLE "user" DROP COLUMN "rating_histogram";
@@ -0,0 +1,16 @@
+-- upgrade --
+ALTER TABLE "student_session" ADD "status" VARCHAR(9) NOT NULL  DEFAULT 'confirmed';
+CREATE TABLE IF NOT EXISTS "calendar_outbox" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "attempts" INT NOT NULL  DEFAULT 0,
+    "next_attempt_at" TIMESTAMPTZ,
+    "locked_until" TIMESTAMPTZ,
+    "last_error" TEXT,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "session_id" BIGINT NOT NULL UNIQUE REFERENCES "session" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_calendar_ou_next_at_8c9c8d" ON "calendar_outbox" ("next_attempt_at");;
+-- downgrade --
+DROP TABLE IF EXISTS "calendar_outbox";
+ALTER TABLE "student_session" DROP COLUMN "status";
@@ -0,0 +1,8 @@
+-- upgrade --
+ALTER TABLE "student_session" RENAME CONSTRAINT "uid_student_ses_session_21f8c4" TO "uid_student_ses_session_7425b7";
+CREATE INDEX IF NOT EXISTS "idx_session_tutor_i_6c5a23" ON "session" ("tutor_id", "start_time");
+CREATE INDEX IF NOT EXISTS "idx_student_ses_user_id_66d9c0" ON "student_session" ("user_id", "session_id");
+-- downgrade --
+DROP INDEX IF EXISTS "idx_student_ses_user_id_66d9c0";
+DROP INDEX IF EXISTS "idx_session_tutor_i_6c5a23";
+ALTER TABLE "student_session" RENAME CONSTRAINT "uid_student_ses_session_7425b7" TO "uid_student_ses_session_21f8c4";
@@ -0,0 +1,4 @@
+-- upgrade --
+CREATE INDEX IF NOT EXISTS "idx_report_type_ce22cd" ON "report" ("type", "reference_id", "created_at", "id");
+-- downgrade --
+DROP INDEX IF EXISTS "idx_report_type_ce22cd";
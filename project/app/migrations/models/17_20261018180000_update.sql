@@ -0,0 +1,4 @@
+-- upgrade --
+ALTER TABLE "calendar_sync" ADD "synced_until" TIMESTAMPTZ;
+-- downgrade --
+ALTER TABLE "calendar_sync" DROP COLUMN "synced_until";
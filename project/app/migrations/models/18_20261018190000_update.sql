@@ -0,0 +1,6 @@
+-- upgrade --
+CREATE INDEX IF NOT EXISTS "idx_report_user_id_6b8db0" ON "report" ("user_id");
+CREATE INDEX IF NOT EXISTS "idx_review_reviewe_72c1c1" ON "review" ("reviewee_id");
+-- downgrade --
+DROP INDEX IF EXISTS "idx_review_reviewe_72c1c1";
+DROP INDEX IF EXISTS "idx_report_user_id_6b8db0";
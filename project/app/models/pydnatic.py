@@ -1,4 +1,5 @@
-from typing import Optional
+import datetime
+from typing import List, Optional
 
 from pydantic import AnyHttpUrl, BaseModel
 
@@ -13,6 +14,15 @@ class NormalUserUpdate(BaseModel):
     is_tutor: Optional[bool]
 
 
+class UserBulkUpdate(BaseModel):
+    id: int
+    is_active: Optional[bool]
+    is_superuser: Optional[bool]
+    is_tutor: Optional[bool]
+    description: Optional[str]
+    categories_ids: Optional[List[int]]
+
+
 class UserFilters(BaseModel):
     is_tutor: Optional[bool]
     is_superuser: Optional[bool]
@@ -34,4 +44,27 @@ class ReportFilters(BaseModel):
 
 
 class SessionFilters(BaseModel):
-    pass
+    start_time__gte: Optional[datetime.datetime]
+    start_time__lt: Optional[datetime.datetime]
+    tutor_id: Optional[int]
+    # The student, through student_session alone
+    studentsessions__user_id: Optional[int]
+
+
+class FreeTime(BaseModel):
+    start: datetime.datetime
+    end: datetime.datetime
+
+
+class AvailableTutor(BaseModel):
+    id: int
+    free: List[FreeTime]
+
+
+class Availability(BaseModel):
+    category_id: int
+    time_min: datetime.datetime
+    time_max: datetime.datetime
+    tutors: List[AvailableTutor]
+    # Tutors whose calendar Google didn't answer for
+    unknown: List[int]
@@ -0,0 +1,119 @@
+import datetime
+from functools import lru_cache
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+from tortoise import models
+from tortoise.contrib.pydantic import PydanticModel
+
+# Values of these types come out of validation and jsonable_encoder the way
+# orjson writes them (datetimes included, both give isoformat()), so they can be
+# handed to orjson untouched, as can JSON field values (typed Any)
+_NATIVE = (str, int, bool, datetime.datetime, datetime.date)
+
+
+def _leaf(value: Any) -> Any:
+    if value is None or type(value) in (str, int, bool, dict, list):
+        return value
+    # Enums, decimals... go through the same encoder FastAPI uses
+    return jsonable_encoder(value)
+
+
+def _float(value: Any) -> Any:
+    return value if value is None else float(value)
+
+
+def _is_model(type_: Any) -> bool:
+    return isinstance(type_, type) and issubclass(type_, PydanticModel)
+
+
+def _is_native(type_: Any) -> bool:
+    return type_ is Any or (isinstance(type_, type) and issubclass(type_, _NATIVE))
+
+
+def _converter(field, computed: bool) -> Callable[[Any], Any]:
+    if _is_model(field.type_):
+        nested = serializer(field.type_)
+        if field.shape == SHAPE_LIST:
+            return lambda value: [nested(item) for item in value]
+        return lambda value: None if value is None else nested(value)
+
+    if field.type_ is float:
+        convert = _float
+    elif field.shape == SHAPE_LIST:
+        convert = lambda value: [_leaf(item) for item in value]  # noqa: E731
+    else:
+        convert = _leaf
+    if computed:
+        return lambda method: convert(method())
+    return convert
+
+
+@lru_cache(maxsize=None)
+def serializer(
+    py_model: Type[PydanticModel],
+    fields: Optional[Tuple[str, ...]] = None,
+    dicts: bool = False,
+) -> Callable[[Any], Dict]:
+    """
+    A function turning a fetched tortoise object straight into the dict FastAPI
+    would send for py_model, without building and validating pydantic models
+
+    Fields come out in the same order and with the same values as
+    jsonable_encoder(py_model.from_orm(obj)) gives them
+
+    fields : Only serialize these fields (a sparse fieldset), all of them when None
+    dicts : Serialize rows of .values() instead of objects, only stored fields then
+    """
+    model = py_model.__config__.orig_model
+    names = [name for name in py_model.__fields__ if fields is None or name in fields]
+    converters = []
+    for name in names:
+        field = py_model.__fields__[name]
+        # Computed fields are methods of the model, everything else is stored
+        computed = name not in model._meta.fields_map
+        if computed or field.shape != SHAPE_SINGLETON or not _is_native(field.type_):
+            converters.append((name, _converter(field, computed)))
+
+    get = (itemgetter if dicts else attrgetter)(*names)
+    if len(names) == 1:
+        # Getters of a single name return the value instead of a tuple
+        get_one = get
+        get = lambda obj: (get_one(obj),)  # noqa: E731
+
+    def serialize(obj: models.Model) -> Dict:
+        row = dict(zip(names, get(obj)))
+        for name, convert in converters:
+            row[name] = convert(row[name])
+        return row
+
+    return serialize
+
+
+def dump_list(
+    py_model: Type[PydanticModel],
+    objects: Sequence[Any],
+    fields: Optional[Tuple[str, ...]] = None,
+    dicts: bool = False,
+) -> bytes:
+    """
+    The JSON body of a List[py_model] response
+
+    Byte for byte what JSONResponse renders: compact separators, non-ASCII left as is
+    """
+    serialize = serializer(py_model, fields, dicts)
+    rows: List[Dict] = [serialize(obj) for obj in objects]
+    return orjson.dumps(rows)
+
+
+def dump(
+    py_model: Type[PydanticModel],
+    obj: Any,
+    fields: Optional[Tuple[str, ...]] = None,
+    dicts: bool = False,
+) -> bytes:
+    """The JSON body of a py_model response"""
+    return orjson.dumps(serializer(py_model, fields, dicts)(obj))
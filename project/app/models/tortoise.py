@@ -1,20 +1,59 @@
 import datetime
 import logging
-from enum import IntEnum
-from typing import List, Optional
+from collections import defaultdict
+from enum import Enum, IntEnum
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set
 
 from fastapi import HTTPException
-from fastapi_admin.models import AbstractUser
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials as Creds
-from googleapiclient.discovery import build
 from pydantic import BaseConfig, BaseModel
+from pypika import Table
+from pypika.terms import Criterion
 from tortoise import Tortoise, fields, models
+from tortoise.backends.base.client import BaseDBAsyncClient
 from tortoise.contrib.pydantic import pydantic_model_creator
 from tortoise.exceptions import NoValuesFetched
+from tortoise.timezone import now
+from tortoise.transactions import in_transaction
+
+from app import google_calendar, metrics
+from app.cache import SingleFlight
+from app.config import get_settings
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials as Creds
 
 log = logging.getLogger("uvicorn")
 
+# One calendar sync at a time per tutor and process, callers arriving during a sync
+# share its result. Other processes are kept out by the CalendarSync row lock
+calendar_syncs = SingleFlight()
+
+
+def _is_bookable(event: Dict) -> bool:
+    # Cancelled events only need deleting, all-day events have no slot to book
+    return event.get("status") != "cancelled" and "dateTime" in event.get("start", {})
+
+
+def _parse_event_time(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class AbstractUser(models.Model):
+    """
+    The fields of fastapi_admin.models.AbstractUser, whose import pulls in all of
+    fastapi_admin (routes, templates...) at startup
+    """
+
+    username = fields.CharField(max_length=20, unique=True)
+    password = fields.CharField(
+        max_length=200, description="Will auto hash with raw password when change"
+    )
+    is_active = fields.BooleanField(default=True)
+    is_superuser = fields.BooleanField(default=False)
+
+    class Meta:
+        abstract = True
+
 
 class User(AbstractUser):
     id = fields.BigIntField(pk=True)
@@ -32,6 +71,12 @@ class User(AbstractUser):
         null=True,
     )
     google_calendar_id = fields.CharField(max_length=255, null=True)
+    # Aggregates of the reviews of this user, kept up to date by app.ratings
+    rating_count = fields.IntField(default=0)
+    rating_sum = fields.IntField(default=0)
+    rating_avg = fields.FloatField(default=0, index=True)
+    # rating -> how many reviews gave it
+    rating_histogram = fields.JSONField(default={})
 
     creds: fields.OneToOneRelation["Credentials"]
 
@@ -46,6 +91,14 @@ class User(AbstractUser):
 
     written_reviews: fields.ReverseRelation["Review"]
 
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        # Every new user gets its own histogram, not the field's default dict.
+        # default=dict would do, but the pydantic models of tortoise 0.16 then pass
+        # both a default and a default_factory, which pydantic 1.10 refuses
+        if "rating_histogram" not in kwargs:
+            self.rating_histogram = {}
+
     def categories_ids(self) -> List[int]:
         try:
             return [category.id for category in self.categories]
@@ -55,10 +108,88 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
-    async def get_creds(self) -> Creds:
+    @classmethod
+    async def set_categories(
+        cls, wanted: Dict[int, Iterable[int]], using_db: BaseDBAsyncClient
+    ) -> Dict[int, Set[int]]:
+        """
+        Give users exactly the wanted categories, writing only the links that change
+
+        Unlike categories.clear() + add() this is one SELECT, one DELETE and one
+        INSERT however many users are updated
+
+        wanted : user id -> ids of their categories, ids of missing categories are skipped
+        using_db : The transaction of the update
+        """
+        field = cls._meta.fields_map["categories"]
+        through = Table(field.through)
+        user_key, category_key = field.backward_key, field.forward_key
+        requested = set().union(*wanted.values())
+        known = set(
+            await Category.filter(id__in=list(requested))
+            .using_db(using_db)
+            .values_list("id", flat=True)
+        )
+        target = {user_id: set(ids) & known for user_id, ids in wanted.items()}
+
+        _, rows = await using_db.execute_query(
+            str(
+                using_db.query_class.from_(through)
+                .where(through[user_key].isin(list(target)))
+                .select(through[user_key], through[category_key])
+            )
+        )
+        current: Dict[int, Set[int]] = defaultdict(set)
+        for row in rows:
+            current[row[user_key]].add(row[category_key])
+
+        removed = []
+        for user_id, category_ids in target.items():
+            stale = current[user_id] - category_ids
+            if stale:
+                user_links = through[user_key] == user_id
+                removed.append(user_links & through[category_key].isin(list(stale)))
+        if removed:
+            await using_db.execute_query(
+                str(
+                    using_db.query_class.from_(through)
+                    .where(Criterion.any(removed))
+                    .delete()
+                )
+            )
+        added = [
+            (user_id, category_id)
+            for user_id, category_ids in target.items()
+            for category_id in sorted(category_ids - current[user_id])
+        ]
+        if added:
+            insert = using_db.query_class.into(through).columns(
+                through[user_key], through[category_key]
+            )
+            await using_db.execute_query(str(insert.insert(*added)))
+        # The categories are part of the user's representation, so its ETag
+        changed = {user_id for user_id, _ in added}
+        changed.update(
+            user_id
+            for user_id, category_ids in target.items()
+            if current[user_id] - category_ids
+        )
+        if changed:
+            await cls.filter(id__in=list(changed)).using_db(using_db).update(
+                updated_at=now()
+            )
+        return target
+
+    async def get_creds(self) -> "Creds":
+        # Imported here so only the calendar paths pay for the Google libraries
+        from google.oauth2.credentials import Credentials as Creds
+
         await self.fetch_related("creds")
-        creds = self.creds.json_field
-        return Creds.from_authorized_user_info(creds)
+        if self.creds is None:
+            raise HTTPException(403, "No Google credentials, sign in with Google")
+        creds = Creds.from_authorized_user_info(self.creds.json_field)
+        token_uri = get_settings().google_token_uri
+        return creds.with_token_uri(token_uri) if token_uri else creds
 
     async def update_calendar(self):
         if self.is_tutor and self.google_calendar_id is None:
@@ -66,25 +197,206 @@ class User(AbstractUser):
 
             calendar = {"summary": "TutorApp Schedule", "timeZone": "America/Chicago"}
 
-            created_calendar = service.calendars().insert(body=calendar).execute()
+            created_calendar = await google_calendar.execute(
+                service.calendars().insert(body=calendar)
+            )
 
             self.google_calendar_id = created_calendar["id"]
             await self.save()
 
     async def get_calendar_service(self):
-        creds = await self.get_creds()
-        if creds.expired:
-            creds.refresh(Request())
-        self.creds.json_field = creds.to_json()
-        await self.creds.save()
+        cached = google_calendar.service_cache.get(self.id)
+        if cached is not None and google_calendar.token_is_fresh(cached[0]):
+            return cached[1]
 
-        return build("calendar", "v3", credentials=creds)
+        return await google_calendar.service_loads.do(
+            self.id, self._load_calendar_service
+        )
+
+    async def _load_calendar_service(self):
+        creds = await self.get_creds()
+        if google_calendar.token_is_fresh(creds):
+            google_calendar.token_stats["writes_skipped"] += 1
+        else:
+            from google.auth.transport.requests import Request
+
+            token = creds.token
+            await google_calendar.timed_call(
+                "oauth2.token.refresh", creds.refresh, Request()
+            )
+            google_calendar.token_stats["refreshes_performed"] += 1
+            metrics.token_refreshes.inc()
+            # Only write the row back when the refresh handed out a new token
+            if creds.token != token:
+                self.creds.json_field = creds.to_json()
+                await self.creds.save()
+            else:
+                google_calendar.token_stats["writes_skipped"] += 1
+
+        service = await google_calendar.run_blocking(
+            google_calendar.build_service, creds
+        )
+        google_calendar.service_cache.set(self.id, (creds, service))
+        return service
 
     async def get_events(
         self, time_min: datetime.datetime, time_max: datetime.datetime
     ):
         """
-        Get the events between time_min and time_max of a tutor in a simplified dictionary format
+        Get the events between time_min and time_max of a tutor in a simplified dictionary format,
+        answered from the local copy of the tutor's calendar
+
+        time_min : The start date of the events to look for
+        time_max : The end date of the events to look for (inclusive)
+        """
+
+        # Don't move on if there is no calendar_id
+        if self.google_calendar_id is None:
+            raise HTTPException(404, "No Calendar found")
+
+        time_min = time_min.astimezone()
+        time_max = time_max.astimezone()
+
+        sync = await self.sync_calendar()
+
+        # The store only holds events from the last full sync's window
+        if time_min < sync.synced_from or time_max > sync.synced_until:
+            return await self.fetch_events(time_min, time_max)
+
+        events = await CalendarEvent.filter(
+            tutor_id=self.id, start_time__lt=time_max, end_time__gt=time_min
+        ).order_by("start_time")
+
+        return [
+            {
+                "id": event.event_id,
+                "start_time": event.start_time.isoformat(),
+                "end_time": event.end_time.isoformat(),
+                "summary": event.summary,
+            }
+            for event in events
+        ]
+
+    async def sync_calendar(self) -> "CalendarSync":
+        """
+        Pull the changes to the tutor's calendar since the last sync into CalendarEvent
+
+        Uses Google's incremental sync tokens, so only the deltas are downloaded. Syncs
+        closer together than the calendar_sync_interval setting are skipped.
+        """
+        return await calendar_syncs.do(self.id, self._sync_calendar)
+
+    async def _sync_calendar(self) -> "CalendarSync":
+        from googleapiclient.errors import HttpError
+
+        sync, _ = await CalendarSync.get_or_create(user_id=self.id)
+
+        settings = get_settings()
+        interval = datetime.timedelta(seconds=settings.calendar_sync_interval)
+        if sync.synced_at is not None and sync.synced_at + interval > now():
+            return sync
+
+        # Half the window is left, a full sync moves it forward
+        horizon = datetime.timedelta(days=settings.calendar_sync_horizon_days)
+        if sync.synced_until is None or sync.synced_until < now() + horizon / 2:
+            sync.sync_token = None
+
+        service = await self.get_calendar_service()
+        try:
+            await self._pull_calendar(service, sync)
+        except HttpError as e:
+            if e.resp.status == 404:
+                raise HTTPException(404, "No Calendar found")
+            if e.resp.status != 410 or sync.sync_token is None:
+                raise
+            # Google expired the sync token, start over with a full sync
+            log.info(f"Sync token of user {self.id} expired, doing a full sync")
+            sync.sync_token = None
+            await self._pull_calendar(service, sync)
+
+        return sync
+
+    async def _pull_calendar(self, service, sync: "CalendarSync"):
+        full_sync = sync.sync_token is None
+        # As read, a sync of another process since then changed it
+        seen = sync.synced_at
+        if full_sync:
+            settings = get_settings()
+            lookback = datetime.timedelta(days=settings.calendar_sync_lookback_days)
+            horizon = datetime.timedelta(days=settings.calendar_sync_horizon_days)
+            sync.synced_from = now() - lookback
+            sync.synced_until = now() + horizon
+
+        changes = []
+        page_token = None
+        while True:
+            params = {
+                "calendarId": self.google_calendar_id,
+                "pageToken": page_token,
+                "singleEvents": True,
+            }
+            # Google rejects timeMin and timeMax together with a sync token. Without
+            # timeMax recurring events with no end expand to endless instances
+            if full_sync:
+                params["timeMin"] = sync.synced_from.isoformat()
+                params["timeMax"] = sync.synced_until.isoformat()
+            else:
+                params["syncToken"] = sync.sync_token
+            events = await google_calendar.execute(service.events().list(**params))
+            changes.extend(events["items"])
+            page_token = events.get("nextPageToken")
+            if not page_token:
+                break
+
+        async with in_transaction(CalendarEvent._meta.default_connection) as connection:
+            # Syncs of the same tutor in other processes wait here for this one
+            stored = (
+                await CalendarSync.filter(id=sync.id)
+                .using_db(connection)
+                .select_for_update()
+                .get()
+            )
+            if stored.synced_at != seen:
+                # Another process synced meanwhile, what it stored stands
+                sync.sync_token = stored.sync_token
+                sync.synced_from = stored.synced_from
+                sync.synced_until = stored.synced_until
+                sync.synced_at = stored.synced_at
+                return
+
+            if full_sync:
+                await CalendarEvent.filter(tutor_id=self.id).using_db(
+                    connection
+                ).delete()
+            elif changes:
+                await CalendarEvent.filter(
+                    tutor_id=self.id, event_id__in=[event["id"] for event in changes]
+                ).using_db(connection).delete()
+            bookable = [
+                CalendarEvent(
+                    tutor_id=self.id,
+                    event_id=event["id"],
+                    summary=event.get("summary"),
+                    start_time=_parse_event_time(event["start"]["dateTime"]),
+                    end_time=_parse_event_time(event["end"]["dateTime"]),
+                )
+                for event in changes
+                if _is_bookable(event)
+            ]
+            # Changes past the window come with incremental syncs too
+            await CalendarEvent.bulk_create(
+                [event for event in bookable if event.start_time < sync.synced_until],
+                using_db=connection,
+            )
+            sync.sync_token = events["nextSyncToken"]
+            sync.synced_at = now()
+            await sync.save(using_db=connection)
+
+    async def fetch_events(
+        self, time_min: datetime.datetime, time_max: datetime.datetime
+    ):
+        """
+        Get the events between time_min and time_max of a tutor straight from the Calendar API
 
         time_min : The start date of the events to look for
         time_max : The end date of the events to look for (inclusive)
@@ -98,7 +410,9 @@ class User(AbstractUser):
         service = await self.get_calendar_service()
 
         # See if the calendar exists
-        calendar = service.calendars().get(calendarId=self.google_calendar_id).execute()
+        calendar = await google_calendar.execute(
+            service.calendars().get(calendarId=self.google_calendar_id)
+        )
 
         # If the calendar does not exist for some reason, don't move on
         if "summary" not in calendar:
@@ -115,16 +429,14 @@ class User(AbstractUser):
 
         while True:
             # Get the events of the tutor as a list
-            events = (
-                service.events()
-                .list(
+            events = await google_calendar.execute(
+                service.events().list(
                     calendarId=self.google_calendar_id,
                     pageToken=page_token,
                     timeMin=time_min,
                     timeMax=time_max,
                     singleEvents=True,
                 )
-                .execute()
             )
             # Loop through each event and get the info we need
             for event in events["items"]:
@@ -153,9 +465,13 @@ class User(AbstractUser):
             "studentsessions",
             "student_sessions",
             "tutor_sessions",
+            "calendar_events",
+            "calendar_sync",
         ]
         extra = "ignore"
         computed = ("categories_ids",)
+        # What the computed fields read, see app.models.utils.fetch_fields
+        computed_relations = {"categories_ids": ("categories",)}
 
 
 class Credentials(models.Model):
@@ -164,6 +480,33 @@ class Credentials(models.Model):
     user = fields.OneToOneField("models.User", related_name="creds")
 
 
+class CalendarEvent(models.Model):
+    id = fields.BigIntField(pk=True)
+    tutor = fields.ForeignKeyField("models.User", related_name="calendar_events")
+    event_id = fields.CharField(max_length=255)
+    summary = fields.TextField(null=True)
+    start_time = fields.DatetimeField()
+    end_time = fields.DatetimeField()
+
+    class Meta:
+        table = "calendar_event"
+        unique_together = (("tutor_id", "event_id"),)
+        indexes = (("tutor_id", "start_time"),)
+
+
+class CalendarSync(models.Model):
+    id = fields.BigIntField(pk=True)
+    user = fields.OneToOneField("models.User", related_name="calendar_sync")
+    sync_token = fields.TextField(null=True)
+    synced_from = fields.DatetimeField(null=True)
+    # The end of the window the last full sync asked Google for
+    synced_until = fields.DatetimeField(null=True)
+    synced_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "calendar_sync"
+
+
 class Category(models.Model):
     id = fields.BigIntField(pk=True)
     name = fields.CharField(max_length=30, unique=True)
@@ -203,6 +546,9 @@ class Review(models.Model):
 
     class Meta:
         unique_together = (("reviewer_id", "reviewee_id"),)
+        # The reviews a user's responses embed, the unique index only covers
+        # the written ones
+        indexes = (("reviewee_id",),)
 
 
 class ReportType(IntEnum):
@@ -223,18 +569,34 @@ class Report(models.Model):
     def user_id(self) -> int:
         return self.user.id
 
+    class Meta:
+        # The moderation queue's groups, read from the index alone, and the
+        # reports a user's responses embed
+        indexes = (("type", "reference_id", "created_at", "id"), ("user_id",))
+
     class PydanticMeta:
         computed = ("user_id",)
 
 
+class BookingStatus(str, Enum):
+    # Reserved locally, the student isn't on the calendar event yet
+    pending = "pending"
+    confirmed = "confirmed"
+    # The calendar update was given up on, see CalendarOutbox.last_error
+    failed = "failed"
+
+
 class StudentSessions(models.Model):
     session = fields.ForeignKeyField("models.Session", related_name="studentsessions")
     user = fields.ForeignKeyField("models.User", related_name="studentsessions")
     category = fields.ForeignKeyField("models.Category", related_name="studentsessions")
+    status = fields.CharEnumField(BookingStatus, default=BookingStatus.confirmed)
 
     class Meta:
         table = "student_session"
-        unique_together = (("session_id", "student_id"),)
+        unique_together = (("session_id", "user_id"),)
+        # The sessions of a student, without reading the rows
+        indexes = (("user_id", "session_id"),)
 
 
 class Session(models.Model):
@@ -258,15 +620,44 @@ class Session(models.Model):
         except NoValuesFetched:
             return []
 
+    class Meta:
+        # The sessions of a tutor in a time range
+        indexes = (("tutor_id", "start_time"),)
+
     class PydanticMeta:
-        exclude = ["tutor", "students"]
+        exclude = ["tutor", "students", "calendar_outbox"]
         computed = ("tutor_id", "student_ids")
+        computed_relations = {"student_ids": ("students",)}
+
+
+# The pending bookings of a session still to be pushed to the tutor's calendar,
+# drained by the workers of app.booking
+class CalendarOutbox(models.Model):
+    id = fields.BigIntField(pk=True)
+    # One row per session, so a single worker at a time updates its event
+    session = fields.OneToOneField("models.Session", related_name="calendar_outbox")
+    attempts = fields.IntField(default=0)
+    # When the next push is due, null while there is nothing left to push
+    next_attempt_at = fields.DatetimeField(null=True, index=True)
+    # The worker that claimed the row owns it until then
+    locked_until = fields.DatetimeField(null=True)
+    last_error = fields.TextField(null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "calendar_outbox"
 
 
 Tortoise.init_models(["app.models.tortoise"], "models")
 
 User_Pydnatic = pydantic_model_creator(User, name="User")
-_UserIn_Pydnatic = pydantic_model_creator(User, name="UserIn", exclude_readonly=True)
+_UserIn_Pydnatic = pydantic_model_creator(
+    User,
+    name="UserIn",
+    exclude_readonly=True,
+    exclude=("rating_count", "rating_sum", "rating_avg", "rating_histogram"),
+)
 
 Category_Pydnatic = pydantic_model_creator(Category, name="Category")
 _CategoryIn_Pydnatic = pydantic_model_creator(
@@ -305,6 +696,24 @@ class SessionIn_Pydnatic(BaseModel):
     category_id: int
 
 
+class Booking_Pydnatic(BaseModel):
+    session_id: int
+    status: BookingStatus
+    # Failed calendar updates since the last success and the error of the last one
+    attempts: int
+    error: Optional[str]
+
+
+class ReportGroup_Pydnatic(BaseModel):
+    type: ReportType
+    reference_id: int
+    reports: int
+    latest_report_id: int
+    latest_reason: str
+    first_reported_at: datetime.datetime
+    last_reported_at: datetime.datetime
+
+
 class UserCreate(BaseModel):
     user: User_Pydnatic
     access_token: str
@@ -1,14 +1,674 @@
-from typing import List, Optional, Type
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Type, Union
 
-from fastapi import Query, Request
+from fastapi import Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from tortoise import models, queryset
+from tortoise.contrib.pydantic import PydanticModel
+from tortoise.contrib.pydantic.base import _get_fetch_fields
+from tortoise.exceptions import DoesNotExist
+from tortoise.fields.relational import BackwardFKRelation, ManyToManyFieldInstance
+from tortoise.query_utils import Q
+
+from app.cache import TTLCache
+from app.config import get_settings
+from app.db import reading_from_replica
+from app.models.serialize import dump, dump_list
+
+
+def encode_cursor(sort_value: Any, id: int) -> str:
+    def default(value):
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()
+        return str(value)
+
+    raw = json.dumps([sort_value, id], default=default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        sort_value, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+    return [sort_value, id]
+
+
+# (table, filters) -> total rows, for routes paginated with count="cached"
+count_cache = TTLCache(
+    maxsize=get_settings().count_cache_size, ttl=get_settings().count_cache_ttl
+)
+
+
+def invalidate_counts(*models: Type[models.Model]) -> None:
+    """Forget the cached totals of models after a write to them"""
+    tables = {model._meta.db_table for model in models}
+    count_cache.invalidate_where(lambda key, _: key[0] in tables)
+
+
+def weak_etag(*parts: Any) -> str:
+    """A weak ETag derived from what the response was built from"""
+    raw = json.dumps(parts, default=str, separators=(",", ":"))
+    return 'W/"{}"'.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, W/ prefixes don't matter
+    tags = [tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")]
+    return etag.replace("W/", "", 1) in tags
+
+
+def validator_headers(
+    etag: str, last_modified: Optional[datetime.datetime]
+) -> Dict[str, str]:
+    # no-cache: clients may keep the response but have to revalidate it
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(
+            last_modified.astimezone(datetime.timezone.utc), usegmt=True
+        )
+    return headers
+
+
+def not_modified(
+    request: Request, etag: str, last_modified: Optional[datetime.datetime]
+) -> bool:
+    """Whether the client's copy is current, so a 304 can replace the response"""
+    if_none_match = request.headers.get("if-none-match")
+    # If-Modified-Since is ignored when If-None-Match is sent
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    # HTTP dates have no fractions of a second
+    return last_modified.replace(microsecond=0) <= since
+
+
+def is_conditional(model: Type[models.Model]) -> bool:
+    """Models with an updated_at column answer conditional GETs"""
+    return "updated_at" in model._meta.fields_map
+
+
+def nested_models(
+    py_model: "Type[BaseModel]", fields: Optional[Tuple[str, ...]] = None
+) -> Set[Type[models.Model]]:
+    """
+    The models embedded in py_model's responses, at any depth
+
+    fields : Only the ones embedded in these fields, every field when None
+    """
+    found: Set[Type[models.Model]] = set()
+    for name, field in py_model.__fields__.items():
+        nested = field.type_
+        if fields is not None and name not in fields:
+            continue
+        if isinstance(nested, type) and issubclass(nested, PydanticModel):
+            found.add(nested.__config__.orig_model)
+            found |= nested_models(nested)
+    return found
+
+
+def nested_paths(
+    py_model: "Type[BaseModel]", fields: Optional[Tuple[str, ...]] = None
+) -> List[Tuple[str, ...]]:
+    """
+    The relations py_model's responses embed, as paths of field names
+
+    fields : Only the ones embedded in these fields, every field when None
+    """
+    paths = []
+    for name, field in py_model.__fields__.items():
+        nested = field.type_
+        if fields is not None and name not in fields:
+            continue
+        if isinstance(nested, type) and issubclass(nested, PydanticModel):
+            paths.append((name,))
+            paths.extend((name, *path) for path in nested_paths(nested))
+    return paths
+
+
+def _join_path(
+    model: Type[models.Model], path: Tuple[str, ...], alias: str
+) -> Tuple[Type[models.Model], str, str]:
+    """The model at the end of path, the JOINs reaching it from alias and its alias"""
+    joins = []
+    for i, name in enumerate(path):
+        field = model._meta.fields_map[name]
+        related = field.related_model
+        pk = model._meta.db_pk_column
+        related_pk = related._meta.db_pk_column
+        table = related._meta.db_table
+        joined = f"{alias}_{i}"
+        if isinstance(field, ManyToManyFieldInstance):
+            joins.append(
+                f'JOIN "{field.through}" AS "{joined}_link" '
+                f'ON "{joined}_link"."{field.backward_key}" = "{alias}"."{pk}" '
+                f'JOIN "{table}" AS "{joined}" '
+                f'ON "{joined}"."{related_pk}" = "{joined}_link"."{field.forward_key}"'
+            )
+        elif isinstance(field, BackwardFKRelation):
+            column = related._meta.fields_db_projection[field.relation_field]
+            joins.append(
+                f'JOIN "{table}" AS "{joined}" '
+                f'ON "{joined}"."{column}" = "{alias}"."{pk}"'
+            )
+        else:
+            column = model._meta.fields_db_projection[field.source_field]
+            joins.append(
+                f'JOIN "{table}" AS "{joined}" '
+                f'ON "{joined}"."{related_pk}" = "{alias}"."{column}"'
+            )
+        model, alias = related, joined
+    return model, " ".join(joins), alias
+
+
+def _nested_validators(
+    model: Type[models.Model],
+    py_model: "Type[BaseModel]",
+    fields: Optional[Tuple[str, ...]],
+    ids: str,
+) -> Tuple[str, List[Type[models.Model]]]:
+    """
+    CROSS JOINs adding one row per relation embedded in the response, with how many
+    rows it embeds and their latest updated_at, and the models embedded
+
+    Only the rows embedded for the objects whose ids the ids subquery selects are
+    looked at, through the same foreign keys the prefetch of the response uses.
+    Writes to them move the latest updated_at, deletes and unlinks the count.
+    """
+    joins, embedded = [], []
+    for i, path in enumerate(nested_paths(py_model, fields)):
+        nested, path_joins, alias = _join_path(model, path, f"path_{i}")
+        columns = [f'COUNT(*) AS "_count_{i}"']
+        if is_conditional(nested):
+            columns.append(f'MAX("{alias}"."updated_at") AS "_nested_{i}"')
+        pk = model._meta.db_pk_column
+        joins.append(
+            f'CROSS JOIN (SELECT {", ".join(columns)} '
+            f'FROM "{model._meta.db_table}" AS "path_{i}" {path_joins} '
+            f'WHERE "path_{i}"."{pk}" IN ({ids})) AS "embedded_{i}"'
+        )
+        embedded.append(nested)
+    return " ".join(joins), embedded
+
+
+def _latest(
+    row: Dict[str, Any],
+    model: Type[models.Model],
+    column: str,
+    embedded: List[Type[models.Model]],
+) -> Optional[datetime.datetime]:
+    """The latest of the updated_at read as column and of the embedded ones"""
+    values = [model._meta.fields_map["updated_at"].to_python_value(row[column])]
+    for i, nested in enumerate(embedded):
+        if is_conditional(nested):
+            updated_at = nested._meta.fields_map["updated_at"]
+            values.append(updated_at.to_python_value(row[f"_nested_{i}"]))
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _embedded_counts(
+    row: Dict[str, Any], embedded: List[Type[models.Model]]
+) -> List[int]:
+    return [row[f"_count_{i}"] for i in range(len(embedded))]
+
+
+def sparse_fields(
+    _fields: Optional[str] = Query(
+        None, description="Comma separated fields to return, all of them when left out"
+    )
+) -> Optional[Tuple[str, ...]]:
+    """Dependency reading the _fields sparse fieldset, None when every field is wanted"""
+    if not _fields:
+        return None
+    return tuple(
+        dict.fromkeys(name.strip() for name in _fields.split(",") if name.strip())
+    )
+
+
+def fetch_fields(
+    py_model: "Type[BaseModel]",
+    model: Type[models.Model],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> List[str]:
+    """
+    The relations to fetch along with objects serialized as py_model
+
+    Besides the relations py_model shows, these are the ones its computed fields
+    read, as declared in the model's PydanticMeta.computed_relations. Every list
+    and detail route goes through here, so none of them has to remember them.
+
+    fields : Only what these fields need (a sparse fieldset), everything when None
+    """
+    names = list(py_model.__fields__) if fields is None else fields
+    wanted = [
+        name
+        for name in _get_fetch_fields(py_model, model)
+        if name.split("__")[0] in names
+    ]
+    declared = getattr(getattr(model, "PydanticMeta", None), "computed_relations", {})
+    for name in names:
+        wanted.extend(declared.get(name, ()))
+    return list(dict.fromkeys(wanted))
+
+
+class Fieldset:
+    """
+    What has to be loaded to answer with only some fields of py_model
+
+    When only stored fields are wanted they are selected with .values(), relations
+    and computed fields need objects, but only the wanted relations are fetched
+    """
+
+    def __init__(
+        self,
+        model: Type[models.Model],
+        py_model: "Type[BaseModel]",
+        fields: Tuple[str, ...],
+    ):
+        unknown = [name for name in fields if name not in py_model.__fields__]
+        if unknown:
+            raise HTTPException(400, f"Unknown fields {', '.join(unknown)}")
+        self.fields = fields
+        self.columns = [
+            name for name in fields if name in model._meta.fields_db_projection
+        ]
+        self.needs_objects = len(self.columns) < len(fields)
+        self.fetch_fields = fetch_fields(py_model, model, fields)
+
+
+async def fetch_detail(
+    request: Request,
+    response: Response,
+    queryset: queryset.QuerySetSingle,
+    py_model: "Type[BaseModel]",
+    fields: Optional[Tuple[str, ...]],
+) -> Any:
+    """
+    A detail route's object, only the fields asked for with _fields if any
+
+    Objects with an updated_at get an ETag and Last-Modified, when the client's copy
+    is still current they are answered with a 304 after reading updated_at alone.
+    Read from the replica when there is one (see app.db.reading_from_replica).
+    """
+    with reading_from_replica(request):
+        return await _fetch_detail(request, response, queryset, py_model, fields)
+
+
+async def _fetch_detail(
+    request: Request,
+    response: Response,
+    queryset: queryset.QuerySetSingle,
+    py_model: "Type[BaseModel]",
+    fields: Optional[Tuple[str, ...]],
+) -> Any:
+    headers = {}
+    if is_conditional(queryset.model):
+        model = queryset.model
+        ids = queryset.values(model._meta.pk_attr).sql()
+        joins, embedded = _nested_validators(model, py_model, fields, ids)
+        found = await model._meta.db.execute_query_dict(
+            f'SELECT * FROM ({queryset.values("updated_at").sql()}) AS "found" {joins}'
+        )
+        if not found:
+            raise DoesNotExist("Object does not exist")
+        last_modified = _latest(found[0], model, "updated_at", embedded)
+        etag = weak_etag(fields, last_modified, _embedded_counts(found[0], embedded))
+        headers = validator_headers(etag, last_modified)
+        if not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+    if fields is None:
+        obj = await queryset.prefetch_related(*fetch_fields(py_model, queryset.model))
+        return py_model.from_orm(obj)
+    fieldset = Fieldset(queryset.model, py_model, fields)
+    if fieldset.needs_objects:
+        obj = await queryset.prefetch_related(*fieldset.fetch_fields)
+        body = dump(py_model, obj, fields)
+    else:
+        rows = await queryset.values(*fieldset.columns)
+        # Unlike get(), .values() of a single object doesn't raise when missing
+        if not rows:
+            raise DoesNotExist("Object does not exist")
+        body = dump(py_model, rows[0], fields, dicts=True)
+    # Sparse objects don't pass response_model validation, so they are sent as is
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class Page:
+    """
+    One page of a list endpoint, what routes get from Depends(PaginateModel(...))
+
+    filtered : Every row matching the request's filters
+    queryset : The rows of this page
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        paginate: "PaginateModel",
+        filters: Dict[str, Any],
+        queryset: queryset.QuerySet,
+        sort: str,
+        descending: bool,
+        limit: int,
+        offset: Optional[int],
+        fields: Optional[Tuple[str, ...]] = None,
+    ):
+        self.request = request
+        self.paginate = paginate
+        self.filters = filters
+        self.filtered = paginate.model.filter(**filters).distinct()
+        self.queryset = queryset
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+        self.offset = offset
+        self.fields = fields
+        # Narrowed by the route beyond the request's filters, see where()
+        self.narrowed = False
+
+    def where(self, *criteria: Q) -> "Page":
+        """
+        Keep only the rows matching criteria as well, for what routes filter on
+        themselves (the current user's rows, say)
+
+        Counts of a narrowed page are always exact
+        """
+        self.filtered = self.filtered.filter(*criteria)
+        self.queryset = self.queryset.filter(*criteria)
+        self.narrowed = True
+        return self
+
+    @property
+    def model(self) -> Type[models.Model]:
+        return self.paginate.model
+
+    @property
+    def db(self):
+        return self.model._meta.db
+
+    def _quote(self, field: str) -> str:
+        return '"{}"'.format(self.model._meta.fields_db_projection[field])
+
+    async def _exact_count(self) -> int:
+        # Counting over the DISTINCT select so joined filters don't count a row twice
+        result = await self.db.execute_query_dict(
+            f'SELECT COUNT(*) AS "total" FROM ({self.filtered.sql()}) AS "filtered"'
+        )
+        return result[0]["total"]
+
+    async def _validator(
+        self, py_model: "Type[BaseModel]"
+    ) -> Tuple[Optional[datetime.datetime], int, List[int]]:
+        """
+        The latest updated_at of the rows matching the filters and of the models
+        embedded in this page's rows, the number of matching rows and how many
+        embedded rows every relation has
+
+        Exact counts come with the same query, the other count modes are asked
+        afterwards, so a cached count doesn't count the rows again
+        """
+        exact = self.paginate.count == "exact"
+        pk = self.model._meta.pk_attr
+        # SELECT DISTINCT has to select what it is ordered by
+        page = self.queryset.values(*dict.fromkeys([pk, self.sort])).sql()
+        ids = f'SELECT "{pk}" FROM ({page}) AS "page"'
+        joins, embedded = _nested_validators(self.model, py_model, self.fields, ids)
+        columns = ['MAX("filtered"."updated_at") AS "last_modified"']
+        if exact:
+            columns.append('COUNT(*) AS "total"')
+        result = await self.db.execute_query_dict(
+            f'SELECT * FROM (SELECT {", ".join(columns)} '
+            f'FROM ({self.filtered.sql()}) AS "filtered") AS "matching" {joins}'
+        )
+        last_modified = _latest(result[0], self.model, "last_modified", embedded)
+        total = result[0]["total"] if exact else await self.count()
+        return last_modified, total, _embedded_counts(result[0], embedded)
+
+    async def _estimated_count(self) -> Optional[int]:
+        if self.filters or self.narrowed or self.db.capabilities.dialect != "postgres":
+            return None
+        result = await self.db.execute_query_dict(
+            'SELECT reltuples::BIGINT AS "estimate" FROM pg_class WHERE relname = '
+            f"'{self.model._meta.db_table}'"
+        )
+        # Tables that were never analyzed have no estimate yet
+        if not result or result[0]["estimate"] <= 0:
+            return None
+        return result[0]["estimate"]
+
+    async def count(self) -> int:
+        """Total rows matching the filters, worked out the way the route asked for"""
+        mode = self.paginate.count
+        if mode == "estimate":
+            estimate = await self._estimated_count()
+            if estimate is not None:
+                return estimate
+        if mode == "cached" and not self.narrowed:
+            key = (self.model._meta.db_table, _filters_key(self.filters))
+            total = count_cache.get(key)
+            if total is None:
+                total = await self._exact_count()
+                count_cache.set(key, total)
+            return total
+        return await self._exact_count()
+
+    async def _rows_with_total(
+        self, columns: Optional[List[str]] = None
+    ) -> Tuple[List[Any], Optional[int]]:
+        """
+        The page's rows plus the total in one round trip
+
+        COUNT(*) OVER () is evaluated before LIMIT, so every row carries the total
+
+        columns : Select only these fields and return rows as .values() would,
+            objects with every field when None
+        """
+        if columns is None:
+            filtered = self.filtered.sql()
+            sort = self._quote(self.sort)
+        else:
+            # .values() names the selected columns after the fields
+            filtered = self.filtered.values(*columns).sql()
+            sort = f'"{self.sort}"'
+        direction = "DESC" if self.descending else "ASC"
+        order = [f'"filtered".{sort} {direction}']
+        if self.sort != "id":
+            order.append(f'"filtered"."id" {direction}')
+        sql = (
+            'SELECT "filtered".*, COUNT(*) OVER () AS "_total" '
+            f'FROM ({filtered}) AS "filtered" '
+            f"ORDER BY {', '.join(order)} LIMIT {self.limit} OFFSET {self.offset}"
+        )
+        result = await self.db.execute_query_dict(sql)
+        if columns is None:
+            rows = [self.model._init_from_db(**row) for row in result]
+        else:
+            fields_map = self.model._meta.fields_map
+            rows = [
+                {name: fields_map[name].to_python_value(row[name]) for name in columns}
+                for row in result
+            ]
+        # An empty page past the end can't tell the total
+        return rows, result[0]["_total"] if result else None
+
+    def next_cursor(self, rows: Sequence[Any]) -> Optional[str]:
+        """The cursor continuing after the last row, None when this was the last page"""
+        if not rows or len(rows) < self.limit:
+            return None
+        last = rows[-1]
+        if isinstance(last, dict):
+            sort_value, last_id = last.get(self.sort), last["id"]
+        else:
+            sort_value, last_id = getattr(last, self.sort, None), last.id
+        # A NULL sort value is encoded as is, keyset() knows where NULLs go
+        return encode_cursor(sort_value, last_id)
+
+    async def fetch(
+        self, response: Response, py_model: "Type[BaseModel]"
+    ) -> Union[List, Response]:
+        """
+        Serialize the page and set the X-Total-Count and X-Next-Cursor headers
+
+        Routes paginated with fast=True get the encoded response back, which FastAPI
+        sends as is instead of validating every row against response_model again.
+        So do pages with a sparse fieldset, they wouldn't pass that validation.
+
+        Models with an updated_at get a weak ETag and Last-Modified from the latest
+        updated_at, of the rows and of the rows embedded in this page, the number
+        of matching rows as the route counts them and how many rows every relation
+        embeds in this page. A row added, changed or deleted changes one of them,
+        so a client whose copy is still current gets a 304 before the page is even
+        queried.
+
+        Pages are read from the replica when there is one.
+        """
+        with reading_from_replica(self.request):
+            return await self._fetch(response, py_model)
+
+    async def _fetch(
+        self, response: Response, py_model: "Type[BaseModel]"
+    ) -> Union[List, Response]:
+        total = None
+        if self.paginate.conditional:
+            last_modified, total, embedded = await self._validator(py_model)
+            query = sorted(self.request.query_params.multi_items())
+            etag = weak_etag(query, last_modified, total, embedded)
+            headers = validator_headers(etag, last_modified)
+            if not_modified(self.request, etag, last_modified):
+                return Response(status_code=304, headers=headers)
+            response.headers.update(headers)
+
+        fieldset = None
+        relations = fetch_fields(py_model, self.model)
+        if self.fields is not None:
+            fieldset = Fieldset(self.model, py_model, self.fields)
+            relations = fieldset.fetch_fields
+        # Only stored fields wanted, the projection goes down to SQL
+        columns = None
+        if fieldset is not None and not fieldset.needs_objects:
+            columns = list(dict.fromkeys([*fieldset.columns, self.sort, "id"]))
+
+        # Cursor pages filter by the keyset, so they can't see the total themselves
+        exact = self.paginate.count == "exact" and self.offset is not None
+        if exact and total is None:
+            rows, total = await self._rows_with_total(columns)
+        elif columns is not None:
+            rows = await self.queryset.values(*columns)
+        else:
+            rows = await self.queryset
+        if columns is None:
+            await self.model.fetch_for_list(rows, *relations, *self.paginate.prefetch)
+        if total is None:
+            total = await self.count()
+
+        response.headers["X-Total-Count"] = f"{total}"
+        cursor = self.next_cursor(rows)
+        if cursor is not None:
+            response.headers["X-Next-Cursor"] = cursor
+        if self.paginate.fast or fieldset is not None:
+            return Response(
+                dump_list(py_model, rows, self.fields, dicts=columns is not None),
+                media_type="application/json",
+                headers=dict(response.headers),
+            )
+        return [py_model.from_orm(row) for row in rows]
+
+
+def _filters_key(filters: Dict[str, Any]) -> Tuple:
+    return tuple(
+        sorted(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in filters.items()
+        )
+    )
 
 
 class PaginateModel:
-    def __init__(self, model: Type[models.Model], py_model: "Type[BaseModel]"):
+    """
+    model : The tortoise model being listed
+    py_model : The pydantic model holding the filters the route accepts
+    prefetch : Relations to load along with every page
+    count : How X-Total-Count is worked out, "exact" (a window function in the page's
+        query), "cached" (exact, then cached per filter set until a write) or "estimate"
+        (Postgres planner statistics for unfiltered lists, exact otherwise)
+    fast : Encode pages straight from the rows (see app.models.serialize), the
+        output is the same as going through pydantic and response_model
+
+    Lists of models with an updated_at answer conditional GETs (see Page.fetch)
+    """
+
+    def __init__(
+        self,
+        model: Type[models.Model],
+        py_model: "Type[BaseModel]",
+        prefetch: Sequence[str] = (),
+        count: str = "exact",
+        fast: bool = False,
+    ):
+        if count not in ("exact", "cached", "estimate"):
+            raise ValueError(f"Unknown count mode {count}")
         self.model = model
         self.py_model = py_model
+        self.prefetch = prefetch
+        self.count = count
+        self.fast = fast
+        self.conditional = is_conditional(model)
+
+    def keyset(self, sort: str, descending: bool, cursor: str) -> Q:
+        """
+        Rows after the cursor in (sort, id) order
+
+        Written as sort >= x AND (sort > x OR id > y) so the first condition can drive
+        an index range scan on (sort, id)
+
+        NULLs of nullable sort fields are where the database sorts them, last in
+        ascending order on Postgres and first on SQLite and MySQL (the other way
+        around in descending order)
+        """
+        sort_value, last_id = decode_cursor(cursor)
+        op = "lt" if descending else "gt"
+        if sort == "id":
+            return Q(**{f"id__{op}": last_id})
+        field = self.model._meta.fields_map.get(sort)
+        if field is None:
+            raise HTTPException(400, f"Can't page by {sort} with a cursor")
+        same_id = Q(**{f"id__{op}": last_id})
+        if sort_value is None:
+            after = Q(Q(**{f"{sort}__isnull": True}), same_id)
+        else:
+            sort_value = field.to_python_value(sort_value)
+            after = Q(
+                Q(**{f"{sort}__{op}e": sort_value}),
+                Q(Q(**{f"{sort}__{op}": sort_value}), same_id, join_type="OR"),
+            )
+        if not field.null:
+            return after
+        postgres = self.model._meta.db.capabilities.dialect == "postgres"
+        nulls_last = postgres != descending
+        if sort_value is None and not nulls_last:
+            # Past the NULLs come all the values
+            return Q(after, Q(**{f"{sort}__isnull": False}), join_type="OR")
+        if sort_value is not None and nulls_last:
+            return Q(after, Q(**{f"{sort}__isnull": True}), join_type="OR")
+        return after
 
     # Called on Depends(...)
     def __call__(
@@ -18,19 +678,36 @@ class PaginateModel:
         _order: str = "asc",
         _start: int = 0,
         _end: int = 20,
+        _cursor: Optional[str] = None,
         id: Optional[List[int]] = Query(None),
-    ) -> queryset.QuerySet[models.Model]:
+        _fields: Optional[Tuple[str, ...]] = Depends(sparse_fields),
+    ) -> Page:
         filters = self.py_model.parse_obj(request.query_params)
         filters_dict = filters.dict(exclude_unset=True)
         if id is not None:
             filters_dict["id__in"] = id
-        order = _sort
-        if _order.lower() == "desc":
-            order = "-" + order
-        return (
-            self.model.filter(**filters_dict)
-            .order_by(order)
-            .offset(_start)
-            .limit(_end - _start)
-            .distinct()
+        descending = _order.lower() == "desc"
+        order = ["-" + _sort, "-id"] if descending else [_sort, "id"]
+        if _sort == "id":
+            order = order[:1]
+
+        page = self.model.filter(**filters_dict)
+        offset = None
+        if _cursor:
+            # Cursor mode replaces the offset, _start/_end only give the page size
+            page = page.filter(self.keyset(_sort, descending, _cursor))
+        else:
+            offset = _start
+            page = page.offset(offset)
+        limit = _end - _start
+        return Page(
+            request,
+            self,
+            filters_dict,
+            page.order_by(*order).limit(limit).distinct(),
+            _sort,
+            descending,
+            limit,
+            offset,
+            _fields,
         )
@@ -0,0 +1,67 @@
+"""
+The moderation queue, reports grouped by what they report
+
+Every (type, reference_id) reported is one entry, the most recently reported first.
+A page is found by walking the report primary key down from the cursor and keeping
+the reports no newer report of their group follows, so it costs the page and not
+the table. Only the groups of the page are then aggregated, from the index on
+report (type, reference_id, created_at, id).
+
+The pages after the first show the queue as it was when the first page was read:
+the cursor keeps the id of the newest report then, and later reports are left out.
+A group reported again meanwhile keeps its place and its count, its new reports
+move it to the front of the next first page.
+"""
+from typing import Dict, List, Optional
+
+from app.models.tortoise import Report, ReportType
+
+
+async def report_queue(
+    type: Optional[ReportType] = None,
+    before: Optional[int] = None,
+    until: Optional[int] = None,
+    limit: int = 20,
+) -> List[Dict]:
+    """
+    One page of the queue, rows as ReportGroup takes them
+
+    type : Only the groups reporting users (or reviews)
+    before : The latest_report_id of the previous page's last group
+    until : The id of the newest report the first page saw, newer ones are skipped
+    """
+    latest = []
+    if type is not None:
+        latest.append(f'"latest"."type" = {int(type)}')
+    if before is not None:
+        latest.append(f'"latest"."id" < {int(before)}')
+    seen = ""
+    if until is not None:
+        latest.append(f'"latest"."id" <= {int(until)}')
+        seen = f'AND "report"."id" <= {int(until)}'
+    where = " ".join(f"{condition} AND" for condition in latest)
+    sql = f"""
+        SELECT "page".*, COUNT(*) AS "reports",
+            MIN("report"."created_at") AS "first_reported_at",
+            MAX("report"."created_at") AS "last_reported_at"
+        FROM (
+            SELECT "latest"."type", "latest"."reference_id",
+                "latest"."id" AS "latest_report_id",
+                "latest"."reason" AS "latest_reason"
+            FROM "report" AS "latest"
+            WHERE {where} NOT EXISTS (
+                SELECT 1 FROM "report"
+                WHERE "report"."type" = "latest"."type"
+                    AND "report"."reference_id" = "latest"."reference_id"
+                    AND "report"."id" > "latest"."id" {seen}
+            )
+            ORDER BY "latest"."id" DESC
+            LIMIT {int(limit)}
+        ) AS "page"
+        JOIN "report" ON "report"."type" = "page"."type"
+            AND "report"."reference_id" = "page"."reference_id" {seen}
+        GROUP BY "page"."type", "page"."reference_id", "page"."latest_report_id",
+            "page"."latest_reason"
+        ORDER BY "page"."latest_report_id" DESC
+    """
+    return await Report._meta.db.execute_query_dict(sql)
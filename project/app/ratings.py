@@ -0,0 +1,104 @@
+"""
+Rating aggregates stored on User (rating_count, rating_sum, rating_avg,
+rating_histogram) so a tutor's rating doesn't need all of their reviews
+
+The write helpers run inside the transaction of the review write, reconcile()
+rebuilds everything from the review table: `python -m app.ratings`
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+from tortoise import Tortoise, run_async
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.functions import Count
+from tortoise.query_utils import Q
+from tortoise.transactions import in_transaction
+
+from app.db import TORTOISE_ORM
+from app.models.tortoise import Review, User
+
+log = logging.getLogger("uvicorn")
+
+RATING_FIELDS = ["rating_count", "rating_sum", "rating_avg", "rating_histogram"]
+
+
+def _set_aggregates(user: User, histogram: Dict[str, int]) -> None:
+    histogram = {rating: count for rating, count in histogram.items() if count > 0}
+    user.rating_histogram = histogram
+    user.rating_count = sum(histogram.values())
+    user.rating_sum = sum(int(rating) * count for rating, count in histogram.items())
+    user.rating_avg = user.rating_sum / user.rating_count if user.rating_count else 0
+
+
+async def apply_ratings(
+    connection: BaseDBAsyncClient, changes: Iterable[Tuple[int, int, int]]
+) -> None:
+    """
+    Add ratings to / remove ratings from the aggregates of their reviewees
+
+    connection : The transaction the review itself is written in
+    changes : (reviewee id, rating, +1 or -1) for every review added or removed
+    """
+    deltas: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for reviewee_id, rating, sign in changes:
+        deltas[reviewee_id][str(rating)] += sign
+
+    # Locked in id order, so two writes touching the same users can't deadlock
+    users = (
+        await User.filter(id__in=list(deltas))
+        .using_db(connection)
+        .select_for_update()
+        .order_by("id")
+    )
+    for user in users:
+        histogram = defaultdict(int, user.rating_histogram or {})
+        for rating, delta in deltas[user.id].items():
+            histogram[rating] += delta
+        _set_aggregates(user, histogram)
+        await user.save(
+            using_db=connection, update_fields=RATING_FIELDS + ["updated_at"]
+        )
+
+
+async def reconcile(connection: Optional[BaseDBAsyncClient] = None) -> int:
+    """Rebuild every user's aggregates from the review table, returns how many changed"""
+    connection = connection or User._meta.db
+    rows = (
+        await Review.all()
+        .using_db(connection)
+        .annotate(count=Count("id"))
+        .group_by("reviewee_id", "rating")
+        .values("reviewee_id", "rating", "count")
+    )
+    histograms: Dict[int, Dict[str, int]] = defaultdict(dict)
+    for row in rows:
+        histograms[row["reviewee_id"]][str(row["rating"])] = row["count"]
+
+    changed = 0
+    # Users who lost all their reviews need resetting as well
+    users = User.filter(
+        Q(Q(id__in=list(histograms)), Q(rating_count__gt=0), join_type="OR")
+    )
+    for user in await users.using_db(connection):
+        before = [getattr(user, field) for field in RATING_FIELDS]
+        _set_aggregates(user, histograms.get(user.id, {}))
+        if [getattr(user, field) for field in RATING_FIELDS] != before:
+            await user.save(
+                using_db=connection, update_fields=RATING_FIELDS + ["updated_at"]
+            )
+            changed += 1
+    return changed
+
+
+async def main() -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    async with in_transaction() as connection:
+        changed = await reconcile(connection)
+    log.info(f"Reconciled the ratings of {changed} users")
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_async(main())
@@ -0,0 +1,253 @@
+"""
+Cache of encoded GET responses, invalidated by the write handlers through tags
+
+Every entry is tagged with the table of the model it shows ("category") or, for
+a single object, with the table and id ("category:3"), plus the tables of every
+model nested in it, so a review write also drops the user responses embedding
+reviews.
+
+Invalidation only reaches the process it happens in, so the default in-memory
+backend is off when the app runs in several workers (see Settings.web_concurrency)
+and its entries never answer conditional requests: a 304 from an entry another
+worker's write didn't drop would confirm a stale copy. Those requests go to the
+route, whose validators are read from the database.
+"""
+import functools
+import inspect
+import time
+from email.utils import parsedate_to_datetime
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    Optional,
+    Set,
+    Type,
+)
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from tortoise import models
+from tortoise.contrib.pydantic import PydanticModel
+
+from app.cache import TTLCache
+from app.config import get_settings
+from app.db import has_replica
+from app.models.tortoise import User
+from app.models.utils import nested_models, not_modified
+
+# Headers that belong to one response rather than to the cached representation
+_UNCACHED_HEADERS = {"content-length", "content-type", "set-cookie"}
+# Request headers asking for a 304, answered by the route unless the backend is shared
+_CONDITIONAL = ("if-none-match", "if-modified-since")
+
+
+class CachedResponse:
+    def __init__(self, body: bytes, headers: Dict[str, str], tags: FrozenSet[str]):
+        self.body = body
+        self.headers = headers
+        self.tags = tags
+
+
+class CacheBackend:
+    """Where the responses are kept, subclass it to share them between processes"""
+
+    # Whether every process reads and invalidates the same entries, only then
+    # are they current enough to answer conditional requests with a 304
+    shared = False
+
+    async def get(self, key: Hashable) -> Optional[CachedResponse]:
+        raise NotImplementedError
+
+    async def set(self, key: Hashable, entry: CachedResponse) -> None:
+        raise NotImplementedError
+
+    async def invalidate_tags(self, tags: Set[str]) -> int:
+        """Drop every entry carrying one of the tags and return how many"""
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """
+    The default backend, an LRU of this process
+
+    maxsize : The most responses kept, 0 disables caching
+    ttl : Seconds a response is served for
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: Hashable) -> Optional[CachedResponse]:
+        return self._cache.get(key, count=False)
+
+    async def set(self, key: Hashable, entry: CachedResponse) -> None:
+        self._cache.set(key, entry)
+
+    async def invalidate_tags(self, tags: Set[str]) -> int:
+        # Writes are rare next to reads, a scan beats keeping a tag index current
+        return self._cache.invalidate_where(lambda _, entry: bool(entry.tags & tags))
+
+    async def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._cache), "evictions": self._cache.evictions}
+
+
+def _nested_tables(py_model: Type[PydanticModel]) -> Set[str]:
+    return {model._meta.db_table for model in nested_models(py_model)}
+
+
+def _role(values: Iterable[Any]) -> str:
+    """The permission class of the request, from the user the route authenticated"""
+    users = [value for value in values if isinstance(value, User)]
+    if not users:
+        return "anonymous"
+    return "superuser" if users[0].is_superuser else "user"
+
+
+class ResponseCache:
+    """
+    backend : Where the responses are kept
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidated_at = float("-inf")
+
+    def _settling(self) -> bool:
+        # Right after a write the replica may still have the old rows, responses
+        # read from it then mustn't be kept for a whole ttl
+        since = time.monotonic() - self.invalidated_at
+        return has_replica() and since < get_settings().replica_stickiness
+
+    def cached(self, py_model: Type[PydanticModel], id_param: Optional[str] = None):
+        """
+        Decorator caching a GET route's 200 responses per path, query string and
+        permission class (anonymous, user or superuser)
+
+        py_model : The route's response model, what the responses are tagged with
+        id_param : The path parameter holding the id of a detail route's object,
+            list routes leave it out
+        """
+        table = py_model.__config__.orig_model._meta.db_table
+        nested = frozenset(_nested_tables(py_model))
+
+        def decorate(endpoint: Callable) -> Callable:
+            signature = inspect.signature(endpoint)
+            # The key needs the request, routes that don't take it get it anyway
+            takes_request = "request" in signature.parameters
+            parameters = list(signature.parameters.values())
+            if not takes_request:
+                parameters.append(
+                    inspect.Parameter(
+                        "request", inspect.Parameter.KEYWORD_ONLY, annotation=Request
+                    )
+                )
+
+            @functools.wraps(endpoint)
+            async def wrapper(**kwargs: Any) -> Any:
+                request: Request = (
+                    kwargs["request"] if takes_request else kwargs.pop("request")
+                )
+                key = (
+                    request.url.path,
+                    tuple(sorted(request.query_params.multi_items())),
+                    _role(kwargs.values()),
+                )
+                conditional = any(name in request.headers for name in _CONDITIONAL)
+                entry = None
+                if self.backend.shared or not conditional:
+                    entry = await self.backend.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    return self._replay(request, entry)
+                self.misses += 1
+
+                result = await endpoint(**kwargs)
+                if not isinstance(result, Response):
+                    # What FastAPI would have sent for the returned object
+                    response = kwargs.get("response")
+                    result = JSONResponse(
+                        jsonable_encoder(result),
+                        headers=dict(response.headers) if response else None,
+                    )
+                if result.status_code == 200 and not self._settling():
+                    tags = (
+                        {table} if id_param is None else {f"{table}:{kwargs[id_param]}"}
+                    )
+                    headers = {
+                        name: value
+                        for name, value in result.headers.items()
+                        if name not in _UNCACHED_HEADERS
+                    }
+                    await self.backend.set(
+                        key,
+                        CachedResponse(result.body, headers, frozenset(tags | nested)),
+                    )
+                return result
+
+            wrapper.__signature__ = signature.replace(parameters=parameters)
+            return wrapper
+
+        return decorate
+
+    @staticmethod
+    def _replay(request: Request, entry: CachedResponse) -> Response:
+        etag = entry.headers.get("etag")
+        if etag is not None:
+            last_modified = entry.headers.get("last-modified")
+            if not_modified(
+                request,
+                etag,
+                parsedate_to_datetime(last_modified) if last_modified else None,
+            ):
+                return Response(status_code=304, headers=entry.headers)
+        return Response(
+            entry.body, media_type="application/json", headers=entry.headers
+        )
+
+    async def invalidate(self, model: Type[models.Model], *ids: int) -> int:
+        """
+        Drop the cached responses showing model after a write to it
+
+        ids : The objects written, their detail responses are dropped along with
+            every list of model
+        """
+        self.invalidated_at = time.monotonic()
+        table = model._meta.db_table
+        tags = {table, *(f"{table}:{id}" for id in ids)}
+        return await self.backend.invalidate_tags(tags)
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            **self.backend.stats(),
+        }
+
+
+response_cache = ResponseCache(
+    MemoryBackend(
+        maxsize=get_settings().response_cache_size,
+        ttl=get_settings().response_cache_ttl,
+    )
+)
@@ -0,0 +1,64 @@
+"""
+Schedule reads of tutors, behind GET /user/{user_id}/schedule
+
+Concurrent reads of the same tutor and window share one load, and its result is
+served for schedule_cache_ttl seconds after. A shared link to a popular tutor then
+costs one credentials check, sync and query instead of one per student.
+"""
+import datetime
+from typing import Dict, List
+
+from fastapi import HTTPException
+
+from app import metrics
+from app.cache import SingleFlight, TTLCache
+from app.config import get_settings
+from app.models.tortoise import User
+
+# (user id, time_min, time_max) -> events of the tutor in the window
+schedule_cache = TTLCache(
+    maxsize=get_settings().schedule_cache_size, ttl=get_settings().schedule_cache_ttl
+)
+
+schedule_loads = SingleFlight()
+
+
+async def read_schedule(
+    user_id: int, time_min: datetime.datetime, time_max: datetime.datetime
+) -> List[Dict]:
+    """
+    The events of a tutor between time_min and time_max, see User.get_events
+
+    user_id : The tutor
+    """
+    # Naive times are local ones, the same window gets the same key either way
+    key = (
+        user_id,
+        time_min.astimezone(datetime.timezone.utc),
+        time_max.astimezone(datetime.timezone.utc),
+    )
+    events = schedule_cache.get(key)
+    if events is not None:
+        metrics.schedule_reads.labels("cached").inc()
+        return events
+
+    async def load() -> List[Dict]:
+        user = await User.get(id=user_id)
+        if not user.is_tutor:
+            raise HTTPException(405, "User is not a tutor")
+        events = await user.get_events(time_min, time_max)
+        schedule_cache.set(key, events)
+        return events
+
+    outcome = "coalesced" if schedule_loads.in_flight(key) else "loaded"
+    metrics.schedule_reads.labels(outcome).inc()
+    return await schedule_loads.do(key, load)
+
+
+def forget_schedules(user_id: int) -> None:
+    """Drop the cached reads of a tutor after their calendar changed"""
+    schedule_cache.invalidate_where(lambda key, _: key[0] == user_id)
+
+
+def stats() -> Dict[str, int]:
+    return {**schedule_cache.stats(), "coalesced": schedule_loads.coalesced}
@@ -0,0 +1,129 @@
+import re
+from typing import List, Optional
+
+from tortoise.query_utils import Q
+
+from app.models.tortoise import User
+
+# These expressions have to match the ones of the indexes created in migration 12
+USER_DOCUMENT = (
+    "COALESCE(\"first_name\", '') || ' ' || COALESCE(\"last_name\", '') || ' ' || "
+    "COALESCE(\"email\", '')"
+)
+USER_VECTOR = f"to_tsvector('simple', {USER_DOCUMENT})"
+CATEGORY_VECTOR = "to_tsvector('simple', \"name\")"
+
+QUERY = "$1::tsquery"
+# Name matches rank above email matches, which rank above category matches
+USER_RANK = (
+    "ts_rank(setweight(to_tsvector('simple', "
+    "COALESCE(\"first_name\", '') || ' ' || COALESCE(\"last_name\", '')), 'A') || "
+    f"setweight(to_tsvector('simple', COALESCE(\"email\", '')), 'B'), {QUERY})"
+)
+CATEGORY_RANK = f"ts_rank(setweight({CATEGORY_VECTOR}, 'C'), {QUERY})"
+
+# Whether the database has pg_trgm, which schemas generated without the
+# migrations (tests) don't
+_trigram: Optional[bool] = None
+
+
+def search_terms(q: str) -> List[str]:
+    return [term for term in re.split(r"[^\w@.]+", q.lower()) if term]
+
+
+def prefix_query(terms: List[str]) -> str:
+    """
+    A tsquery where every term matches as a prefix, for search-as-you-type
+
+    Cast rather than parsed with to_tsquery, so a partial email stays one lexeme
+    the way to_tsvector keeps whole emails
+    """
+    # Terms only hold word characters, "@" and ".", nothing tsquery would interpret
+    return " & ".join(f"'{term}':*" for term in terms)
+
+
+async def has_trigram(db) -> bool:
+    global _trigram
+    if _trigram is None:
+        result = await db.execute_query_dict(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+        )
+        _trigram = bool(result)
+    return _trigram
+
+
+async def search_users(
+    q: str, is_tutor: Optional[bool] = None, limit: int = 20
+) -> List[User]:
+    """
+    Users matching q by name, email or category name, best match first
+
+    q : Words typed so far, the last of them may be incomplete
+    is_tutor : Only return tutors (or only non tutors)
+    limit : How many users to return
+    """
+    terms = search_terms(q)
+    query = prefix_query(terms)
+    if not query:
+        return []
+    db = User._meta.db
+    if db.capabilities.dialect != "postgres":
+        return await _search_users_fallback(terms, is_tutor, limit)
+
+    text = " ".join(terms)
+    pattern = "%{}%".format(re.sub(r"([\\%_])", r"\\\1", text))
+    values = [query, pattern]
+    user_match = f"{USER_VECTOR} @@ {QUERY}"
+    category_match = f'{CATEGORY_VECTOR} @@ {QUERY} OR "name" ILIKE $2'
+    user_rank = USER_RANK
+    category_rank = CATEGORY_RANK
+    if await has_trigram(db):
+        # Trigrams catch infixes ("gmail", "ohns") the prefix query misses
+        values.append(text)
+        user_match += f" OR {USER_DOCUMENT} ILIKE $2"
+        user_rank += f" + similarity({USER_DOCUMENT}, $3)"
+        category_rank += ' + similarity("name", $3) / 2'
+    tutor = ""
+    if is_tutor is not None:
+        values.append(is_tutor)
+        tutor = f'AND "user"."is_tutor" = ${len(values)}'
+    sql = f"""
+        WITH "hits" AS (
+            SELECT "id" AS "user_id", {user_rank} AS "rank"
+            FROM "user" WHERE {user_match}
+            UNION ALL
+            SELECT "user_categories"."user_id", {category_rank} AS "rank"
+            FROM "category"
+            JOIN "user_categories" ON "user_categories"."category_id" = "category"."id"
+            WHERE {category_match}
+        )
+        SELECT "user".* FROM "user"
+        JOIN (
+            SELECT "user_id", MAX("rank") AS "rank" FROM "hits" GROUP BY "user_id"
+        ) AS "ranked" ON "ranked"."user_id" = "user"."id"
+        WHERE TRUE {tutor}
+        ORDER BY "ranked"."rank" DESC, "user"."id"
+        LIMIT {int(limit)}
+    """
+    result = await db.execute_query_dict(sql, values)
+    return [User._init_from_db(**row) for row in result]
+
+
+async def _search_users_fallback(
+    terms: List[str], is_tutor: Optional[bool], limit: int
+) -> List[User]:
+    """Unranked prefix search for databases without full-text search"""
+    users = User.all()
+    for term in terms:
+        users = users.filter(
+            Q(
+                Q(first_name__istartswith=term),
+                Q(last_name__istartswith=term),
+                Q(email__istartswith=term),
+                Q(categories__name__istartswith=term),
+                join_type="OR",
+            )
+        )
+    if is_tutor is not None:
+        users = users.filter(is_tutor=is_tutor)
+    return await users.order_by("id").limit(limit).distinct()
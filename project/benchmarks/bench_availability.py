@@ -0,0 +1,146 @@
+"""
+Finding the free tutors of a category: GET /category/{id}/availability against a
+client reading every tutor's /user/{id}/schedule, with Google replaced by
+benchmarks/fake_google.py
+
+Seeds --tutors tutors with calendars under one category into the database at
+DATABASE_URL (migrated) and starts the fake Google server. Run from the project
+directory with `python -m benchmarks.bench_availability --tutors 200 --latency 80`
+"""
+import argparse
+import asyncio
+import datetime
+import subprocess
+import sys
+import time
+
+from prometheus_client import REGISTRY
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from app import availability, google_calendar
+from app.config import get_settings
+from app.models.tortoise import Category, Credentials, User
+from benchmarks.db import BENCH_EMAIL_DOMAIN, init_db, seed_users
+from benchmarks.load import _fake_creds, _wait_until_up
+
+CATEGORY = "bench availability"
+
+
+async def seed(count: int):
+    """The category and its tutors, each with a calendar and credentials"""
+    await seed_users(count * 4)
+    category, _ = await Category.get_or_create(name=CATEGORY)
+    tutors = (
+        await User.filter(is_tutor=True, email__endswith=f"@{BENCH_EMAIL_DOMAIN}")
+        .order_by("id")
+        .limit(count)
+    )
+    for tutor in tutors:
+        if tutor.google_calendar_id is None:
+            tutor.google_calendar_id = f"bench{tutor.id}@fake.test"
+            await tutor.save(update_fields=["google_calendar_id"])
+        await Credentials.get_or_create(
+            user_id=tutor.id, defaults={"json_field": _fake_creds(tutor.id)}
+        )
+    async with in_transaction(User._meta.default_connection) as connection:
+        linked = await User.filter(categories__id=category.id).values_list(
+            "id", flat=True
+        )
+        unlinked = {
+            tutor.id: [category.id] for tutor in tutors if tutor.id not in linked
+        }
+        # Nothing left to link when the seed runs again
+        if unlinked:
+            await User.set_categories(unlinked, using_db=connection)
+    return category.id, tutors
+
+
+def google_calls() -> float:
+    return sum(
+        sample.value
+        for metric in REGISTRY.collect()
+        if metric.name == "google_api_requests"
+        for sample in metric.samples
+        if sample.name == "google_api_requests_total"
+    )
+
+
+async def measure(name: str, func) -> None:
+    calls = google_calls()
+    start = time.perf_counter()
+    await func()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{name:>32} {elapsed:>10.1f} {google_calls() - calls:>8.0f}")
+
+
+async def main(args: argparse.Namespace):
+    settings = get_settings()
+    settings.google_api_endpoint = f"http://127.0.0.1:{args.port}/calendar/v3/"
+    settings.google_token_uri = f"http://127.0.0.1:{args.port}/token"
+    # The schedule reads sync the whole calendar every time
+    settings.calendar_sync_interval = 0
+
+    await init_db()
+    category_id, tutors = await seed(args.tutors)
+    day = datetime.date.today() + datetime.timedelta(days=1)
+    time_min = datetime.datetime(
+        day.year, day.month, day.day, 14, tzinfo=datetime.timezone.utc
+    )
+    time_max = time_min + datetime.timedelta(hours=4)
+    duration = datetime.timedelta(hours=1)
+
+    async def schedules():
+        # What clients did: one schedule read per tutor of the category
+        await asyncio.gather(
+            *(tutor.get_events(time_min, time_max) for tutor in tutors)
+        )
+
+    async def search():
+        await availability.search(category_id, time_min, time_max, duration)
+
+    print(f"{len(tutors)} tutors, {args.latency:.0f} ms per Google call")
+    print(f"{'':>32} {'ms':>10} {'calls':>8}")
+    google_calendar.service_cache.clear()
+    await measure("schedules, cold services", schedules)
+    await measure("schedules, warm services", schedules)
+    google_calendar.service_cache.clear()
+    await measure("availability, cold services", search)
+    availability.busy_cache.clear()
+    await measure("availability, warm services", search)
+    await measure("availability, cached", search)
+
+    await Tortoise.close_connections()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tutors", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8901, help="of the fake Google")
+    parser.add_argument("--latency", type=float, default=80, help="milliseconds")
+    parser.add_argument("--jitter", type=float, default=20, help="milliseconds")
+    parser.add_argument("--loop", default="auto", help="uvicorn's event loop")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    fake_google = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.fake_google",
+            f"--port={args.port}",
+            f"--latency={args.latency}",
+            f"--jitter={args.jitter}",
+            f"--loop={args.loop}",
+        ]
+    )
+    try:
+        _wait_until_up(
+            f"http://127.0.0.1:{args.port}/calendar/v3/calendars/up", fake_google
+        )
+        asyncio.get_event_loop().run_until_complete(main(args))
+    finally:
+        fake_google.terminate()
+        fake_google.wait()
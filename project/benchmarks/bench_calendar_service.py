@@ -0,0 +1,42 @@
+"""
+Cost per call of getting a Calendar service object
+
+Run from the project directory with `python -m benchmarks.bench_calendar_service`
+"""
+import timeit
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from app import google_calendar
+
+ROUNDS = 50
+
+
+def build_per_call(creds: Credentials):
+    # What get_calendar_service used to do on every schedule read
+    return build("calendar", "v3", credentials=creds, static_discovery=True)
+
+
+def cached_per_call(creds: Credentials):
+    cached = google_calendar.service_cache.get(1)
+    if cached is None:
+        cached = (creds, google_calendar.build_service(creds))
+        google_calendar.service_cache.set(1, cached)
+    return cached[1]
+
+
+def main():
+    creds = Credentials(token="benchmark-token")
+    google_calendar.service_cache.clear()
+
+    for name, func in (("build per call", build_per_call), ("cached", cached_per_call)):
+        seconds = timeit.timeit(lambda: func(creds), number=ROUNDS)
+        print(f"{name:>15}: {seconds / ROUNDS * 1000:8.3f} ms/call")
+
+    seconds = timeit.timeit(lambda: google_calendar.build_service(creds), number=ROUNDS)
+    print(f"{'cache miss':>15}: {seconds / ROUNDS * 1000:8.3f} ms/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Page latency of offset vs cursor pagination at increasing depths
+
+Seeds BENCH_USERS users into the database at DATABASE_URL and pages through
+them the way GET /user/ does. Run from the project directory with
+`python -m benchmarks.bench_pagination`
+"""
+import asyncio
+import os
+
+from tortoise import Tortoise
+
+from app.api.user import pageinate_user
+from app.models.tortoise import User
+from app.models.utils import encode_cursor
+from benchmarks.db import fake_request, init_db, seed_users, timed
+
+USERS = int(os.environ.get("BENCH_USERS", 50_000))
+PAGE_SIZE = 20
+ROUNDS = 20
+
+
+def page(sort: str, start: int = 0, cursor: str = None):
+    params = {"_sort": sort, "_start": start, "_end": start + PAGE_SIZE}
+    if cursor is not None:
+        params["_cursor"] = cursor
+    return pageinate_user(fake_request(**params), id=None, **params)
+
+
+async def main():
+    await init_db()
+    await seed_users(USERS)
+    total = await User.all().count()
+
+    print(f"{'sort':>6} {'depth':>8} {'offset ms':>10} {'cursor ms':>10}")
+    for sort in ("id", "email"):
+        for depth in (0, 1_000, 10_000, total - PAGE_SIZE):
+            # The row just before the page, as a client holding a cursor would know it
+            before = (
+                await User.all().order_by(sort, "id").offset(max(depth - 1, 0)).first()
+            )
+            cursor = encode_cursor(getattr(before, sort), before.id)
+
+            offset = await timed(lambda: page(sort, depth).queryset, ROUNDS)
+            keyset = await timed(lambda: page(sort, depth, cursor).queryset, ROUNDS)
+            print(
+                f"{sort:>6} {depth:>8} {offset['median']:>10.2f} {keyset['median']:>10.2f}"
+            )
+
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,47 @@
+"""
+Latency of the ILIKE filters of GET /user/ vs the indexed GET /user/search
+
+Seeds BENCH_USERS users into the database at DATABASE_URL (migrated, so the
+search indexes exist) and runs the same lookups both ways. Run from the project
+directory with `python -m benchmarks.bench_search`
+"""
+import asyncio
+import os
+
+from tortoise import Tortoise
+
+from app import search
+from app.api.user import pageinate_user
+from benchmarks.db import fake_request, init_db, seed_users, timed
+
+USERS = int(os.environ.get("BENCH_USERS", 100_000))
+ROUNDS = 20
+
+# (search query, the GET /user/ filter a client had to use before)
+LOOKUPS = [
+    ("bench4242", {"first_name__icontains": "bench4242"}),
+    ("bench_user_99", {"email__icontains": "bench_user_99"}),
+    ("user777", {"first_name__icontains": "user777"}),
+]
+
+
+def filtered(filters):
+    page = {"_start": 0, "_end": 20}
+    return pageinate_user(fake_request(**filters, **page), id=None, **page)
+
+
+async def main():
+    await init_db()
+    await seed_users(USERS)
+
+    print(f"{'query':>16} {'ILIKE ms':>10} {'search ms':>10}")
+    for q, params in LOOKUPS:
+        before = await timed(lambda: filtered(params).queryset, ROUNDS)
+        after = await timed(lambda: search.search_users(q), ROUNDS)
+        print(f"{q:>16} {before['median']:>10.2f} {after['median']:>10.2f}")
+
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
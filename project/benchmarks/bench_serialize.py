@@ -0,0 +1,67 @@
+"""
+CPU time to turn a 1,000-row page into a response body, the pydantic +
+response_model + json path vs app.models.serialize
+
+Pages through the benchmark users at DATABASE_URL the way GET /user/ does.
+The rows are fetched once, only the serialization is timed. Run from the
+project directory with `python -m benchmarks.bench_serialize`
+"""
+import asyncio
+import os
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from tortoise import Tortoise
+from tortoise.contrib.pydantic.base import _get_fetch_fields
+
+from app.models.serialize import dump_list
+from app.models.tortoise import User, User_Pydnatic
+from benchmarks.db import init_db, seed_users
+
+PAGE_SIZE = int(os.environ.get("BENCH_PAGE_SIZE", 1_000))
+ROUNDS = 20
+
+
+async def pydantic_body(field, users) -> bytes:
+    # What a route returning from_orm rows with response_model=List[...] does
+    rows = [User_Pydnatic.from_orm(user) for user in users]
+    content = await serialize_response(field=field, response_content=rows)
+    return JSONResponse(content).body
+
+
+async def cpu_ms(func) -> float:
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.process_time()
+        await func()
+        samples.append((time.process_time() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+async def main():
+    await init_db()
+    await seed_users(PAGE_SIZE)
+    users = await User.all().order_by("id").limit(PAGE_SIZE)
+    await User.fetch_for_list(users, *_get_fetch_fields(User_Pydnatic, User))
+    field = create_response_field(name="Response", type_=List[User_Pydnatic])
+
+    assert await pydantic_body(field, users) == dump_list(User_Pydnatic, users)
+
+    async def fast():
+        return dump_list(User_Pydnatic, users)
+
+    before = await cpu_ms(lambda: pydantic_body(field, users))
+    after = await cpu_ms(fast)
+    print(f"{len(users)} users per page, median CPU ms per request")
+    print(f"  pydantic + response_model + json: {before:.1f}")
+    print(f"  serialize.dump_list + orjson:     {after:.1f} ({before / after:.1f}x)")
+
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
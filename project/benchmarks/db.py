@@ -0,0 +1,58 @@
+import os
+import time
+from typing import Awaitable, Callable, Dict, List
+from urllib.parse import urlencode
+
+from starlette.requests import Request
+from tortoise import Tortoise
+
+from app.db import TORTOISE_ORM
+from app.models.tortoise import User
+
+BENCH_EMAIL_DOMAIN = "bench.test"
+
+
+async def init_db() -> None:
+    """Connect to the already migrated database at DATABASE_URL (see `aerich upgrade`)"""
+    if not os.environ.get("DATABASE_URL"):
+        raise SystemExit("Set DATABASE_URL to a migrated database to run benchmarks")
+    await Tortoise.init(config=TORTOISE_ORM)
+
+
+def fake_request(**params) -> Request:
+    """A bare request carrying query params, for calling dependencies directly"""
+    return Request(
+        {"type": "http", "query_string": urlencode(params, doseq=True).encode()}
+    )
+
+
+async def seed_users(count: int) -> None:
+    """Make sure there are count benchmark users, inserted in batches"""
+    existing = await User.filter(email__endswith=f"@{BENCH_EMAIL_DOMAIN}").count()
+    batch: List[User] = []
+    for i in range(existing, count):
+        batch.append(
+            User(
+                username=f"bench{i}",
+                email=f"bench_user_{i}@{BENCH_EMAIL_DOMAIN}",
+                first_name=f"Bench{i}",
+                last_name=f"User{i}",
+                profile_url=f"https://cdn.google.com/bench_{i}.png",
+                is_tutor=i % 4 == 0,
+            )
+        )
+        if len(batch) == 1000:
+            await User.bulk_create(batch)
+            batch = []
+    await User.bulk_create(batch)
+
+
+async def timed(func: Callable[[], Awaitable], rounds: int) -> Dict[str, float]:
+    """Median and max milliseconds of rounds awaited calls"""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"median": samples[len(samples) // 2], "max": samples[-1]}
@@ -0,0 +1,221 @@
+"""
+Stand-in for the Google endpoints the app calls (token refresh and Calendar v3),
+answering after a configurable delay so load tests don't depend on Google
+
+Point the app at it with GOOGLE_TOKEN_URI=http://host:port/token and
+GOOGLE_API_ENDPOINT=http://host:port/calendar/v3/
+
+Run from the project directory with
+`python -m benchmarks.fake_google --port 8900 --latency 80 --jitter 20`
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import random
+import uuid
+from typing import Dict, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Every calendar has these bookable slots on every day, hours in UTC
+SLOT_HOURS = (15, 17, 19)
+SLOT_MINUTES = 60
+# Days of slots around today served by a calendar
+SLOT_DAYS = 60
+PAGE_SIZE = 250
+
+_calendar_ids = itertools.count(1)
+_sync_tokens = itertools.count(1)
+
+
+def _parse(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _event(calendar_id: str, start: datetime.datetime) -> Dict:
+    end = start + datetime.timedelta(minutes=SLOT_MINUTES)
+    return {
+        "kind": "calendar#event",
+        "id": "slot{:%Y%m%d%H%M}".format(start),
+        "status": "confirmed",
+        "summary": "Open slot",
+        "organizer": {"email": calendar_id},
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": end.isoformat()},
+    }
+
+
+def _slots(
+    calendar_id: str,
+    time_min: Optional[datetime.datetime],
+    time_max: Optional[datetime.datetime],
+) -> List[Dict]:
+    today = datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    events = []
+    for day in range(-SLOT_DAYS // 2, SLOT_DAYS // 2):
+        for hour in SLOT_HOURS:
+            start = today + datetime.timedelta(days=day, hours=hour)
+            end = start + datetime.timedelta(minutes=SLOT_MINUTES)
+            if time_min is not None and end <= time_min:
+                continue
+            if time_max is not None and start >= time_max:
+                continue
+            events.append(_event(calendar_id, start))
+    return events
+
+
+def _slot(calendar_id: str, event_id: str) -> Optional[Dict]:
+    try:
+        start = datetime.datetime.strptime(event_id, "slot%Y%m%d%H%M")
+    except ValueError:
+        return None
+    return _event(calendar_id, start.replace(tzinfo=datetime.timezone.utc))
+
+
+def _not_found() -> JSONResponse:
+    return JSONResponse(
+        {"error": {"code": 404, "message": "Not Found", "errors": []}}, 404
+    )
+
+
+async def token(request: Request) -> JSONResponse:
+    return JSONResponse(
+        {
+            "access_token": f"fake-{uuid.uuid4().hex}",
+            "expires_in": 3600,
+            "token_type": "Bearer",
+            "scope": "https://www.googleapis.com/auth/calendar",
+        }
+    )
+
+
+async def insert_calendar(request: Request) -> JSONResponse:
+    body = await request.json()
+    return JSONResponse({**body, "id": f"fake{next(_calendar_ids)}@fake.test"})
+
+
+async def get_calendar(request: Request) -> JSONResponse:
+    calendar_id = request.path_params["calendar_id"]
+    return JSONResponse(
+        {"id": calendar_id, "summary": "TutorApp Schedule", "timeZone": "UTC"}
+    )
+
+
+async def list_events(request: Request) -> JSONResponse:
+    calendar_id = request.path_params["calendar_id"]
+    params = request.query_params
+    if "syncToken" in params:
+        # Nothing ever changes on the fake calendars
+        events = []
+    else:
+        time_min = params.get("timeMin")
+        time_max = params.get("timeMax")
+        events = _slots(
+            calendar_id,
+            _parse(time_min) if time_min else None,
+            _parse(time_max) if time_max else None,
+        )
+    start = int(params.get("pageToken") or 0)
+    end = start + PAGE_SIZE
+    page = {"kind": "calendar#events", "items": events[start:end]}
+    if end < len(events):
+        page["nextPageToken"] = str(end)
+    else:
+        page["nextSyncToken"] = f"sync{next(_sync_tokens)}"
+    return JSONResponse(page)
+
+
+async def get_event(request: Request) -> JSONResponse:
+    event = _slot(request.path_params["calendar_id"], request.path_params["event_id"])
+    return _not_found() if event is None else JSONResponse(event)
+
+
+async def update_event(request: Request) -> JSONResponse:
+    if _slot(request.path_params["calendar_id"], request.path_params["event_id"]):
+        return JSONResponse(await request.json())
+    return _not_found()
+
+
+async def freebusy(request: Request) -> JSONResponse:
+    body = await request.json()
+    time_min, time_max = _parse(body["timeMin"]), _parse(body["timeMax"])
+    calendars = {}
+    for item in body.get("items", []):
+        # Every other slot is taken
+        busy = _slots(item["id"], time_min, time_max)[::2]
+        calendars[item["id"]] = {
+            "busy": [
+                {"start": event["start"]["dateTime"], "end": event["end"]["dateTime"]}
+                for event in busy
+            ]
+        }
+    return JSONResponse(
+        {
+            "kind": "calendar#freeBusy",
+            "timeMin": body["timeMin"],
+            "timeMax": body["timeMax"],
+            "calendars": calendars,
+        }
+    )
+
+
+def create_fake_google(latency: float = 0, jitter: float = 0) -> Starlette:
+    """
+    latency : Milliseconds every response is delayed by
+    jitter : Up to this many milliseconds more or less, uniformly distributed
+    """
+    application = Starlette(
+        routes=[
+            Route("/token", token, methods=["POST"]),
+            Route("/calendar/v3/calendars", insert_calendar, methods=["POST"]),
+            Route("/calendar/v3/calendars/{calendar_id}", get_calendar),
+            Route("/calendar/v3/calendars/{calendar_id}/events", list_events),
+            Route(
+                "/calendar/v3/calendars/{calendar_id}/events/{event_id}",
+                get_event,
+                methods=["GET"],
+            ),
+            Route(
+                "/calendar/v3/calendars/{calendar_id}/events/{event_id}",
+                update_event,
+                methods=["PUT"],
+            ),
+            Route("/calendar/v3/freeBusy", freebusy, methods=["POST"]),
+        ]
+    )
+
+    @application.middleware("http")
+    async def delay(request: Request, call_next):
+        await asyncio.sleep(max(0, latency + random.uniform(-jitter, jitter)) / 1000)
+        return await call_next(request)
+
+    return application
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=80, help="milliseconds")
+    parser.add_argument("--jitter", type=float, default=20, help="milliseconds")
+    parser.add_argument("--loop", default="auto", help="uvicorn's event loop")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_fake_google(args.latency, args.jitter),
+        host=args.host,
+        port=args.port,
+        loop=args.loop,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,624 @@
+"""
+Load test of the whole app: mixed traffic against every router, with Google
+replaced by benchmarks/fake_google.py
+
+Seeds the database at DATABASE_URL (users, categories, reviews, reports,
+sessions and tutors with calendars), boots the app and the fake Google server
+with uvicorn, drives closed-loop traffic at it from --concurrency clients and
+prints (or writes to --output) p50/p95/p99 latency and requests per second of
+every endpoint as JSON. Pass the JSON of an earlier run to --compare to see the
+change per endpoint.
+
+Login (/auth/swap, /auth/callback) isn't part of the mix, it needs Google's
+signed id tokens; the clients hold tokens issued up front instead.
+
+Run from the project directory with
+`DATABASE_URL=postgres://... python -m benchmarks.load --duration 60 --output after.json`
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+from fastapi_jwt_auth import AuthJWT
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from app.config import get_settings
+from app.models.tortoise import (
+    Category,
+    Credentials,
+    Report,
+    Review,
+    Session,
+    StudentSessions,
+    User,
+)
+from app.ratings import reconcile
+from benchmarks.db import BENCH_EMAIL_DOMAIN, init_db, seed_users
+from benchmarks.fake_google import SLOT_HOURS
+
+BENCH_PREFIX = "bench"
+ADMIN_EMAIL = f"bench_admin@admin.{BENCH_EMAIL_DOMAIN}"
+BATCH = 1000
+
+# endpoint -> share of the traffic, roughly what the frontend sends
+MIX = {
+    "GET /ping": 1,
+    "GET /auth/refresh": 2,
+    "GET /user/": 8,
+    "GET /user/me": 10,
+    "PATCH /user/me": 1,
+    "GET /user/search": 5,
+    "GET /user/{user_id}": 10,
+    "GET /user/{user_id}/schedule": 5,
+    "GET /category/": 5,
+    "GET /category/{category_id}": 4,
+    "GET /category/{category_id}/tutors": 6,
+    "GET /reviews/": 6,
+    "GET /reviews/{review_id}": 4,
+    "POST /reviews/": 1,
+    "GET /reports/": 2,
+    "POST /reports/": 1,
+    "GET /session/": 2,
+    "GET /session/{session_id}": 2,
+    "POST /session/": 0.5,
+}
+
+
+def _batches(items: List, size: int = BATCH) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        end = start + size
+        yield items[start:end]
+
+
+def _fake_creds(user_id: int) -> Dict:
+    expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    if user_id % 5 == 0:
+        # Expired, the first schedule read of the tutor refreshes it
+        expiry -= datetime.timedelta(hours=2)
+    return {
+        "token": f"fake-{user_id}",
+        "refresh_token": f"fake-refresh-{user_id}",
+        "client_id": "bench",
+        "client_secret": "bench",
+        "expiry": expiry.isoformat() + "Z",
+    }
+
+
+async def seed(args: argparse.Namespace) -> Dict[str, List]:
+    """Bring the benchmark rows up to the requested volumes, returns the ids to hit"""
+    await seed_users(args.users)
+    bench_users = User.filter(email__endswith=f"@{BENCH_EMAIL_DOMAIN}")
+    admin, _ = await User.get_or_create(
+        email=ADMIN_EMAIL,
+        defaults={
+            "username": "bench_admin",
+            "first_name": "Bench",
+            "last_name": "Admin",
+            "profile_url": "https://cdn.google.com/bench_admin.png",
+            "is_superuser": True,
+        },
+    )
+
+    existing = await Category.filter(name__startswith=BENCH_PREFIX).count()
+    await Category.bulk_create(
+        [
+            Category(name=f"{BENCH_PREFIX} category {i}")
+            for i in range(existing, args.categories)
+        ]
+    )
+    category_ids = await Category.filter(name__startswith=BENCH_PREFIX).values_list(
+        "id", flat=True
+    )
+    user_ids = await bench_users.order_by("id").values_list("id", flat=True)
+    tutor_ids = (
+        await bench_users.filter(is_tutor=True)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+    # Every tutor teaches one to three categories, picked from their id so
+    # reruns ask for the same links
+    for batch in _batches(tutor_ids):
+        wanted = {
+            user_id: {
+                category_ids[(user_id * step) % len(category_ids)]
+                for step in range(1, user_id % 3 + 2)
+            }
+            for user_id in batch
+        }
+        async with in_transaction() as connection:
+            await User.set_categories(wanted, using_db=connection)
+
+    calendar_ids = tutor_ids[: args.calendars]
+    with_creds = set(
+        await Credentials.filter(user_id__in=calendar_ids).values_list(
+            "user_id", flat=True
+        )
+    )
+    await Credentials.bulk_create(
+        [
+            Credentials(user_id=user_id, json_field=_fake_creds(user_id))
+            for user_id in calendar_ids
+            if user_id not in with_creds
+        ]
+    )
+    for user_id in await User.filter(
+        id__in=calendar_ids, google_calendar_id=None
+    ).values_list("id", flat=True):
+        await User.filter(id=user_id).update(
+            google_calendar_id=f"{BENCH_PREFIX}{user_id}@fake.test"
+        )
+
+    bench_reviews = Review.filter(content__startswith=BENCH_PREFIX)
+    missing = args.reviews - await bench_reviews.count()
+    for batch in _batches(range(max(missing, 0))):
+        await Review.bulk_create(
+            [
+                Review(
+                    reviewer_id=random.choice(user_ids),
+                    reviewee_id=random.choice(tutor_ids),
+                    rating=random.randint(1, 5),
+                    content=f"{BENCH_PREFIX} review",
+                )
+                for _ in batch
+            ]
+        )
+    if missing > 0:
+        async with in_transaction() as connection:
+            await reconcile(connection)
+
+    bench_reports = Report.filter(reason__startswith=BENCH_PREFIX)
+    missing = args.reports - await bench_reports.count()
+    await Report.bulk_create(
+        [
+            Report(
+                type=0,
+                reference_id=random.choice(user_ids),
+                user_id=random.choice(user_ids),
+                reason=f"{BENCH_PREFIX} report",
+            )
+            for _ in range(max(missing, 0))
+        ]
+    )
+
+    bench_sessions = Session.filter(event_id__startswith=BENCH_PREFIX)
+    existing = await bench_sessions.count()
+    today = datetime.datetime.now(datetime.timezone.utc)
+    for batch in _batches(range(existing, args.sessions)):
+        await Session.bulk_create(
+            [
+                Session(
+                    tutor_id=random.choice(tutor_ids),
+                    event_id=f"{BENCH_PREFIX}session{i}",
+                    start_time=today + datetime.timedelta(hours=i % 500),
+                )
+                for i in batch
+            ]
+        )
+        # bulk_create doesn't hand back the ids
+        created = await bench_sessions.filter(
+            event_id__in=[f"{BENCH_PREFIX}session{i}" for i in batch]
+        ).values_list("id", flat=True)
+        await StudentSessions.bulk_create(
+            [
+                StudentSessions(
+                    session_id=session_id,
+                    user_id=random.choice(user_ids),
+                    category_id=random.choice(category_ids),
+                )
+                for session_id in created
+            ]
+        )
+
+    sample = random.Random(0)
+    return {
+        "admin": [admin.email],
+        "users": sample.sample(user_ids, min(len(user_ids), 5000)),
+        "students": await bench_users.filter(id__in=sample.sample(user_ids, 200))
+        .order_by("id")
+        .values_list("email", flat=True),
+        "tutors": sample.sample(tutor_ids, min(len(tutor_ids), 2000)),
+        "calendars": list(calendar_ids),
+        "categories": list(category_ids),
+        "reviews": await bench_reviews.order_by("-id")
+        .limit(5000)
+        .values_list("id", flat=True),
+        "sessions": await bench_sessions.order_by("-id")
+        .limit(5000)
+        .values_list("id", flat=True),
+    }
+
+
+async def prepare(args: argparse.Namespace) -> Dict[str, List]:
+    await init_db()
+    try:
+        return await seed(args)
+    finally:
+        await Tortoise.close_connections()
+
+
+class Client:
+    """One closed-loop client: sends a request, waits for the answer, repeats"""
+
+    def __init__(
+        self,
+        base_url: str,
+        ids: Dict[str, List],
+        tokens: Dict[str, Dict],
+        seed: Optional[int] = None,
+    ):
+        self.base_url = base_url
+        self.ids = ids
+        self.tokens = tokens
+        self.http = requests.Session()
+        self.random = random.Random(seed)
+
+    def pick(self, kind: str):
+        return self.random.choice(self.ids[kind])
+
+    def student(self) -> Tuple[str, Dict[str, str]]:
+        email = self.pick("students")
+        return email, {"Authorization": f"Bearer {self.tokens['access'][email]}"}
+
+    def admin(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens['access'][ADMIN_EMAIL]}"}
+
+    def request(self, endpoint: str) -> Tuple[str, str, Dict]:
+        """The method, path and requests kwargs of a call to endpoint"""
+        method = endpoint.split()[0]
+        email, headers = self.student()
+        page = self.random.choice((0, 0, 0, 20, 40, 200))
+        listing = {"_start": page, "_end": page + 20}
+        user_id = self.pick("users")
+
+        if endpoint == "GET /ping":
+            return method, "/ping", {}
+        if endpoint == "GET /auth/refresh":
+            token = self.tokens["refresh"][email]
+            return (
+                method,
+                "/auth/refresh",
+                {"headers": {"Authorization": f"Bearer {token}"}},
+            )
+        if endpoint == "GET /user/":
+            params = dict(listing, is_tutor=self.random.choice(("true", "false")))
+            return method, "/user/", {"headers": headers, "params": params}
+        if endpoint in ("GET /user/me", "PATCH /user/me"):
+            body = {"description": f"Bench description {self.random.random()}"}
+            kwargs = {"json": body} if method == "PATCH" else {}
+            return method, "/user/me", {"headers": headers, **kwargs}
+        if endpoint == "GET /user/search":
+            params = {"q": f"Bench{self.random.randint(1, 999)}", "is_tutor": "true"}
+            return method, "/user/search", {"headers": headers, "params": params}
+        if endpoint == "GET /user/{user_id}":
+            return method, f"/user/{user_id}", {"headers": headers}
+        if endpoint == "GET /user/{user_id}/schedule":
+            start = datetime.datetime.now(datetime.timezone.utc).replace(
+                minute=0, second=0, microsecond=0
+            ) + datetime.timedelta(days=self.random.randint(0, 7))
+            params = {
+                "time_min": start.isoformat(),
+                "time_max": (start + datetime.timedelta(days=7)).isoformat(),
+            }
+            path = f"/user/{self.pick('calendars')}/schedule"
+            return method, path, {"headers": headers, "params": params}
+        if endpoint == "GET /category/":
+            return method, "/category/", {"headers": headers, "params": listing}
+        if endpoint == "GET /category/{category_id}":
+            return method, f"/category/{self.pick('categories')}", {"headers": headers}
+        if endpoint == "GET /category/{category_id}/tutors":
+            path = f"/category/{self.pick('categories')}/tutors"
+            return method, path, {"headers": headers}
+        if endpoint == "GET /reviews/":
+            params = dict(listing, reviewee_id=self.pick("tutors"))
+            return method, "/reviews/", {"headers": headers, "params": params}
+        if endpoint == "GET /reviews/{review_id}":
+            return method, f"/reviews/{self.pick('reviews')}", {"headers": headers}
+        if endpoint == "POST /reviews/":
+            body = {
+                "rating": self.random.randint(1, 5),
+                "content": f"{BENCH_PREFIX} review",
+                "reviewer_id": user_id,
+                "reviewee_id": self.pick("tutors"),
+            }
+            return method, "/reviews/", {"headers": headers, "json": body}
+        if endpoint == "GET /reports/":
+            return method, "/reports/", {"headers": self.admin(), "params": listing}
+        if endpoint == "POST /reports/":
+            body = {
+                "type": 0,
+                "reference_id": self.pick("users"),
+                "user_id": user_id,
+                "reason": f"{BENCH_PREFIX} report",
+            }
+            return method, "/reports/", {"headers": headers, "json": body}
+        if endpoint == "GET /session/":
+            return method, "/session/", {"headers": self.admin(), "params": listing}
+        if endpoint == "GET /session/{session_id}":
+            path = f"/session/{self.pick('sessions')}"
+            return method, path, {"headers": self.admin()}
+        if endpoint == "POST /session/":
+            day = datetime.date.today() + datetime.timedelta(
+                days=self.random.randint(1, 14)
+            )
+            hour = self.random.choice(SLOT_HOURS)
+            body = {
+                "tutor_id": self.pick("calendars"),
+                "event_id": f"slot{day:%Y%m%d}{hour:02d}00",
+                "category_id": self.pick("categories"),
+            }
+            return method, "/session/", {"headers": headers, "json": body}
+        raise ValueError(f"No request for {endpoint}")
+
+    def run(
+        self,
+        endpoints: List[str],
+        weights: List[float],
+        started: float,
+        warmup: float,
+        deadline: float,
+        samples: Dict[str, List[Tuple[float, int]]],
+    ) -> None:
+        """Send requests until the deadline, recording the ones after the warmup"""
+        while True:
+            endpoint = self.random.choices(endpoints, weights)[0]
+            method, path, kwargs = self.request(endpoint)
+            start = time.perf_counter()
+            if start >= deadline:
+                return
+            try:
+                status = self.http.request(
+                    method, self.base_url + path, timeout=30, **kwargs
+                ).status_code
+            except requests.RequestException:
+                status = 0
+            if start - started >= warmup:
+                samples[endpoint].append((time.perf_counter() - start, status))
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    # Nearest rank
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(
+    samples: Dict[str, List[Tuple[float, int]]], seconds: float
+) -> Dict[str, Dict]:
+    def stats(recorded: List[Tuple[float, int]]) -> Dict:
+        latencies = sorted(latency * 1000 for latency, _ in recorded)
+        errors = sum(1 for _, status in recorded if status == 0 or status >= 500)
+        return {
+            "count": len(recorded),
+            "errors": errors,
+            "rps": round(len(recorded) / seconds, 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            "p50_ms": round(_percentile(latencies, 0.50), 2),
+            "p95_ms": round(_percentile(latencies, 0.95), 2),
+            "p99_ms": round(_percentile(latencies, 0.99), 2),
+            "statuses": {
+                str(status): sum(1 for _, other in recorded if other == status)
+                for status in sorted({status for _, status in recorded})
+            },
+        }
+
+    endpoints = {
+        endpoint: stats(recorded)
+        for endpoint, recorded in sorted(samples.items())
+        if recorded
+    }
+    everything = [sample for recorded in samples.values() for sample in recorded]
+    return {"endpoints": endpoints, "total": stats(everything) if everything else {}}
+
+
+def issue_tokens(emails: List[str]) -> Dict[str, Dict[str, str]]:
+    AuthJWT.load_config(get_settings)
+    authorize = AuthJWT()
+    return {
+        "access": {
+            email: authorize.create_access_token(subject=email) for email in emails
+        },
+        "refresh": {
+            email: authorize.create_refresh_token(subject=email) for email in emails
+        },
+    }
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(
+                f"{' '.join(process.args)} exited with {process.returncode}"
+            )
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up in {timeout}s")
+
+
+@contextmanager
+def servers(args: argparse.Namespace) -> Iterator[str]:
+    """Run the fake Google server and the app, yields the app's base URL"""
+    if args.url:
+        yield args.url.rstrip("/")
+        return
+
+    google_url = f"http://127.0.0.1:{args.google_port}"
+    env = dict(
+        os.environ,
+        GOOGLE_API_ENDPOINT=f"{google_url}/calendar/v3/",
+        GOOGLE_TOKEN_URI=f"{google_url}/token",
+        # The fake server speaks plain http
+        OAUTHLIB_INSECURE_TRANSPORT="1",
+    )
+    python = [sys.executable, "-W", "ignore", "-m"]
+    fake_google = [
+        "benchmarks.fake_google",
+        f"--port={args.google_port}",
+        f"--latency={args.google_latency}",
+        f"--jitter={args.google_jitter}",
+        f"--loop={args.loop}",
+    ]
+    uvicorn = [
+        "uvicorn",
+        "app.main:app",
+        f"--port={args.port}",
+        f"--workers={args.workers}",
+        f"--loop={args.loop}",
+        "--log-level=warning",
+        "--no-access-log",
+    ]
+    processes = [subprocess.Popen(python + fake_google)]
+    try:
+        _wait_until_up(f"{google_url}/calendar/v3/calendars/up", processes[0])
+        processes.append(subprocess.Popen(python + uvicorn, env=env))
+        app_url = f"http://127.0.0.1:{args.port}"
+        _wait_until_up(f"{app_url}/ping", processes[1])
+        yield app_url
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+def run_load(
+    base_url: str, ids: Dict[str, List], args: argparse.Namespace
+) -> Dict[str, Dict]:
+    tokens = issue_tokens(ids["students"] + ids["admin"])
+    endpoints = [endpoint for endpoint in MIX if MIX[endpoint] > 0]
+    weights = [MIX[endpoint] for endpoint in endpoints]
+    samples: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+
+    started = time.perf_counter()
+    deadline = started + args.warmup + args.duration
+    threads = [
+        threading.Thread(
+            target=Client(
+                base_url, ids, tokens, None if args.seed is None else args.seed + i
+            ).run,
+            args=(endpoints, weights, started, args.warmup, deadline, samples),
+        )
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Requests in flight at the deadline finish after it, count them in
+    return summarize(samples, time.perf_counter() - started - args.warmup)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before: Dict, after: Dict) -> str:
+    """A table of how every endpoint's latency and throughput moved between runs"""
+    columns = ("p50_ms", "p95_ms", "p99_ms", "rps")
+    header = "".join(f"{column:>22}" for column in columns)
+    revisions = f"{before.get('revision')} -> {after.get('revision')}"
+    lines = [f"{'endpoint':<36}{header}   ({revisions})"]
+    rows: List[Tuple[str, Optional[Dict], Optional[Dict]]] = [
+        (endpoint, before["endpoints"].get(endpoint), stats)
+        for endpoint, stats in after["endpoints"].items()
+    ]
+    rows.append(("total", before.get("total"), after.get("total")))
+    for endpoint, old, new in rows:
+        if not old or not new:
+            continue
+        cells = []
+        for column in columns:
+            change = (
+                (new[column] - old[column]) / old[column] * 100 if old[column] else 0
+            )
+            cells.append(f"{old[column]:>8.1f} ->{new[column]:>8.1f} {change:+4.0f}%")
+        lines.append(f"{endpoint:<36}" + "".join(f"{cell:>22}" for cell in cells))
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    volumes = parser.add_argument_group("seeded volumes")
+    volumes.add_argument("--users", type=int, default=20_000)
+    volumes.add_argument("--categories", type=int, default=50)
+    volumes.add_argument("--reviews", type=int, default=50_000)
+    volumes.add_argument("--reports", type=int, default=2_000)
+    volumes.add_argument("--sessions", type=int, default=5_000)
+    volumes.add_argument(
+        "--calendars", type=int, default=500, help="tutors with a Google calendar"
+    )
+    load = parser.add_argument_group("load")
+    load.add_argument("--duration", type=float, default=30, help="seconds measured")
+    load.add_argument("--warmup", type=float, default=5, help="seconds not measured")
+    load.add_argument("--concurrency", type=int, default=16, help="parallel clients")
+    load.add_argument("--seed", type=int, default=None, help="of the request mix")
+    server = parser.add_argument_group("servers")
+    server.add_argument("--url", help="load an already running app instead")
+    server.add_argument("--port", type=int, default=8800)
+    server.add_argument("--workers", type=int, default=1)
+    server.add_argument("--loop", default="auto", help="uvicorn's event loop")
+    server.add_argument("--google-port", type=int, default=8900)
+    server.add_argument(
+        "--google-latency", type=float, default=80, help="milliseconds per call"
+    )
+    server.add_argument("--google-jitter", type=float, default=20, help="milliseconds")
+    output = parser.add_argument_group("output")
+    output.add_argument("--output", help="write the results JSON here")
+    output.add_argument("--compare", help="results JSON of an earlier run")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    ids = asyncio.run(prepare(args))
+
+    with servers(args) as base_url:
+        results = run_load(base_url, ids, args)
+
+    report = {
+        "revision": _git_revision(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {
+            name: value
+            for name, value in vars(args).items()
+            if name not in ("output", "compare")
+        },
+        **results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as previous:
+            print(compare(json.load(previous), report), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
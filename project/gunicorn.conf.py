@@ -0,0 +1,29 @@
+"""
+Read by gunicorn from the working directory
+
+Gives the workers a shared PROMETHEUS_MULTIPROC_DIR, so GET /metrics adds up the
+samples of all of them (see app/metrics.py), and tells them how many they are
+"""
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "app-metrics")
+)
+
+
+def on_starting(server):
+    # Samples left behind by an earlier run would be added to this one's
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    # The workers are forked after this, the per-process caches read it
+    os.environ["WEB_CONCURRENCY"] = str(server.cfg.workers)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    # Drops the gauges of the dead worker from the live sums
+    multiprocess.mark_process_dead(worker.pid)
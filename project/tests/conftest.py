@@ -1,16 +1,25 @@
+import asyncio
 import os
 import warnings
-from typing import Dict
+from contextlib import contextmanager
+from typing import Callable, ContextManager, Dict, List
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 import pytest
 from fastapi_jwt_auth import AuthJWT
 from starlette.testclient import TestClient
-from tortoise.contrib.test import finalizer, initializer
+from tortoise import Tortoise
+from tortoise.contrib.test import getDBConfig
+from tortoise.exceptions import DBConnectionError
 
+from app import google_calendar, schedule
+from app.api.user import user_cache
 from app.config import Settings, get_settings
+from app.directory import tutor_directory
 from app.main import create_application  # updated
+from app.metrics import capture_queries
+from app.response_cache import response_cache
 from tests.utils.user import auth_normal_user, auth_super_user, auth_tutor_user
 
 
@@ -18,18 +27,38 @@ def get_settings_override():
     return Settings(testing=1, database_url=os.environ.get("DATABASE_TEST_URL"))
 
 
+async def _create_db() -> None:
+    # tortoise's initializer() generates the schema with safe=False, which fails on
+    # the tables the through models share with their many to many fields
+    config = getDBConfig(app_label="models", modules=["app.models.tortoise"])
+    try:
+        await Tortoise.init(config)
+        await Tortoise._drop_databases()
+    except DBConnectionError:
+        pass
+    await Tortoise.init(config, _create_db=True)
+    await Tortoise.generate_schemas(safe=True)
+
+
 @pytest.fixture(scope="module")
 def test_app():
     # set up
     app = create_application()  # new
     app.dependency_overrides[get_settings] = get_settings_override
-    initializer(["app.models.tortoise"])
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(_create_db())
+    # Every module gets a fresh database, so nothing cached may outlive it
+    user_cache.clear()
+    google_calendar.service_cache.clear()
+    schedule.schedule_cache.clear()
+    tutor_directory.clear()
     with TestClient(app) as test_client:
+        test_client.task.get_loop().run_until_complete(response_cache.clear())
 
         # testing
         yield test_client
-    finalizer()
     # tear down
+    loop.run_until_complete(Tortoise._drop_databases())
 
 
 @pytest.fixture(scope="module")
@@ -55,3 +84,21 @@ def super_user_token_headers(authorization: AuthJWT, event_loop) -> Dict[str, st
 @pytest.fixture(scope="module")
 def tutor_user_token_headers(authorization: AuthJWT, event_loop) -> Dict[str, str]:
     return auth_tutor_user(authorization, event_loop)
+
+
+@pytest.fixture
+def max_queries() -> Callable[[int], ContextManager[List[str]]]:
+    """
+    with max_queries(3): fails the test when the block sends more than 3 queries,
+    listing the ones it sent
+    """
+
+    @contextmanager
+    def assert_max_queries(limit: int):
+        with capture_queries() as queries:
+            yield queries
+        assert len(queries) <= limit, "{} queries, expected at most {}:\n{}".format(
+            len(queries), limit, "\n".join(queries)
+        )
+
+    return assert_max_queries
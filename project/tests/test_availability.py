@@ -0,0 +1,157 @@
+import datetime
+
+import pytest
+from fastapi import HTTPException
+from tortoise.transactions import in_transaction
+
+from app import availability
+from app.models.tortoise import Category, User
+from tests.utils.calendar import FakeCalendarService
+from tests.utils.user import _create_user
+
+TUTORS = 60
+START = datetime.datetime(2026, 10, 20, 14, tzinfo=datetime.timezone.utc)
+END = START + datetime.timedelta(hours=2)
+WINDOW = {"time_min": START.isoformat(), "time_max": END.isoformat()}
+
+
+def _busy(i: int):
+    # A third is busy all along, half of the others the first hour
+    if i % 3 == 0:
+        return [{"start": START.isoformat(), "end": END.isoformat()}]
+    if i % 2 == 0:
+        hour = START + datetime.timedelta(hours=1)
+        return [{"start": START.isoformat(), "end": hour.isoformat()}]
+    return []
+
+
+@pytest.fixture(scope="module")
+def tutors(test_app, event_loop):
+    async def seed():
+        category = await Category.create(name="availability")
+        ids = []
+        for i in range(TUTORS + 2):
+            user = _create_user(f"free{i}", "tutor")
+            # The last two aren't searched: no calendar, not a tutor
+            user.is_tutor = i != TUTORS + 1
+            user.google_calendar_id = None if i == TUTORS else f"cal{i}"
+            await user.save()
+            ids.append(user.id)
+        async with in_transaction(User._meta.default_connection) as connection:
+            await User.set_categories(
+                {user_id: [category.id] for user_id in ids}, using_db=connection
+            )
+        return category.id, ids[:TUTORS]
+
+    return event_loop.run_until_complete(seed())
+
+
+@pytest.fixture
+def calendars(monkeypatch, tutors):
+    # Every service only sees the calendar of its user, so the user searching sees
+    # none of them. The last tutor's calendar is gone from their account
+    _, ids = tutors
+    services = {user_id: FakeCalendarService() for user_id in ids}
+    for i, user_id in enumerate(ids[:-1]):
+        services[user_id].busy = {f"cal{i}": _busy(i)}
+
+    async def fake_calendar_service(self):
+        service = services.setdefault(self.id, FakeCalendarService())
+        if service is None:
+            raise HTTPException(403, "No Google credentials, sign in with Google")
+        return service
+
+    monkeypatch.setattr(User, "get_calendar_service", fake_calendar_service)
+    availability.busy_cache.clear()
+    return services
+
+
+def _calls(services):
+    return sum(len(service.freebusy_calls) for service in services.values())
+
+
+def _search(test_app, headers, category_id, **params):
+    return test_app.get(
+        f"/category/{category_id}/availability",
+        headers=headers,
+        params={**WINDOW, **params},
+    )
+
+
+def test_calendars_are_asked_with_their_tutors_credentials(
+    test_app, tutors, calendars, normal_user_token_headers
+):
+    category_id, ids = tutors
+    r = _search(test_app, normal_user_token_headers, category_id, duration=60)
+    assert r.status_code == 200
+
+    for i, user_id in enumerate(ids):
+        assert calendars[user_id].freebusy_calls == [[f"cal{i}"]]
+    assert _calls(calendars) == TUTORS
+    body = r.json()
+    assert body["unknown"] == [ids[-1]]
+    expected = [ids[i] for i in range(TUTORS - 1) if i % 3 != 0]
+    assert [tutor["id"] for tutor in body["tutors"]] == expected
+    half_free = body["tutors"][1]
+    assert half_free["id"] == ids[2]
+    assert half_free["free"] == [
+        {"start": "2026-10-20T15:00:00+00:00", "end": "2026-10-20T16:00:00+00:00"}
+    ]
+
+
+def test_whole_window_by_default(
+    test_app, tutors, calendars, normal_user_token_headers
+):
+    category_id, ids = tutors
+    r = _search(test_app, normal_user_token_headers, category_id)
+
+    expected = [ids[i] for i in range(TUTORS - 1) if i % 3 != 0 and i % 2 != 0]
+    assert [tutor["id"] for tutor in r.json()["tutors"]] == expected
+
+
+def test_busy_times_are_cached(test_app, tutors, calendars, normal_user_token_headers):
+    category_id, ids = tutors
+    first = _search(test_app, normal_user_token_headers, category_id).json()
+    calls = _calls(calendars)
+
+    assert _search(test_app, normal_user_token_headers, category_id).json() == first
+    # Only the calendar Google didn't answer for is asked again
+    assert _calls(calendars) == calls + 1
+    assert len(calendars[ids[-1]].freebusy_calls) == 2
+
+    later = {"time_min": END.isoformat(), "time_max": (END + (END - START)).isoformat()}
+    _search(test_app, normal_user_token_headers, category_id, **later)
+    assert _calls(calendars) == calls + 1 + TUTORS
+
+
+def test_failed_tutors_are_unknown(
+    test_app, tutors, calendars, normal_user_token_headers
+):
+    category_id, ids = tutors
+    calendars[ids[1]].failures = [503]
+    # Signed out of Google
+    calendars[ids[2]] = None
+    r = _search(test_app, normal_user_token_headers, category_id)
+
+    assert r.status_code == 200
+    assert r.json()["unknown"] == [ids[1], ids[2], ids[-1]]
+
+
+def test_bad_searches(test_app, tutors, calendars, normal_user_token_headers):
+    category_id, _ = tutors
+    r = _search(test_app, normal_user_token_headers, 999999)
+    assert r.status_code == 404
+
+    inverted = {"time_min": END.isoformat(), "time_max": START.isoformat()}
+    r = _search(test_app, normal_user_token_headers, category_id, **inverted)
+    assert r.status_code == 400
+
+
+def test_free_intervals():
+    hour = datetime.timedelta(hours=1)
+    busy = [(START + hour, START + 2 * hour), (START - hour, START + hour / 2)]
+    assert availability.free_intervals(busy, START, START + 3 * hour) == [
+        (START + hour / 2, START + hour),
+        (START + 2 * hour, START + 3 * hour),
+    ]
+    assert availability.free_intervals([(START, END)], START, END) == []
@@ -0,0 +1,228 @@
+import datetime
+
+import pytest
+
+from app import booking
+from app.config import get_settings
+from app.models.tortoise import CalendarOutbox, CalendarSync, Category, Session, User
+from tests.utils.calendar import FakeCalendarService, fake_event
+
+START = datetime.datetime(2026, 10, 20, 15, tzinfo=datetime.timezone.utc)
+
+
+def _sync(event_loop):
+    # Bookings are checked against the synced copy of the tutor's calendar
+    async def sync():
+        tutor = await User.get(email="tutor_user@southwestern.edu")
+        await CalendarSync.filter(user_id=tutor.id).delete()
+        await tutor.sync_calendar()
+
+    event_loop.run_until_complete(sync())
+
+
+@pytest.fixture
+def calendar(monkeypatch, booked, event_loop):
+    service = FakeCalendarService()
+    for event_id in ("a", "b", "c", "d", "e"):
+        end = START + datetime.timedelta(hours=1)
+        service.change(fake_event(event_id, START.isoformat(), end.isoformat()))
+
+    async def fake_calendar_service(self):
+        return service
+
+    monkeypatch.setattr(User, "get_calendar_service", fake_calendar_service)
+    _sync(event_loop)
+    return service
+
+
+@pytest.fixture(scope="module")
+def booked(test_app, tutor_user_token_headers, event_loop):
+    async def setup():
+        tutor = await User.get(email="tutor_user@southwestern.edu")
+        tutor.google_calendar_id = "fake-calendar"
+        await tutor.save()
+        category = await Category.create(name="booking")
+        return {"tutor_id": tutor.id, "category_id": category.id}
+
+    return event_loop.run_until_complete(setup())
+
+
+def _book(test_app, booked, event_id, headers):
+    r = test_app.post(
+        "/session/", headers=headers, json={**booked, "event_id": event_id}
+    )
+    assert r.status_code == 202
+    return r.json()
+
+
+def _status(test_app, session_id, headers):
+    r = test_app.get(f"/session/{session_id}/booking", headers=headers)
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_booking_is_confirmed_by_the_worker(
+    test_app, booked, calendar, normal_user_token_headers, event_loop
+):
+    session = _book(test_app, booked, "a", normal_user_token_headers)
+    # Nothing went to Google yet
+    assert "attendees" not in calendar.items["a"]
+    # Looked up when the booking was taken
+    assert session["start_time"] == START.isoformat()
+    assert [s["status"] for s in session["studentsessions"]] == ["pending"]
+    assert _status(test_app, session["id"], normal_user_token_headers) == {
+        "session_id": session["id"],
+        "status": "pending",
+        "attempts": 0,
+        "error": None,
+    }
+
+    assert event_loop.run_until_complete(booking.drain()) == 1
+
+    assert _status(test_app, session["id"], normal_user_token_headers)["status"] == (
+        "confirmed"
+    )
+    assert calendar.items["a"]["attendees"] == [{"email": "test_user@southwestern.edu"}]
+    assert calendar.items["a"]["summary"] == "[SU Guidance] Session"
+    stored = event_loop.run_until_complete(Session.get(id=session["id"]))
+    assert stored.start_time == START
+    # Nothing left to push
+    assert event_loop.run_until_complete(booking.drain()) == 0
+
+
+def test_bookings_of_a_session_are_pushed_together(
+    test_app,
+    booked,
+    calendar,
+    normal_user_token_headers,
+    super_user_token_headers,
+    event_loop,
+):
+    session = _book(test_app, booked, "b", normal_user_token_headers)
+    _book(test_app, booked, "b", super_user_token_headers)
+    # Booking twice doesn't book twice
+    again = _book(test_app, booked, "b", normal_user_token_headers)
+    assert len(again["studentsessions"]) == 2
+
+    assert event_loop.run_until_complete(booking.drain()) == 1
+
+    assert len(calendar.items["b"]["attendees"]) == 2
+    for headers in (normal_user_token_headers, super_user_token_headers):
+        assert _status(test_app, session["id"], headers)["status"] == "confirmed"
+
+
+def test_failed_push_is_retried(
+    test_app, booked, calendar, normal_user_token_headers, event_loop, monkeypatch
+):
+    session = _book(test_app, booked, "c", normal_user_token_headers)
+    calendar.failures = [503]
+
+    assert event_loop.run_until_complete(booking.drain()) == 1
+    status = _status(test_app, session["id"], normal_user_token_headers)
+    assert status["status"] == "pending"
+    assert status["attempts"] == 1
+    assert "HttpError" in status["error"]
+    # Backing off, not due yet
+    assert event_loop.run_until_complete(booking.drain()) == 0
+
+    monkeypatch.setattr(get_settings(), "booking_retry_delay", 0)
+    event_loop.run_until_complete(
+        CalendarOutbox.filter(session_id=session["id"]).update(
+            next_attempt_at=datetime.datetime.now(datetime.timezone.utc)
+        )
+    )
+    assert event_loop.run_until_complete(booking.drain()) == 1
+    status = _status(test_app, session["id"], normal_user_token_headers)
+    assert status == {
+        "session_id": session["id"],
+        "status": "confirmed",
+        "attempts": 0,
+        "error": None,
+    }
+
+
+def test_booking_fails_after_max_attempts(
+    test_app, booked, calendar, normal_user_token_headers, event_loop, monkeypatch
+):
+    monkeypatch.setattr(get_settings(), "booking_retry_delay", 0)
+    monkeypatch.setattr(get_settings(), "booking_max_attempts", 3)
+    session = _book(test_app, booked, "d", normal_user_token_headers)
+    calendar.failures = [500] * 3
+
+    assert event_loop.run_until_complete(booking.drain()) == 3
+    status = _status(test_app, session["id"], normal_user_token_headers)
+    assert status["status"] == "failed"
+    assert status["attempts"] == 3
+    assert "attendees" not in calendar.items["d"]
+
+    # Booking again starts over
+    session = _book(test_app, booked, "d", normal_user_token_headers)
+    assert [s["status"] for s in session["studentsessions"]] == ["pending"]
+    assert event_loop.run_until_complete(booking.drain()) == 1
+    status = _status(test_app, session["id"], normal_user_token_headers)
+    assert status["status"] == "confirmed"
+
+
+def test_missing_event_is_not_booked(
+    test_app, booked, calendar, normal_user_token_headers, event_loop
+):
+    r = test_app.post(
+        "/session/",
+        headers=normal_user_token_headers,
+        json={**booked, "event_id": "missing"},
+    )
+    assert r.status_code == 404
+    assert not event_loop.run_until_complete(
+        Session.filter(event_id="missing").exists()
+    )
+
+    # Only the synced copy is asked, not Google
+    end = START + datetime.timedelta(hours=1)
+    calendar.change(fake_event("unsynced", START.isoformat(), end.isoformat()))
+    r = test_app.post(
+        "/session/",
+        headers=normal_user_token_headers,
+        json={**booked, "event_id": "unsynced"},
+    )
+    assert r.status_code == 404
+
+    # Not in Google's calendar any more either
+    calendar.cancel("c")
+    _sync(event_loop)
+    r = test_app.post(
+        "/session/", headers=normal_user_token_headers, json={**booked, "event_id": "c"}
+    )
+    assert r.status_code == 404
+
+
+def test_event_deleted_after_booking_fails_at_once(
+    test_app, booked, calendar, normal_user_token_headers, event_loop
+):
+    end = START + datetime.timedelta(hours=1)
+    calendar.change(fake_event("deleted", START.isoformat(), end.isoformat()))
+    _sync(event_loop)
+    session = _book(test_app, booked, "deleted", normal_user_token_headers)
+    del calendar.items["deleted"]
+
+    assert event_loop.run_until_complete(booking.drain()) == 1
+    assert _status(test_app, session["id"], normal_user_token_headers)["status"] == (
+        "failed"
+    )
+
+
+def test_claimed_rows_are_left_to_their_worker(
+    test_app, booked, calendar, normal_user_token_headers, event_loop
+):
+    _book(test_app, booked, "e", normal_user_token_headers)
+
+    claimed = event_loop.run_until_complete(booking.claim())
+    assert claimed is not None
+    assert event_loop.run_until_complete(booking.claim()) is None
+
+    event_loop.run_until_complete(booking.push(claimed))
+    assert calendar.items["e"]["attendees"]
+
+
+def test_unknown_booking_is_not_found(test_app, booked, normal_user_token_headers):
+    r = test_app.get("/session/999999/booking", headers=normal_user_token_headers)
+    assert r.status_code == 404
@@ -0,0 +1,147 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+from fastapi import HTTPException
+from google.oauth2.credentials import Credentials as Creds
+
+from app import google_calendar
+from app.api.ping import pong
+from app.api.user import get_user_schedule
+from app.config import get_settings
+from app.models.tortoise import Credentials, User
+from tests.utils.calendar import FakeCalendarService, FakeRequest, fake_event
+
+CALENDAR_DELAY = 0.5
+
+
+async def _ping_latency() -> float:
+    start = time.perf_counter()
+    await pong(get_settings())
+    # Yield once so the measurement includes getting scheduled again
+    await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+def test_ping_not_blocked_by_schedule_calls(
+    test_app, tutor_user_token_headers, event_loop, monkeypatch
+):
+    service = FakeCalendarService(
+        [fake_event("1", "2021-04-13T10:00:00-05:00", "2021-04-13T11:00:00-05:00")],
+        delay=CALENDAR_DELAY,
+    )
+
+    async def fake_calendar_service(self):
+        return service
+
+    monkeypatch.setattr(User, "get_calendar_service", fake_calendar_service)
+
+    async def scenario():
+        tutor = await User.get(email="tutor_user@southwestern.edu")
+        tutor.google_calendar_id = "fake-calendar"
+        await tutor.save()
+
+        idle = await _ping_latency()
+        schedule_calls = [
+            asyncio.ensure_future(
+                get_user_schedule(
+                    tutor.id,
+                    current_user=tutor,
+                    time_min=datetime.datetime(2021, 4, 13),
+                    time_max=datetime.datetime(2021, 4, 14),
+                )
+            )
+            for _ in range(4)
+        ]
+        # Give the schedule calls time to reach the slow calendar
+        await asyncio.sleep(0.05)
+        busy = await _ping_latency()
+        schedules = await asyncio.gather(*schedule_calls)
+        return idle, busy, schedules
+
+    idle, busy, schedules = event_loop.run_until_complete(scenario())
+
+    assert busy < CALENDAR_DELAY / 5
+    assert busy < idle + 0.05
+    for schedule in schedules:
+        assert [event["id"] for event in schedule] == ["1"]
+
+
+def test_calendar_call_times_out(test_app, event_loop):
+    with pytest.raises(HTTPException) as exc_info:
+        event_loop.run_until_complete(
+            google_calendar.execute(FakeRequest({}, delay=0.5), timeout=0.05)
+        )
+    assert exc_info.value.status_code == 504
+
+
+async def _store_tutor_creds(expiry: str) -> User:
+    tutor = await User.get(email="tutor_user@southwestern.edu")
+    creds, _ = await Credentials.get_or_create(user=tutor)
+    creds.json_field = {
+        "token": "access-token",
+        "refresh_token": "refresh-token",
+        "client_id": "client-id",
+        "client_secret": "client-secret",
+        "expiry": expiry,
+    }
+    await creds.save()
+    return tutor
+
+
+def test_calendar_service_is_reused(test_app, tutor_user_token_headers, event_loop):
+    async def scenario():
+        tutor = await _store_tutor_creds("2999-01-01T00:00:00Z")
+        google_calendar.service_cache.invalidate(tutor.id)
+        first = await tutor.get_calendar_service()
+        # A fresh instance has no creds loaded, so a hit must come from the cache
+        second = await (await User.get(id=tutor.id)).get_calendar_service()
+        return first, second
+
+    first, second = event_loop.run_until_complete(scenario())
+    assert first is second
+
+
+def test_concurrent_token_refreshes_are_coalesced(
+    test_app, tutor_user_token_headers, event_loop, monkeypatch
+):
+    def slow_refresh(self, request):
+        time.sleep(0.1)
+        self.token = "refreshed-token"
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+    monkeypatch.setattr(Creds, "refresh", slow_refresh)
+    stats = google_calendar.stats()
+
+    async def scenario():
+        tutor = await _store_tutor_creds("2000-01-01T00:00:00Z")
+        google_calendar.service_cache.invalidate(tutor.id)
+        services = await asyncio.gather(
+            *[(await User.get(id=tutor.id)).get_calendar_service() for _ in range(5)]
+        )
+        creds = await Credentials.get(user_id=tutor.id)
+        return services, creds
+
+    services, creds = event_loop.run_until_complete(scenario())
+
+    assert all(service is services[0] for service in services)
+    assert creds.json_field["token"] == "refreshed-token"
+    after = google_calendar.stats()
+    assert after["refreshes_performed"] == stats["refreshes_performed"] + 1
+    assert after["refreshes_coalesced"] == stats["refreshes_coalesced"] + 4
+
+
+def test_unchanged_token_is_not_written(test_app, tutor_user_token_headers, event_loop):
+    stats = google_calendar.stats()
+
+    async def scenario():
+        tutor = await _store_tutor_creds("2999-01-01T00:00:00Z")
+        google_calendar.service_cache.invalidate(tutor.id)
+        await tutor.get_calendar_service()
+
+    event_loop.run_until_complete(scenario())
+
+    after = google_calendar.stats()
+    assert after["writes_skipped"] == stats["writes_skipped"] + 1
+    assert after["refreshes_performed"] == stats["refreshes_performed"]
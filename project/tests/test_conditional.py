@@ -0,0 +1,220 @@
+from app.metrics import capture_queries
+from app.models.tortoise import Category, Review
+from app.models.utils import invalidate_counts
+from app.response_cache import response_cache
+from tests.utils.user import _create_user
+
+
+def _seed(event_loop):
+    async def seed():
+        await Category.filter(name__startswith="etag_").delete()
+        for i in range(3):
+            await Category.create(name=f"etag_{i}")
+        invalidate_counts(Category)
+        await response_cache.invalidate(Category)
+
+    event_loop.run_until_complete(seed())
+
+
+def test_list_not_modified(test_app, normal_user_token_headers, event_loop):
+    _seed(event_loop)
+    path = "/category/?name__icontains=etag_"
+    r = test_app.get(path, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert "Last-Modified" in r.headers
+
+    r = test_app.get(path, headers={**normal_user_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["ETag"] == etag
+
+    # Another filter set is another representation
+    r = test_app.get(
+        f"{path}&_end=1", headers={**normal_user_token_headers, "If-None-Match": etag}
+    )
+    assert r.status_code == 200
+
+
+def test_list_changes_with_writes(
+    test_app, normal_user_token_headers, super_user_token_headers, event_loop
+):
+    _seed(event_loop)
+    path = "/category/?name__icontains=etag_"
+    etags = [test_app.get(path, headers=normal_user_token_headers).headers["ETag"]]
+
+    category_id = test_app.get(path, headers=normal_user_token_headers).json()[0]["id"]
+    r = test_app.put(
+        f"/category/{category_id}",
+        json={"name": "etag_renamed"},
+        headers=super_user_token_headers,
+    )
+    assert r.status_code == 200
+    etags.append(test_app.get(path, headers=normal_user_token_headers).headers["ETag"])
+
+    r = test_app.delete(
+        f"/category/?category_id={category_id}", headers=super_user_token_headers
+    )
+    assert r.status_code == 200
+    etags.append(test_app.get(path, headers=normal_user_token_headers).headers["ETag"])
+
+    assert len(set(etags)) == 3
+    r = test_app.get(
+        path, headers={**normal_user_token_headers, "If-None-Match": etags[0]}
+    )
+    assert r.status_code == 200
+    assert len(r.json()) == 2
+
+
+def test_detail_not_modified(test_app, normal_user_token_headers, event_loop):
+    _seed(event_loop)
+    category_id = test_app.get(
+        "/category/?name__icontains=etag_", headers=normal_user_token_headers
+    ).json()[0]["id"]
+    path = f"/category/{category_id}"
+    r = test_app.get(path, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    etag, last_modified = r.headers["ETag"], r.headers["Last-Modified"]
+
+    r = test_app.get(path, headers={**normal_user_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+
+    r = test_app.get(
+        path, headers={**normal_user_token_headers, "If-Modified-Since": last_modified}
+    )
+    assert r.status_code == 304
+    r = test_app.get(
+        path,
+        headers={
+            **normal_user_token_headers,
+            "If-Modified-Since": "Sat, 01 Jan 2000 00:00:00 GMT",
+        },
+    )
+    assert r.status_code == 200
+
+    # A sparse fieldset is another representation
+    r = test_app.get(
+        f"{path}?_fields=name",
+        headers={**normal_user_token_headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+
+
+def test_cached_count_is_not_counted_again(
+    test_app, normal_user_token_headers, event_loop
+):
+    _seed(event_loop)
+    path = "/category/?name__icontains=etag_"
+    test_app.get(path, headers=normal_user_token_headers)
+    event_loop.run_until_complete(response_cache.clear())
+
+    with capture_queries() as queries:
+        r = test_app.get(path, headers=normal_user_token_headers)
+    assert r.headers["X-Total-Count"] == "3"
+    assert [query for query in queries if "COUNT(" in query] == []
+
+
+def test_nested_writes_change_validators(
+    test_app, normal_user_token_headers, event_loop
+):
+    async def seed():
+        reviewer = _create_user("etag", "reviewer")
+        await reviewer.save()
+        reviewee = _create_user("etag", "reviewee")
+        await reviewee.save()
+        review = await Review.create(
+            reviewer=reviewer, reviewee=reviewee, rating=5, content="etag"
+        )
+        return reviewer, review.id
+
+    reviewer, review_id = event_loop.run_until_complete(seed())
+    paths = [f"/reviews/?reviewee_id={reviewer.id + 1}", f"/reviews/{review_id}"]
+    etags = [
+        test_app.get(path, headers=normal_user_token_headers).headers["ETag"]
+        for path in paths
+    ]
+
+    # Renamed in another process, nothing of this one's caches knows
+    reviewer.first_name = "renamed"
+    event_loop.run_until_complete(reviewer.save())
+    event_loop.run_until_complete(response_cache.clear())
+
+    for path, etag in zip(paths, etags):
+        r = test_app.get(
+            path, headers={**normal_user_token_headers, "If-None-Match": etag}
+        )
+        assert r.status_code == 200, path
+        assert "renamed" in r.text
+
+
+def test_category_changes_change_user_validators(
+    test_app, normal_user_token_headers, super_user_token_headers, event_loop
+):
+    async def seed():
+        user = _create_user("etag", "categories")
+        await user.save()
+        categories = [await Category.create(name=f"etag_user_{i}") for i in range(2)]
+        return user.id, [category.id for category in categories]
+
+    user_id, category_ids = event_loop.run_until_complete(seed())
+    path = f"/user/{user_id}"
+
+    def revalidate(etag):
+        r = test_app.get(
+            path, headers={**normal_user_token_headers, "If-None-Match": etag}
+        )
+        assert r.status_code == 200
+        return r
+
+    # Only the categories change
+    first = test_app.get(path, headers=normal_user_token_headers)
+    user = {**first.json(), "categories_ids": category_ids[:1]}
+    r = test_app.put(path, json=user, headers=super_user_token_headers)
+    assert r.status_code == 200
+    second = revalidate(first.headers["ETag"])
+    assert second.json()["categories_ids"] == category_ids[:1]
+
+    changes = [{"id": user_id, "categories_ids": category_ids}]
+    r = test_app.patch("/user/", json=changes, headers=super_user_token_headers)
+    assert r.status_code == 200
+    third = revalidate(second.headers["ETag"])
+    assert third.json()["categories_ids"] == category_ids
+
+    # Deleted in another process, nothing of this one's caches knows
+    event_loop.run_until_complete(Category.filter(id=category_ids[0]).delete())
+    event_loop.run_until_complete(response_cache.clear())
+    r = revalidate(third.headers["ETag"])
+    assert r.json()["categories_ids"] == category_ids[1:]
+
+
+def test_review_deletes_change_user_list_validators(
+    test_app, normal_user_token_headers, event_loop
+):
+    async def seed():
+        reviewee = _create_user("etag", "reviewed")
+        await reviewee.save()
+        reviews = []
+        for name in ("first", "second"):
+            reviewer = _create_user("etag", name)
+            await reviewer.save()
+            review = await Review.create(
+                reviewer=reviewer, reviewee=reviewee, rating=1, content="etag"
+            )
+            reviews.append(review.id)
+        return reviewee.id, reviews
+
+    reviewee_id, review_ids = event_loop.run_until_complete(seed())
+    path = f"/user/?id={reviewee_id}"
+    r = test_app.get(path, headers=normal_user_token_headers)
+    assert len(r.json()[0]["reviews"]) == 2
+
+    # The older one, the latest updated_at stays the same
+    event_loop.run_until_complete(Review.filter(id=review_ids[0]).delete())
+    event_loop.run_until_complete(response_cache.clear())
+    r = test_app.get(
+        path, headers={**normal_user_token_headers, "If-None-Match": r.headers["ETag"]}
+    )
+    assert r.status_code == 200
+    assert [review["id"] for review in r.json()[0]["reviews"]] == review_ids[1:]
@@ -0,0 +1,81 @@
+import pytest
+
+from app.models.tortoise import Category
+from tests.utils.user import _create_user
+
+
+@pytest.fixture(scope="module")
+def subjects(test_app, event_loop):
+    async def seed():
+        physics = await Category.create(name="Physics")
+        chemistry = await Category.create(name="Chemistry")
+        tutor = _create_user("marie", "curie")
+        tutor.is_tutor = True
+        tutor.google_calendar_id = "fake-calendar"
+        await tutor.save()
+        await tutor.categories.add(physics)
+        return physics, chemistry, tutor
+
+    return event_loop.run_until_complete(seed())
+
+
+def _tutors(test_app, headers, category):
+    r = test_app.get(f"/category/{category.id}/tutors", headers=headers)
+    assert r.status_code == 200
+    return r.json()["tutor_ids"]
+
+
+def test_directory_lists_tutors(test_app, normal_user_token_headers, subjects):
+    physics, chemistry, tutor = subjects
+    assert _tutors(test_app, normal_user_token_headers, physics) == [tutor.id]
+    assert _tutors(test_app, normal_user_token_headers, chemistry) == []
+
+    r = test_app.get("/category/999999/tutors", headers=normal_user_token_headers)
+    assert r.status_code == 404
+
+
+def test_directory_etag(test_app, normal_user_token_headers, subjects):
+    physics, chemistry, tutor = subjects
+    r = test_app.get(
+        f"/category/{physics.id}/tutors", headers=normal_user_token_headers
+    )
+    etag = r.headers["ETag"]
+
+    r = test_app.get(
+        f"/category/{physics.id}/tutors",
+        headers={**normal_user_token_headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 304
+    assert r.content == b""
+
+
+def test_directory_follows_user_updates(
+    test_app, normal_user_token_headers, super_user_token_headers, subjects
+):
+    physics, chemistry, tutor = subjects
+    r = test_app.get(
+        f"/category/{physics.id}/tutors", headers=normal_user_token_headers
+    )
+    etag = r.headers["ETag"]
+
+    r = test_app.put(
+        f"/user/{tutor.id}",
+        json={
+            "email": tutor.email,
+            "first_name": tutor.first_name,
+            "last_name": tutor.last_name,
+            "profile_url": tutor.profile_url,
+            "is_tutor": True,
+            "categories_ids": [chemistry.id],
+        },
+        headers=super_user_token_headers,
+    )
+    assert r.status_code == 200
+    assert _tutors(test_app, normal_user_token_headers, physics) == []
+    assert _tutors(test_app, normal_user_token_headers, chemistry) == [tutor.id]
+
+    r = test_app.get(
+        f"/category/{physics.id}/tutors",
+        headers={**normal_user_token_headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 200
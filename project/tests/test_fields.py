@@ -0,0 +1,90 @@
+import datetime
+
+import pytest
+
+from app.models.tortoise import Category, Review, Session, StudentSessions
+from tests.utils.user import _create_user
+
+
+@pytest.fixture(scope="module")
+def rows(test_app, event_loop):
+    async def seed():
+        music = await Category.create(name="music")
+        tutor = _create_user("ada", "tutor")
+        tutor.is_tutor = True
+        await tutor.save()
+        await tutor.categories.add(music)
+        student = _create_user("bo", "student")
+        await student.save()
+        await Review.create(reviewer=student, reviewee=tutor, rating=5, content="ok")
+        session = await Session.create(
+            tutor=tutor,
+            event_id="event",
+            start_time=datetime.datetime(2026, 10, 18, 9, tzinfo=datetime.timezone.utc),
+        )
+        await StudentSessions.create(session=session, category=music, user=student)
+
+    event_loop.run_until_complete(seed())
+
+
+@pytest.mark.parametrize(
+    "path, fields",
+    [
+        # Only stored fields, exact count
+        ("/reviews/", "rating,id,content"),
+        # Only stored fields, cached count
+        ("/user/", "email,id"),
+        # A computed field
+        ("/user/", "id,categories_ids"),
+        # A relation
+        ("/session/", "studentsessions,id"),
+        ("/session/", "start_time,student_ids"),
+    ],
+)
+def test_sparse_pages_match_full_pages(
+    test_app, super_user_token_headers, rows, path, fields
+):
+    full = test_app.get(path, headers=super_user_token_headers)
+    r = test_app.get(f"{path}?_fields={fields}", headers=super_user_token_headers)
+    assert r.status_code == 200
+    assert r.headers["X-Total-Count"] == full.headers["X-Total-Count"]
+
+    wanted = fields.split(",")
+    expected = [{name: row[name] for name in wanted} for row in full.json()]
+    # Keys keep the order of the full response
+    assert [list(row) for row in r.json()] == [
+        [name for name in row if name in wanted] for row in full.json()
+    ]
+    assert r.json() == expected
+
+
+def test_sparse_cursor_pages(test_app, super_user_token_headers, rows):
+    r = test_app.get("/user/?_end=1&_fields=email", headers=super_user_token_headers)
+    assert r.status_code == 200
+    assert list(r.json()[0]) == ["email"]
+    cursor = r.headers["X-Next-Cursor"]
+
+    r = test_app.get(
+        f"/user/?_end=1&_fields=email&_cursor={cursor}",
+        headers=super_user_token_headers,
+    )
+    full = test_app.get("/user/?_start=1&_end=2", headers=super_user_token_headers)
+    assert r.json() == [{"email": full.json()[0]["email"]}]
+
+
+def test_sparse_detail(test_app, super_user_token_headers, rows):
+    full = test_app.get("/user/2", headers=super_user_token_headers).json()
+
+    r = test_app.get("/user/2?_fields=email,id", headers=super_user_token_headers)
+    assert r.status_code == 200
+    assert r.json() == {"id": full["id"], "email": full["email"]}
+
+    r = test_app.get("/user/2?_fields=categories_ids", headers=super_user_token_headers)
+    assert r.json() == {"categories_ids": full["categories_ids"]}
+
+
+def test_unknown_fields(test_app, super_user_token_headers):
+    r = test_app.get("/user/?_fields=id,password", headers=super_user_token_headers)
+    assert r.status_code == 400
+    r = test_app.get("/user/1?_fields=password", headers=super_user_token_headers)
+    assert r.status_code == 400
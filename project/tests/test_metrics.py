@@ -0,0 +1,68 @@
+from prometheus_client import REGISTRY
+
+from app import google_calendar
+from tests.utils.calendar import FakeRequest
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_endpoint(test_app):
+    test_app.get("/ping")
+    r = test_app.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/ping",status="200"}' in r.text
+    assert "http_request_duration_seconds_bucket" in r.text
+
+
+def test_requests_are_labelled_by_route(test_app, normal_user_token_headers):
+    user_labels = {"method": "GET", "route": "/user/{user_id}", "status": "200"}
+    before = _sample("http_requests_total", **user_labels)
+    unmatched_labels = {"method": "GET", "route": "unmatched", "status": "404"}
+    unmatched = _sample("http_requests_total", **unmatched_labels)
+
+    me = test_app.get("/user/me", headers=normal_user_token_headers).json()
+    test_app.get(f"/user/{me['id']}", headers=normal_user_token_headers)
+    test_app.get("/no/such/path")
+
+    assert _sample("http_requests_total", **user_labels) == before + 1
+    assert _sample("http_requests_total", **unmatched_labels) == unmatched + 1
+
+
+def test_queries_are_counted_per_request(test_app, normal_user_token_headers):
+    queries = _sample("db_queries_total")
+    count = _sample("db_queries_per_request_count", route="/user/me")
+    total = _sample("db_queries_per_request_sum", route="/user/me")
+
+    r = test_app.patch(
+        "/user/me", headers=normal_user_token_headers, json={"description": "metrics"}
+    )
+    assert r.status_code == 200
+
+    assert _sample("db_queries_per_request_count", route="/user/me") == count + 1
+    # The update and reading the user back at least
+    per_request = _sample("db_queries_per_request_sum", route="/user/me") - total
+    assert per_request >= 2
+    assert _sample("db_queries_total") - queries >= per_request
+    assert _sample("db_time_per_request_seconds_count", route="/user/me") > 0
+
+
+def test_google_calls_are_counted(event_loop):
+    ok_labels = {"method": "unknown", "status": "ok"}
+    missing_labels = {"method": "unknown", "status": "404"}
+    ok = _sample("google_api_requests_total", **ok_labels)
+    missing = _sample("google_api_requests_total", **missing_labels)
+
+    event_loop.run_until_complete(google_calendar.execute(FakeRequest({"id": "a"})))
+    try:
+        event_loop.run_until_complete(
+            google_calendar.execute(FakeRequest({}, status=404))
+        )
+    except Exception:
+        pass
+
+    assert _sample("google_api_requests_total", **ok_labels) == ok + 1
+    assert _sample("google_api_requests_total", **missing_labels) == missing + 1
+    assert _sample("google_api_requests_in_flight") == 0
@@ -0,0 +1,167 @@
+import pytest
+
+from app.models.tortoise import Report, ReportType, User
+from app.models.utils import encode_cursor
+from tests.utils.user import _create_user
+
+TARGETS = 12
+
+
+@pytest.fixture(scope="module")
+def reports(test_app, event_loop):
+    async def seed():
+        reporters = []
+        for i in range(4):
+            user = _create_user(f"reporter{i}", "moderation")
+            await user.save()
+            reporters.append(user)
+        # Groups get reported again after others, so the queue order isn't the
+        # order they were first reported in
+        for round in range(3):
+            for target in range(TARGETS):
+                if target % 3 < round:
+                    continue
+                await Report.create(
+                    type=ReportType.user,
+                    reference_id=1000 + target,
+                    user=reporters[(target + round) % 4],
+                    reason=f"reason {target}-{round}",
+                )
+        # The same reference_id reports another review than user
+        for round in range(2):
+            await Report.create(
+                type=ReportType.review,
+                reference_id=1000,
+                user=reporters[round],
+                reason=f"review {round}",
+            )
+
+        expected = {}
+        for report in await Report.all().order_by("id"):
+            key = (report.type, report.reference_id)
+            group = expected.setdefault(
+                key,
+                {
+                    "type": report.type,
+                    "reference_id": report.reference_id,
+                    "reports": 0,
+                    "first_reported_at": report.created_at,
+                },
+            )
+            group["reports"] += 1
+            group["latest_report_id"] = report.id
+            group["latest_reason"] = report.reason
+            group["last_reported_at"] = report.created_at
+        return sorted(
+            expected.values(), key=lambda group: group["latest_report_id"], reverse=True
+        )
+
+    return event_loop.run_until_complete(seed())
+
+
+def _queue(test_app, headers, **params):
+    r = test_app.get("/reports/queue", headers=headers, params=params)
+    assert r.status_code == 200
+    return r
+
+
+def _summary(groups):
+    return [
+        (group["type"], group["reference_id"], group["reports"], group["latest_reason"])
+        for group in groups
+    ]
+
+
+def test_reports_are_grouped_by_what_they_report(
+    test_app, reports, super_user_token_headers
+):
+    r = _queue(test_app, super_user_token_headers, limit=100)
+    groups = r.json()
+    assert "X-Next-Cursor" not in r.headers
+    assert _summary(groups) == _summary(reports)
+    assert groups[0] == {
+        "type": ReportType.review,
+        "reference_id": 1000,
+        "reports": 2,
+        "latest_report_id": reports[0]["latest_report_id"],
+        "latest_reason": "review 1",
+        "first_reported_at": reports[0]["first_reported_at"].isoformat(),
+        "last_reported_at": reports[0]["last_reported_at"].isoformat(),
+    }
+    # Reported in every round
+    assert (ReportType.user, 1002, 3, "reason 2-2") in _summary(groups)
+
+
+def test_queue_is_paged_by_keyset(test_app, reports, super_user_token_headers):
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 5} if cursor is None else {"limit": 5, "_cursor": cursor}
+        r = _queue(test_app, super_user_token_headers, **params)
+        pages.append(r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [5, 5, 3]
+    assert _summary(sum(pages, [])) == _summary(reports)
+
+
+def test_queue_of_one_type(test_app, reports, super_user_token_headers):
+    groups = _queue(test_app, super_user_token_headers, type=0, limit=100).json()
+    assert _summary(groups) == _summary(reports[1:])
+
+
+def test_queue_is_for_superusers(
+    test_app, reports, normal_user_token_headers, super_user_token_headers
+):
+    r = test_app.get("/reports/queue", headers=normal_user_token_headers)
+    assert r.status_code == 403
+
+    r = test_app.get(
+        "/reports/queue",
+        headers=super_user_token_headers,
+        params={"_cursor": encode_cursor(None, "1")},
+    )
+    assert r.status_code == 400
+
+
+def test_pages_after_the_first_skip_later_reports(
+    test_app, reports, super_user_token_headers, event_loop
+):
+    r = _queue(test_app, super_user_token_headers, limit=5)
+    pages = [r.json()]
+    cursor = r.headers["X-Next-Cursor"]
+
+    # One group of the next page is reported again, another is reported first
+    again = reports[7]
+    reporter = event_loop.run_until_complete(
+        User.get(email="test_user@southwestern.edu")
+    )
+    later = [
+        event_loop.run_until_complete(
+            Report.create(
+                type=group["type"],
+                reference_id=group["reference_id"],
+                user=reporter,
+                reason="later",
+            )
+        )
+        for group in (again, {"type": ReportType.user, "reference_id": 2000})
+    ]
+    try:
+        while cursor is not None:
+            r = _queue(test_app, super_user_token_headers, limit=5, _cursor=cursor)
+            pages.append(r.json())
+            cursor = r.headers.get("X-Next-Cursor")
+        # Nothing moved or went missing
+        assert _summary(sum(pages, [])) == _summary(reports)
+
+        first = _queue(test_app, super_user_token_headers, limit=5).json()
+        assert _summary(first[:2]) == [
+            (ReportType.user, 2000, 1, "later"),
+            (again["type"], again["reference_id"], again["reports"] + 1, "later"),
+        ]
+    finally:
+        event_loop.run_until_complete(
+            Report.filter(id__in=[report.id for report in later]).delete()
+        )
@@ -0,0 +1,141 @@
+from app.models.tortoise import Category
+from app.models.utils import invalidate_counts
+from app.response_cache import response_cache
+from tests.utils.user import _create_user
+
+
+def _seed_categories(event_loop):
+    async def seed():
+        await Category.filter(name__startswith="page_").delete()
+        # Repeated `locked` values make the sort column ambiguous without the id
+        for i in range(25):
+            await Category.create(name=f"page_{i:02d}", locked=i % 3 == 0)
+        invalidate_counts(Category)
+        await response_cache.invalidate(Category)
+
+    event_loop.run_until_complete(seed())
+
+
+def test_cursor_pages_match_offset_pages(
+    test_app, normal_user_token_headers, event_loop
+):
+    _seed_categories(event_loop)
+    params = "name__icontains=page_&_sort=locked&_order=desc"
+
+    r = test_app.get(
+        f"/category/?{params}&_start=0&_end=25", headers=normal_user_token_headers
+    )
+    expected = [category["id"] for category in r.json()]
+
+    seen = []
+    r = test_app.get(
+        f"/category/?{params}&_start=0&_end=10", headers=normal_user_token_headers
+    )
+    while True:
+        assert r.status_code == 200
+        seen.extend(category["id"] for category in r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        r = test_app.get(
+            f"/category/?{params}&_start=0&_end=10&_cursor={cursor}",
+            headers=normal_user_token_headers,
+        )
+
+    assert seen == expected
+
+
+def test_last_page_has_no_cursor(test_app, normal_user_token_headers, event_loop):
+    _seed_categories(event_loop)
+    r = test_app.get(
+        "/category/?name__icontains=page_&_start=20&_end=40",
+        headers=normal_user_token_headers,
+    )
+    assert len(r.json()) == 5
+    assert "X-Next-Cursor" not in r.headers
+
+
+def test_invalid_cursor(test_app, normal_user_token_headers):
+    r = test_app.get(
+        "/category/?_cursor=not-a-cursor", headers=normal_user_token_headers
+    )
+    assert r.status_code == 400
+
+
+def test_total_count_is_the_filtered_total(
+    test_app, normal_user_token_headers, event_loop
+):
+    _seed_categories(event_loop)
+    # Past the first page, where counting the limited queryset used to come up short
+    r = test_app.get(
+        "/category/?name__icontains=page_&_start=10&_end=20",
+        headers=normal_user_token_headers,
+    )
+    assert len(r.json()) == 10
+    assert r.headers["X-Total-Count"] == "25"
+
+
+def test_exact_count_past_the_last_page(test_app, normal_user_token_headers):
+    r = test_app.get(
+        "/reviews/?_start=1000&_end=1010", headers=normal_user_token_headers
+    )
+    assert r.json() == []
+    total = int(r.headers["X-Total-Count"])
+
+    r = test_app.get(
+        f"/reviews/?_start=0&_end={total + 1}", headers=normal_user_token_headers
+    )
+    assert len(r.json()) == total
+
+
+def test_cached_count_invalidated_by_writes(
+    test_app, normal_user_token_headers, super_user_token_headers, event_loop
+):
+    _seed_categories(event_loop)
+    params = "name__icontains=page_&_start=0&_end=5"
+    r = test_app.get(f"/category/?{params}", headers=normal_user_token_headers)
+    assert r.headers["X-Total-Count"] == "25"
+
+    r = test_app.post(
+        "/category/", json={"name": "page_25"}, headers=super_user_token_headers
+    )
+    assert r.status_code == 200
+
+    r = test_app.get(f"/category/?{params}", headers=normal_user_token_headers)
+    assert r.headers["X-Total-Count"] == "26"
+
+
+def test_cursor_pages_over_nulls(test_app, normal_user_token_headers, event_loop):
+    async def seed():
+        for i in range(12):
+            user = _create_user(f"nullpage{i:02d}", "user")
+            # NULLs among repeated values
+            user.google_calendar_id = None if i % 3 == 0 else f"cal{i % 4}"
+            await user.save()
+
+    event_loop.run_until_complete(seed())
+    for order in ("asc", "desc"):
+        params = (
+            f"first_name__icontains=nullpage&_sort=google_calendar_id&_order={order}"
+        )
+        r = test_app.get(
+            f"/user/?{params}&_start=0&_end=12", headers=normal_user_token_headers
+        )
+        expected = [user["id"] for user in r.json()]
+        assert len(expected) == 12
+
+        seen = []
+        r = test_app.get(
+            f"/user/?{params}&_start=0&_end=5", headers=normal_user_token_headers
+        )
+        while True:
+            seen.extend(user["id"] for user in r.json())
+            cursor = r.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            r = test_app.get(
+                f"/user/?{params}&_start=0&_end=5&_cursor={cursor}",
+                headers=normal_user_token_headers,
+            )
+
+        assert seen == expected, order
@@ -0,0 +1,132 @@
+import datetime
+
+import pytest
+
+from app.models.tortoise import (
+    Category,
+    Report,
+    ReportType,
+    Review,
+    Session,
+    StudentSessions,
+)
+from app.models.utils import encode_cursor
+from app.response_cache import response_cache
+from tests.utils.user import _create_user
+
+ROWS = 12
+
+
+@pytest.fixture(scope="module")
+def rows(test_app, event_loop):
+    async def seed():
+        categories = [await Category.create(name=f"subject {i}") for i in range(ROWS)]
+        users = []
+        for i in range(ROWS):
+            user = _create_user(f"query{i}", "user")
+            user.is_tutor = i % 2 == 0
+            await user.save()
+            await user.categories.add(*categories[: i % 3 + 1])
+            users.append(user)
+        for i, user in enumerate(users):
+            reviewee = users[(i + 1) % ROWS]
+            await Review.create(
+                reviewer=user, reviewee=reviewee, rating=4, content="ok"
+            )
+            await Report.create(
+                type=ReportType.user, reference_id=reviewee.id, user=user, reason="spam"
+            )
+            session = await Session.create(
+                tutor=reviewee,
+                event_id=f"event{i}",
+                start_time=datetime.datetime(
+                    2026, 10, 18, tzinfo=datetime.timezone.utc
+                ),
+            )
+            students = users[i:][:2]
+            for student in students:
+                await StudentSessions.create(
+                    session=session, category=categories[0], user=student
+                )
+        # So Postgres has the estimate /session/ counts with
+        db = Session._meta.db
+        if db.capabilities.dialect == "postgres":
+            await db.execute_script('ANALYZE "session"')
+        await response_cache.clear()
+
+    event_loop.run_until_complete(seed())
+
+
+# Every list endpoint with the number of queries any page of it sends. The
+# validator (lists with an ETag), the page, then one query per relation shown
+LISTS = [
+    ("/user/", 6),
+    ("/user/?_fields=id,categories_ids", 3),
+    (f"/user/?_cursor={encode_cursor(0, 0)}", 6),
+    ("/category/", 2),
+    ("/reviews/", 8),
+    ("/reports/", 6),
+    # No ETag but an estimated count, the students for student_ids
+    ("/session/", 10),
+    ("/session/?_fields=id,tutor_id,student_ids", 3),
+]
+
+
+@pytest.mark.parametrize("path, queries", LISTS)
+def test_list_queries_dont_grow_with_page_size(
+    test_app, rows, super_user_token_headers, max_queries, event_loop, path, queries
+):
+    separator = "&" if "?" in path else "?"
+
+    def get_page(size: int):
+        # Every page size is a new cache key anyway, this keeps the pages of
+        # earlier tests out of the way
+        event_loop.run_until_complete(response_cache.clear())
+        r = test_app.get(
+            f"{path}{separator}_start=0&_end={size}", headers=super_user_token_headers
+        )
+        assert r.status_code == 200
+        assert len(r.json()) == size
+
+    # Fills the caches in front of the database (user, counts...)
+    get_page(ROWS)
+    counts = []
+    for size in (1, 4, ROWS):
+        with max_queries(queries) as sent:
+            get_page(size)
+        counts.append(len(sent))
+    assert counts == [queries] * 3
+
+
+def test_search_queries_dont_grow_with_results(
+    test_app, rows, normal_user_token_headers, max_queries
+):
+    # Puts the user of the token in the user cache, and looks up pg_trgm once
+    test_app.get("/user/me", headers=normal_user_token_headers)
+    test_app.get("/user/search?q=query", headers=normal_user_token_headers)
+    counts = []
+    for limit in (1, 4, ROWS):
+        with max_queries(5) as sent:
+            r = test_app.get(
+                f"/user/search?q=query&limit={limit}", headers=normal_user_token_headers
+            )
+        assert len(r.json()) == limit
+        counts.append(len(sent))
+    assert len(set(counts)) == 1, counts
+
+
+def test_session_detail_fetches_students_itself(
+    test_app, rows, super_user_token_headers, max_queries, event_loop
+):
+    session = event_loop.run_until_complete(Session.get(event_id="event0"))
+    event_loop.run_until_complete(response_cache.clear())
+    with max_queries(9):
+        r = test_app.get(f"/session/{session.id}", headers=super_user_token_headers)
+    assert len(r.json()["student_ids"]) == 2
+
+    with max_queries(2):
+        r = test_app.get(
+            f"/session/{session.id}?_fields=student_ids",
+            headers=super_user_token_headers,
+        )
+    assert len(r.json()["student_ids"]) == 2
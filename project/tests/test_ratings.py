@@ -0,0 +1,100 @@
+import pytest
+
+from app import ratings
+from app.models.tortoise import User
+from tests.utils.user import _create_user
+
+
+@pytest.fixture(scope="module")
+def tutors(test_app, event_loop):
+    async def seed():
+        people = [_create_user(name, "rated") for name in ("ann", "bob", "cat")]
+        for user in people:
+            await user.save()
+        return people
+
+    return event_loop.run_until_complete(seed())
+
+
+def _review(test_app, reviewer, reviewee, rating):
+    r = test_app.post(
+        "/reviews/",
+        json={
+            "reviewer_id": reviewer.id,
+            "reviewee_id": reviewee.id,
+            "rating": rating,
+            "content": "Great session",
+        },
+    )
+    assert r.status_code == 200
+    return r.json()["id"]
+
+
+def _ratings(test_app, headers, user):
+    r = test_app.get(f"/user/{user.id}", headers=headers)
+    return {field: r.json()[field] for field in ratings.RATING_FIELDS}
+
+
+def test_review_writes_update_aggregates(
+    test_app, normal_user_token_headers, super_user_token_headers, tutors
+):
+    ann, bob, cat = tutors
+    _review(test_app, bob, ann, 5)
+    review_id = _review(test_app, cat, ann, 2)
+    assert _ratings(test_app, normal_user_token_headers, ann) == {
+        "rating_count": 2,
+        "rating_sum": 7,
+        "rating_avg": 3.5,
+        "rating_histogram": {"5": 1, "2": 1},
+    }
+
+    # Moving the review to another reviewee updates both of them
+    r = test_app.put(
+        f"/reviews/{review_id}",
+        json={"reviewer_id": cat.id, "reviewee_id": bob.id, "rating": 4, "content": ""},
+        headers=super_user_token_headers,
+    )
+    assert r.status_code == 200
+    assert _ratings(test_app, normal_user_token_headers, ann)["rating_histogram"] == {
+        "5": 1
+    }
+    assert _ratings(test_app, normal_user_token_headers, bob)["rating_avg"] == 4
+
+    r = test_app.delete(f"/reviews/{review_id}", headers=super_user_token_headers)
+    assert r.status_code == 200
+    assert _ratings(test_app, normal_user_token_headers, bob) == {
+        "rating_count": 0,
+        "rating_sum": 0,
+        "rating_avg": 0,
+        "rating_histogram": {},
+    }
+
+
+def test_sort_by_rating_avg(test_app, normal_user_token_headers, tutors):
+    r = test_app.get(
+        "/user/?_sort=rating_avg&_order=desc",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 200
+    averages = [user["rating_avg"] for user in r.json()]
+    assert averages == sorted(averages, reverse=True)
+
+
+def test_reconcile_rebuilds_aggregates(
+    test_app, normal_user_token_headers, tutors, event_loop
+):
+    ann, bob, cat = tutors
+    expected = _ratings(test_app, normal_user_token_headers, ann)
+
+    event_loop.run_until_complete(
+        User.filter(id__in=[ann.id, cat.id]).update(rating_count=9, rating_sum=1)
+    )
+    assert event_loop.run_until_complete(ratings.reconcile()) == 2
+    assert _ratings(test_app, normal_user_token_headers, ann) == expected
+    assert _ratings(test_app, normal_user_token_headers, cat)["rating_count"] == 0
+
+
+def test_histograms_are_not_shared():
+    first, second = User(), User()
+    first.rating_histogram["5"] = 1
+    assert second.rating_histogram == {}
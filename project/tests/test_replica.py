@@ -0,0 +1,79 @@
+import pytest
+from tortoise import Tortoise
+
+from app.config import get_settings
+from app.db import connection_config, recent_writers
+from app.models.tortoise import Category
+from app.response_cache import response_cache
+
+
+class RecordingReplica:
+    """The primary connection, counting the queries sent through it as the replica"""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self.queries = 0
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    async def execute_select(self, *args, **kwargs):
+        self.queries += 1
+        return await self._connection.execute_select(*args, **kwargs)
+
+    async def execute_query_dict(self, *args, **kwargs):
+        self.queries += 1
+        return await self._connection.execute_query_dict(*args, **kwargs)
+
+    async def execute_query(self, *args, **kwargs):
+        self.queries += 1
+        return await self._connection.execute_query(*args, **kwargs)
+
+
+@pytest.fixture
+def replica(test_app, event_loop):
+    replica = RecordingReplica(Category._meta.db)
+    Tortoise._connections["replica"] = replica
+    event_loop.run_until_complete(response_cache.clear())
+    yield replica
+    del Tortoise._connections["replica"]
+    recent_writers.clear()
+
+
+def test_reads_go_to_replica(test_app, normal_user_token_headers, replica):
+    r = test_app.get("/category/", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert replica.queries > 0
+
+    before = replica.queries
+    r = test_app.get("/user/1", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert replica.queries > before
+
+
+def test_writers_read_from_primary(
+    test_app, normal_user_token_headers, super_user_token_headers, replica
+):
+    r = test_app.post(
+        "/category/", json={"name": "sticky"}, headers=super_user_token_headers
+    )
+    assert r.status_code == 200
+    r = test_app.get(f"/category/{r.json()['id']}", headers=super_user_token_headers)
+    assert r.json()["name"] == "sticky"
+    assert replica.queries == 0
+
+    # Other clients still read from the replica
+    test_app.get("/category/", headers=normal_user_token_headers)
+    assert replica.queries > 0
+
+
+def test_pool_settings():
+    settings = get_settings()
+    config = connection_config("postgres://app:secret@db:5432/tutor?maxsize=20")
+    credentials = config["credentials"]
+    assert credentials["minsize"] == settings.db_pool_min_size
+    assert credentials["maxsize"] == "20"
+    assert credentials["command_timeout"] == settings.db_command_timeout
+    assert credentials["statement_cache_size"] == settings.db_statement_cache_size
+
+    assert connection_config("sqlite://:memory:") == "sqlite://:memory:"
@@ -0,0 +1,97 @@
+from app.models.tortoise import Category, User
+from app.response_cache import CachedResponse, MemoryBackend, ResponseCache
+
+
+def _stats(test_app, headers):
+    return test_app.get("/user/cache/stats", headers=headers).json()["responses"]
+
+
+def test_reads_are_served_from_cache(
+    test_app, normal_user_token_headers, super_user_token_headers, event_loop
+):
+    category = event_loop.run_until_complete(Category.create(name="cached"))
+    path = f"/category/{category.id}"
+    before = _stats(test_app, super_user_token_headers)
+
+    first = test_app.get(path, headers=normal_user_token_headers)
+    second = test_app.get(path, headers=normal_user_token_headers)
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["ETag"] == first.headers["ETag"]
+    # Superusers have their own entry
+    test_app.get(path, headers=super_user_token_headers)
+
+    after = _stats(test_app, super_user_token_headers)
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 2
+
+    r = test_app.get(
+        path,
+        headers={**normal_user_token_headers, "If-None-Match": first.headers["ETag"]},
+    )
+    assert r.status_code == 304
+
+
+def test_writes_invalidate(
+    test_app, normal_user_token_headers, super_user_token_headers, event_loop
+):
+    category = event_loop.run_until_complete(Category.create(name="before"))
+    detail = f"/category/{category.id}"
+    listing = "/category/?name__icontains=before"
+    assert test_app.get(detail, headers=normal_user_token_headers).json()["name"] == (
+        "before"
+    )
+    assert len(test_app.get(listing, headers=normal_user_token_headers).json()) == 1
+
+    r = test_app.put(detail, json={"name": "after"}, headers=super_user_token_headers)
+    assert r.status_code == 200
+
+    assert test_app.get(detail, headers=normal_user_token_headers).json()["name"] == (
+        "after"
+    )
+    assert test_app.get(listing, headers=normal_user_token_headers).json() == []
+
+
+def test_invalidate_by_tag(event_loop):
+    cache = ResponseCache(MemoryBackend(maxsize=10, ttl=60))
+
+    async def run():
+        for key, tags in [
+            ("user list", {"user", "category"}),
+            ("user 1", {"user:1", "category"}),
+            ("user 2", {"user:2", "category"}),
+            ("review list", {"review", "user"}),
+        ]:
+            await cache.backend.set(key, CachedResponse(b"", {}, frozenset(tags)))
+        dropped = await cache.invalidate(User, 1)
+        left = [
+            key
+            for key in ("user list", "user 1", "user 2", "review list")
+            if await cache.backend.get(key) is not None
+        ]
+        return dropped, left
+
+    dropped, left = event_loop.run_until_complete(run())
+    # Reviews embed their users, so the review list goes as well
+    assert dropped == 3
+    assert left == ["user 2"]
+
+
+def test_conditional_reads_skip_process_cache(
+    test_app, normal_user_token_headers, event_loop
+):
+    category = event_loop.run_until_complete(Category.create(name="elsewhere"))
+    path = f"/category/{category.id}"
+    first = test_app.get(path, headers=normal_user_token_headers)
+    assert first.status_code == 200
+
+    # A write through another worker, this process' entry isn't dropped
+    category.name = "changed"
+    event_loop.run_until_complete(category.save())
+
+    r = test_app.get(
+        path,
+        headers={**normal_user_token_headers, "If-None-Match": first.headers["ETag"]},
+    )
+    assert r.status_code == 200
+    assert r.json()["name"] == "changed"
@@ -0,0 +1,205 @@
+import asyncio
+import datetime
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app import schedule
+from app.config import get_settings
+from app.metrics import capture_queries
+from app.models.tortoise import CalendarEvent, CalendarSync, User, calendar_syncs
+from tests.utils.calendar import FakeCalendarService, fake_event
+
+NOW = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+
+def _event(event_id: str, hours_from_now: int):
+    start = NOW + datetime.timedelta(hours=hours_from_now)
+    end = start + datetime.timedelta(hours=1)
+    return fake_event(event_id, start.isoformat(), end.isoformat())
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    service = FakeCalendarService()
+
+    async def fake_calendar_service(self):
+        return service
+
+    monkeypatch.setattr(User, "get_calendar_service", fake_calendar_service)
+    monkeypatch.setattr(get_settings(), "calendar_sync_interval", 0)
+    return service
+
+
+@pytest.fixture
+def tutor(test_app, tutor_user_token_headers, event_loop):
+    async def reset_tutor():
+        tutor = await User.get(email="tutor_user@southwestern.edu")
+        tutor.google_calendar_id = "fake-calendar"
+        await tutor.save()
+        await CalendarEvent.filter(tutor_id=tutor.id).delete()
+        await CalendarSync.filter(user_id=tutor.id).delete()
+        return tutor
+
+    return event_loop.run_until_complete(reset_tutor())
+
+
+def _schedule_ids(event_loop, tutor):
+    events = event_loop.run_until_complete(
+        tutor.get_events(NOW, NOW + datetime.timedelta(days=7))
+    )
+    return [event["id"] for event in events]
+
+
+def test_schedule_pulls_only_changes(calendar, tutor, event_loop):
+    calendar.change(_event("a", 1))
+    calendar.change(_event("b", 2))
+    assert _schedule_ids(event_loop, tutor) == ["a", "b"]
+
+    calendar.cancel("a")
+    calendar.change(_event("c", 3))
+    assert _schedule_ids(event_loop, tutor) == ["b", "c"]
+
+    sync = event_loop.run_until_complete(CalendarSync.get(user_id=tutor.id))
+    assert sync.sync_token == str(calendar.version)
+
+
+def test_schedule_skips_upstream_within_interval(
+    calendar, tutor, event_loop, monkeypatch
+):
+    monkeypatch.setattr(get_settings(), "calendar_sync_interval", 3600)
+    calendar.change(_event("a", 1))
+    assert _schedule_ids(event_loop, tutor) == ["a"]
+    list_calls = calendar.list_calls
+
+    calendar.change(_event("b", 2))
+    assert _schedule_ids(event_loop, tutor) == ["a"]
+    assert calendar.list_calls == list_calls
+
+
+def test_schedule_full_resync_on_expired_token(calendar, tutor, event_loop):
+    calendar.change(_event("a", 1))
+    assert _schedule_ids(event_loop, tutor) == ["a"]
+
+    calendar.cancel("a")
+    calendar.change(_event("b", 2))
+    calendar.tokens_expired = True
+    assert _schedule_ids(event_loop, tutor) == ["b"]
+
+
+def test_full_sync_stops_at_the_horizon(calendar, tutor, event_loop, monkeypatch):
+    monkeypatch.setattr(get_settings(), "calendar_sync_horizon_days", 2)
+    calendar.change(_event("a", 1))
+    calendar.change(_event("b", 24 * 5))
+
+    events = event_loop.run_until_complete(
+        tutor.get_events(NOW, NOW + datetime.timedelta(days=1))
+    )
+    assert [event["id"] for event in events] == ["a"]
+    assert "timeMax" in calendar.list_params[0]
+    stored = event_loop.run_until_complete(
+        CalendarEvent.filter(tutor_id=tutor.id).values_list("event_id", flat=True)
+    )
+    assert stored == ["a"]
+
+    # Past the stored window the Calendar API answers
+    assert _schedule_ids(event_loop, tutor) == ["a", "b"]
+
+
+def test_sync_of_another_process_stands(calendar, tutor, event_loop):
+    calendar.change(_event("a", 1))
+
+    async def race():
+        mine, _ = await CalendarSync.get_or_create(user_id=tutor.id)
+        # What another process read before this one wrote
+        theirs = await CalendarSync.get(user_id=tutor.id)
+        await tutor._pull_calendar(calendar, mine)
+        calendar.change(_event("b", 2))
+        await tutor._pull_calendar(calendar, theirs)
+        return mine, theirs
+
+    mine, theirs = event_loop.run_until_complete(race())
+
+    # The second full sync didn't write over the first, it took its result
+    assert theirs.synced_at == mine.synced_at
+    assert theirs.sync_token == mine.sync_token
+    stored = event_loop.run_until_complete(
+        CalendarEvent.filter(tutor_id=tutor.id).values_list("event_id", flat=True)
+    )
+    assert stored == ["a"]
+    # Nothing is kept per tutor once their sync is done
+    event_loop.run_until_complete(tutor.sync_calendar())
+    assert calendar_syncs.stats()["in_flight"] == 0
+
+
+def _reads(outcome: str) -> float:
+    return REGISTRY.get_sample_value("schedule_reads_total", {"outcome": outcome}) or 0
+
+
+def test_concurrent_reads_share_one_load(calendar, tutor, event_loop):
+    calendar.change(_event("a", 1))
+    calendar.delay = 0.1
+    schedule.schedule_cache.clear()
+    # Older than the local store, so every load pages through the Calendar API
+    time_min = NOW - datetime.timedelta(days=90)
+    time_max = NOW + datetime.timedelta(days=1)
+    loaded, coalesced = _reads("loaded"), _reads("coalesced")
+
+    async def read_together():
+        with capture_queries() as queries:
+            reads = await asyncio.gather(
+                *(
+                    schedule.read_schedule(tutor.id, time_min, time_max)
+                    for _ in range(10)
+                )
+            )
+        return reads, queries
+
+    reads, queries = event_loop.run_until_complete(read_together())
+
+    assert [[event["id"] for event in read] for read in reads] == [["a"]] * 10
+    # The sync of the local store and the window's page, for one read
+    assert calendar.list_calls == 2
+    assert sum(1 for query in queries if 'FROM "user"' in query) == 1
+    assert _reads("loaded") == loaded + 1
+    assert _reads("coalesced") == coalesced + 9
+
+
+def test_reads_are_cached_briefly(calendar, tutor, event_loop, monkeypatch):
+    calendar.change(_event("a", 1))
+    schedule.schedule_cache.clear()
+    window = (NOW, NOW + datetime.timedelta(days=7))
+    event_loop.run_until_complete(schedule.read_schedule(tutor.id, *window))
+    cached = _reads("cached")
+
+    with capture_queries() as queries:
+        events = event_loop.run_until_complete(
+            schedule.read_schedule(tutor.id, *window)
+        )
+    assert [event["id"] for event in events] == ["a"]
+    assert queries == []
+    assert _reads("cached") == cached + 1
+
+    # The same window in another time zone is the same read
+    local = tuple(
+        time.astimezone(datetime.timezone(-datetime.timedelta(hours=5)))
+        for time in window
+    )
+    event_loop.run_until_complete(schedule.read_schedule(tutor.id, *local))
+    assert _reads("cached") == cached + 2
+
+    calendar.change(_event("b", 2))
+    schedule.forget_schedules(tutor.id)
+    assert _schedule_ids(event_loop, tutor) == ["a", "b"]
+    events = event_loop.run_until_complete(schedule.read_schedule(tutor.id, *window))
+    assert [event["id"] for event in events] == ["a", "b"]
+
+
+def test_schedule_of_non_tutor(test_app, normal_user_token_headers):
+    me = test_app.get("/user/me", headers=normal_user_token_headers).json()
+    r = test_app.get(
+        f"/user/{me['id']}/schedule",
+        headers=normal_user_token_headers,
+        params={"time_min": NOW.isoformat(), "time_max": NOW.isoformat()},
+    )
+    assert r.status_code == 405
@@ -0,0 +1,49 @@
+import pytest
+
+from app.models.tortoise import Category
+from tests.utils.user import _create_user
+
+
+@pytest.fixture(scope="module")
+def people(test_app, event_loop):
+    async def seed():
+        ada = _create_user("Ada", "Lovelace")
+        ada.is_tutor = True
+        await ada.save()
+        grace = _create_user("Grace", "Hopper")
+        await grace.save()
+        compilers = await Category.create(name="Compilers")
+        await grace.categories.add(compilers)
+        return ada, grace
+
+    return event_loop.run_until_complete(seed())
+
+
+def _search(test_app, headers, query):
+    r = test_app.get(f"/user/search?{query}", headers=headers)
+    assert r.status_code == 200
+    return [user["email"] for user in r.json()]
+
+
+def test_search_by_name_prefix(test_app, normal_user_token_headers, people):
+    ada, grace = people
+    assert _search(test_app, normal_user_token_headers, "q=lovel") == [ada.email]
+    assert _search(test_app, normal_user_token_headers, "q=gra hop") == [grace.email]
+
+
+def test_search_by_email_and_category(test_app, normal_user_token_headers, people):
+    ada, grace = people
+    assert _search(test_app, normal_user_token_headers, "q=ada_love") == [ada.email]
+    assert _search(test_app, normal_user_token_headers, "q=compil") == [grace.email]
+
+
+def test_search_only_tutors(test_app, normal_user_token_headers, people):
+    ada, grace = people
+    emails = _search(test_app, normal_user_token_headers, "q=a&is_tutor=true")
+    assert ada.email in emails
+    assert grace.email not in emails
+
+
+def test_search_needs_a_query(test_app, normal_user_token_headers):
+    r = test_app.get("/user/search?q=", headers=normal_user_token_headers)
+    assert r.status_code == 422
@@ -0,0 +1,71 @@
+import datetime
+
+import pytest
+
+from app.api.category import pageinate_category
+from app.api.reports import pageinate_report
+from app.api.reviews import pageinate_review
+from app.api.session import paginate_sessions
+from app.api.user import pageinate_user
+from app.models.tortoise import (
+    Category,
+    Report,
+    ReportType,
+    Review,
+    Session,
+    StudentSessions,
+)
+from app.response_cache import response_cache
+from tests.utils.user import _create_user
+
+
+@pytest.fixture(scope="module")
+def rows(test_app, event_loop):
+    async def seed():
+        music = await Category.create(name="Música ✓")
+        tutor = _create_user("zoë", "tutor")
+        tutor.is_tutor = True
+        tutor.description = 'Says "hi"\n\tand more'
+        await tutor.save()
+        await tutor.categories.add(music)
+        student = _create_user("li", "student")
+        await student.save()
+        await Review.create(
+            reviewer=student, reviewee=tutor, rating=4, content="Très bien"
+        )
+        await Report.create(
+            type=ReportType.review, reference_id=1, user=student, reason="spam"
+        )
+        session = await Session.create(
+            tutor=tutor,
+            event_id="event",
+            start_time=datetime.datetime(2026, 10, 18, 9, tzinfo=datetime.timezone.utc),
+        )
+        await StudentSessions.create(session=session, category=music, user=student)
+
+    event_loop.run_until_complete(seed())
+
+
+@pytest.mark.parametrize(
+    "path, paginate",
+    [
+        ("/user/", pageinate_user),
+        ("/category/", pageinate_category),
+        ("/reviews/", pageinate_review),
+        ("/reports/", pageinate_report),
+        ("/session/", paginate_sessions),
+    ],
+)
+def test_fast_pages_match_pydantic_output(
+    test_app, super_user_token_headers, rows, monkeypatch, event_loop, path, paginate
+):
+    r = test_app.get(path, headers=super_user_token_headers)
+    assert r.status_code == 200
+    assert r.json()
+
+    monkeypatch.setattr(paginate, "fast", False)
+    event_loop.run_until_complete(response_cache.clear())
+    expected = test_app.get(path, headers=super_user_token_headers)
+    assert r.content == expected.content
+    assert r.headers["X-Total-Count"] == expected.headers["X-Total-Count"]
+    assert r.headers["content-type"] == expected.headers["content-type"]
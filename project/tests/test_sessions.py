@@ -0,0 +1,173 @@
+import datetime
+
+import pytest
+
+from app.models.tortoise import Category, Session, StudentSessions, User
+from tests.utils.user import _create_user
+
+TUTORS = 20
+STUDENTS = 30
+PER_TUTOR = 100
+START = datetime.datetime(2026, 10, 20, tzinfo=datetime.timezone.utc)
+DAY = datetime.timedelta(days=1)
+
+
+@pytest.fixture(scope="module")
+def seeded(test_app, normal_user_token_headers, tutor_user_token_headers, event_loop):
+    async def seed():
+        category = await Category.create(name="sessions")
+        me = await User.get(email="tutor_user@southwestern.edu")
+        student = await User.get(email="test_user@southwestern.edu")
+        tutors, students = [], []
+        for i in range(TUTORS):
+            user = _create_user(f"tutor{i}", "sessions")
+            user.is_tutor = True
+            await user.save()
+            tutors.append(user)
+        for i in range(STUDENTS):
+            user = _create_user(f"student{i}", "sessions")
+            await user.save()
+            students.append(user)
+
+        # Enough rows that reading a whole table costs more than an index
+        await Session.bulk_create(
+            [
+                Session(
+                    tutor_id=tutor.id,
+                    event_id=f"bulk{i}-{k}",
+                    start_time=START + k * datetime.timedelta(hours=6),
+                )
+                for i, tutor in enumerate(tutors)
+                for k in range(PER_TUTOR)
+            ]
+        )
+        bulk = await Session.filter(event_id__startswith="bulk").values_list(
+            "id", flat=True
+        )
+        await StudentSessions.bulk_create(
+            [
+                StudentSessions(
+                    session_id=session_id,
+                    user_id=students[n % STUDENTS].id,
+                    category_id=category.id,
+                )
+                for n, session_id in enumerate(bulk)
+            ]
+        )
+
+        # The tutor's past and upcoming sessions, the student attends one of them
+        mine = [
+            await Session.create(tutor=me, event_id=f"mine{i}", start_time=START + i)
+            for i in (-DAY, DAY, 2 * DAY)
+        ]
+        attended = [
+            mine[1],
+            await Session.create(
+                tutor=tutors[0], event_id="other", start_time=START + 3 * DAY
+            ),
+            await Session.create(
+                tutor=tutors[1], event_id="past", start_time=START - 2 * DAY
+            ),
+        ]
+        for session in attended:
+            await StudentSessions.create(
+                session=session, user=student, category=category
+            )
+        return {
+            "tutor": me.id,
+            "student": student.id,
+            "mine": [session.id for session in mine],
+            "attended": [session.id for session in attended],
+            "tutors": [tutor.id for tutor in tutors],
+        }
+
+    return event_loop.run_until_complete(seed())
+
+
+def _ids(test_app, url, headers, **params):
+    r = test_app.get(url, headers=headers, params=params)
+    assert r.status_code == 200
+    return [session["id"] for session in r.json()]
+
+
+def test_my_sessions_cover_both_roles(
+    test_app, seeded, normal_user_token_headers, tutor_user_token_headers
+):
+    tutor, student = tutor_user_token_headers, normal_user_token_headers
+    assert _ids(test_app, "/session/me", tutor) == seeded["mine"]
+    assert _ids(test_app, "/session/me", tutor, role="student") == []
+    assert _ids(test_app, "/session/me", student) == sorted(seeded["attended"])
+    assert _ids(test_app, "/session/me", student, role="tutor") == []
+
+    r = test_app.get("/session/me?role=teacher", headers=student)
+    assert r.status_code == 422
+
+
+def test_my_upcoming_sessions(
+    test_app, seeded, normal_user_token_headers, tutor_user_token_headers
+):
+    upcoming = {"start_time__gte": START.isoformat(), "_sort": "start_time"}
+    r = test_app.get("/session/me", headers=normal_user_token_headers, params=upcoming)
+    assert [session["id"] for session in r.json()] == seeded["attended"][:2]
+    assert r.headers["X-Total-Count"] == "2"
+
+    week = {**upcoming, "start_time__lt": (START + 2 * DAY).isoformat()}
+    assert _ids(test_app, "/session/me", tutor_user_token_headers, **week) == [
+        seeded["mine"][1]
+    ]
+
+
+def test_sessions_filtered_by_time_tutor_and_student(
+    test_app, seeded, super_user_token_headers
+):
+    tutor_id = seeded["tutors"][3]
+    window = {
+        "tutor_id": tutor_id,
+        "start_time__gte": (START + DAY).isoformat(),
+        "start_time__lt": (START + 3 * DAY).isoformat(),
+        "_end": 100,
+    }
+    r = test_app.get("/session/", headers=super_user_token_headers, params=window)
+    sessions = r.json()
+    # Every six hours for two days
+    assert len(sessions) == 8
+    assert r.headers["X-Total-Count"] == "8"
+    assert {session["tutor_id"] for session in sessions} == {tutor_id}
+
+    attended = _ids(
+        test_app,
+        "/session/",
+        super_user_token_headers,
+        studentsessions__user_id=seeded["student"],
+    )
+    assert attended == sorted(seeded["attended"])
+
+
+async def _plan(sql: str) -> str:
+    db = Session._meta.db
+    await db.execute_script("ANALYZE")
+    if db.capabilities.dialect == "postgres":
+        rows = await db.execute_query_dict(f"EXPLAIN {sql}")
+        return "\n".join(row["QUERY PLAN"] for row in rows)
+    rows = await db.execute_query_dict(f"EXPLAIN QUERY PLAN {sql}")
+    return "\n".join(row["detail"] for row in rows)
+
+
+def test_time_range_queries_use_the_indexes(seeded, event_loop):
+    tutor_range = Session.filter(
+        tutor_id=seeded["tutors"][3],
+        start_time__gte=START + DAY,
+        start_time__lt=START + 3 * DAY,
+    ).sql()
+    plan = event_loop.run_until_complete(_plan(tutor_range))
+    assert "idx_session_tutor_i_6c5a23" in plan, plan
+    assert "Seq Scan" not in plan, plan
+
+    attended = (
+        StudentSessions.filter(user_id=seeded["student"])
+        .values_list("session_id", flat=True)
+        .sql()
+    )
+    plan = event_loop.run_until_complete(_plan(attended))
+    assert "idx_student_ses_user_id_66d9c0" in plan, plan
+    assert "Seq Scan" not in plan, plan
@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+# Seconds `import app.main` may take, every worker and cold start pays for it.
+# It took about 2.4s before routes shared their cloned response models and the
+# Google libraries were imported lazily, about 0.8s after.
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", 1.5))
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": list(sys.modules)}))
+"""
+
+# Only the login and calendar paths need these
+LAZY_MODULES = [
+    "googleapiclient",
+    "google_auth_oauthlib",
+    "google_auth_httplib2",
+    "google.oauth2",
+    "fastapi_admin",
+]
+
+
+def _import_app() -> dict:
+    project = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", MEASURE],
+        cwd=project,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_import_time():
+    # Best of a few runs, a busy machine only ever makes an import slower
+    runs = [_import_app() for _ in range(3)]
+    seconds = min(run["seconds"] for run in runs)
+    assert seconds < IMPORT_TIME_BUDGET, f"import app.main took {seconds:.2f}s"
+
+
+def test_google_libraries_are_lazy():
+    modules = _import_app()["modules"]
+    assert [name for name in LAZY_MODULES if name in modules] == []
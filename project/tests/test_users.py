@@ -1,6 +1,10 @@
 import json
 
-from app.models.tortoise import User
+from fastapi import HTTPException
+
+from app.api.user import user_cache
+from app.models.tortoise import Category, User
+from tests.utils.user import _create_user
 
 
 def test_get_superuser_me(test_app, super_user_token_headers):
@@ -68,3 +72,159 @@ def test_patch_user_me(test_app, normal_user_token_headers, event_loop):
     assert current_user
     assert current_user["email"] == "test_user@southwestern.edu"
     assert current_user["description"] == data["description"]
+
+
+def test_current_user_is_cached(test_app, normal_user_token_headers):
+    user_cache.clear()
+    test_app.get("/user/me", headers=normal_user_token_headers)
+    hits, misses = user_cache.hits, user_cache.misses
+
+    r = test_app.get("/user/me", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert user_cache.hits == hits + 1
+    assert user_cache.misses == misses
+
+
+def test_patch_user_me_invalidates_cache(test_app, normal_user_token_headers):
+    test_app.get("/user/me", headers=normal_user_token_headers)
+    assert "test_user@southwestern.edu" in user_cache
+
+    data = {"description": "Updated description"}
+    r = test_app.patch(
+        "/user/me", data=json.dumps(data), headers=normal_user_token_headers
+    )
+    assert r.status_code == 200
+    assert "test_user@southwestern.edu" not in user_cache
+
+    r = test_app.get("/user/me", headers=normal_user_token_headers)
+    assert r.json()["description"] == data["description"]
+
+
+def test_user_cache_stats_superuser_only(
+    test_app, normal_user_token_headers, super_user_token_headers
+):
+    r = test_app.get("/user/cache/stats", headers=normal_user_token_headers)
+    assert r.status_code == 403
+
+    r = test_app.get("/user/cache/stats", headers=super_user_token_headers)
+    assert r.status_code == 200
+    assert {"hits", "misses", "evictions", "size"} <= set(r.json()["users"])
+    assert "refreshes_performed" in r.json()["calendar"]
+
+
+def _seed_students(event_loop, *names):
+    async def seed():
+        categories = [
+            (await Category.get_or_create(name=f"subject_{i}"))[0] for i in range(3)
+        ]
+        users = []
+        for name in names:
+            user = await User.get_or_none(username=f"{name}_student")
+            if user is None:
+                user = _create_user(name, "student")
+                await user.save()
+            users.append(user)
+        return categories, users
+
+    return event_loop.run_until_complete(seed())
+
+
+def _user_json(user, **changes):
+    return {
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "profile_url": user.profile_url,
+        **changes,
+    }
+
+
+def test_put_user_id_diffs_categories(test_app, super_user_token_headers, event_loop):
+    (a, b, c), (user,) = _seed_students(event_loop, "dora")
+    r = test_app.put(
+        f"/user/{user.id}",
+        json=_user_json(user, categories_ids=[a.id, b.id]),
+        headers=super_user_token_headers,
+    )
+    assert sorted(r.json()["categories_ids"]) == [a.id, b.id]
+
+    # Unknown category ids are skipped, leaving out categories_ids keeps them
+    r = test_app.put(
+        f"/user/{user.id}",
+        json=_user_json(user, categories_ids=[b.id, c.id, 999999]),
+        headers=super_user_token_headers,
+    )
+    assert sorted(r.json()["categories_ids"]) == [b.id, c.id]
+    r = test_app.put(
+        f"/user/{user.id}",
+        json=_user_json(user, description="Keeps her subjects"),
+        headers=super_user_token_headers,
+    )
+    assert r.json()["description"] == "Keeps her subjects"
+    assert sorted(r.json()["categories_ids"]) == [b.id, c.id]
+
+
+def test_bulk_patch_users(test_app, super_user_token_headers, event_loop):
+    (a, b, c), (eli, fay) = _seed_students(event_loop, "eli", "fay")
+    r = test_app.patch(
+        "/user/",
+        json=[
+            {"id": eli.id, "description": "Semester 1", "categories_ids": [a.id]},
+            {"id": fay.id, "description": "Semester 1", "categories_ids": [b.id, c.id]},
+        ],
+        headers=super_user_token_headers,
+    )
+    assert r.status_code == 200
+    users = {user["id"]: user for user in r.json()}
+    assert users[eli.id]["description"] == users[fay.id]["description"] == "Semester 1"
+    assert users[eli.id]["categories_ids"] == [a.id]
+    assert sorted(users[fay.id]["categories_ids"]) == [b.id, c.id]
+
+
+def test_bulk_patch_users_is_atomic(
+    test_app, super_user_token_headers, normal_user_token_headers, event_loop
+):
+    _, (eli,) = _seed_students(event_loop, "eli")
+    r = test_app.patch(
+        "/user/",
+        json=[{"id": eli.id, "description": "Changed"}, {"id": 999999}],
+        headers=super_user_token_headers,
+    )
+    assert r.status_code == 404
+    assert event_loop.run_until_complete(User.get(id=eli.id)).description != "Changed"
+
+    r = test_app.patch(
+        "/user/",
+        json=[{"id": eli.id}, {"id": eli.id}],
+        headers=super_user_token_headers,
+    )
+    assert r.status_code == 400
+
+    r = test_app.patch(
+        "/user/", json=[{"id": eli.id}], headers=normal_user_token_headers
+    )
+    assert r.status_code == 403
+
+
+def test_put_user_id_when_google_fails(
+    test_app, super_user_token_headers, event_loop, monkeypatch
+):
+    _, (gus,) = _seed_students(event_loop, "gus")
+    path = f"/user/{gus.id}"
+    assert test_app.get(path, headers=super_user_token_headers).status_code == 200
+
+    async def no_credentials(self):
+        raise HTTPException(403, "No Google credentials, sign in with Google")
+
+    monkeypatch.setattr(User, "get_calendar_service", no_credentials)
+    r = test_app.put(
+        path,
+        json=_user_json(gus, is_tutor=True, description="Tutors now"),
+        headers=super_user_token_headers,
+    )
+    # The update committed, the calendar comes with the next one
+    assert r.status_code == 200
+    assert r.json()["google_calendar_id"] is None
+    r = test_app.get(path, headers=super_user_token_headers)
+    assert r.json()["description"] == "Tutors now"
+    assert r.json()["is_tutor"]
@@ -0,0 +1,150 @@
+import datetime
+import time
+from typing import Dict, List, Optional
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+class FakeRequest:
+    def __init__(self, result: Dict, delay: float = 0.0, status: int = 200):
+        self.result = result
+        self.delay = delay
+        self.status = status
+
+    def execute(self, **kwargs) -> Dict:
+        # Block like a real googleapiclient request does
+        time.sleep(self.delay)
+        if self.status != 200:
+            raise HttpError(httplib2.Response({"status": self.status}), b"")
+        return self.result
+
+
+class FakeCalendars:
+    def __init__(self, service: "FakeCalendarService"):
+        self.service = service
+
+    def get(self, calendarId: str) -> FakeRequest:
+        return self.service.request({"id": calendarId, "summary": "TutorApp Schedule"})
+
+    def insert(self, body: Dict) -> FakeRequest:
+        return self.service.request({"id": "fake-calendar", **body})
+
+
+class FakeEvents:
+    def __init__(self, service: "FakeCalendarService"):
+        self.service = service
+
+    def list(
+        self, calendarId: str, syncToken: Optional[str] = None, **kwargs
+    ) -> FakeRequest:
+        self.service.list_params.append(kwargs)
+        return self.service.list_events(syncToken, kwargs.get("timeMax"))
+
+    def get(self, calendarId: str, eventId: str) -> FakeRequest:
+        if eventId not in self.service.items:
+            return self.service.request({}, status=404)
+        return self.service.request(dict(self.service.items[eventId]))
+
+    def update(self, calendarId: str, eventId: str, body: Dict, **kwargs):
+        request = self.service.request(body)
+        if request.status == 200:
+            self.service.change(body)
+        return request
+
+
+class FakeFreebusy:
+    def __init__(self, service: "FakeCalendarService"):
+        self.service = service
+
+    def query(self, body: Dict) -> FakeRequest:
+        calendar_ids = [item["id"] for item in body["items"]]
+        self.service.freebusy_calls.append(calendar_ids)
+        calendars = {}
+        for calendar_id in calendar_ids:
+            busy = self.service.busy.get(calendar_id)
+            if busy is None:
+                calendars[calendar_id] = {"errors": [{"reason": "notFound"}]}
+            else:
+                calendars[calendar_id] = {"busy": busy}
+        return self.service.request({"calendars": calendars})
+
+
+class FakeCalendarService:
+    """
+    Local stand-in for the Calendar v3 service where every call takes delay seconds
+
+    Sync tokens are the change counter of the calendar, so incremental lists return
+    only the events changed after the token was handed out
+    """
+
+    def __init__(self, events: List[Dict] = None, delay: float = 0.0):
+        self.delay = delay
+        self.items: Dict[str, Dict] = {}
+        self.versions: Dict[str, int] = {}
+        self.version = 0
+        self.list_calls = 0
+        self.list_params: List[Dict] = []
+        self.tokens_expired = False
+        # Statuses the next calls answer with instead of succeeding
+        self.failures: List[int] = []
+        # calendar id -> busy periods answered by freebusy, other calendars are unknown
+        self.busy: Dict[str, List[Dict]] = {}
+        self.freebusy_calls: List[List[str]] = []
+        for event in events or []:
+            self.change(event)
+
+    def change(self, event: Dict) -> None:
+        self.version += 1
+        self.items[event["id"]] = event
+        self.versions[event["id"]] = self.version
+
+    def cancel(self, event_id: str) -> None:
+        self.change({"id": event_id, "status": "cancelled"})
+
+    def request(self, result: Dict, status: int = 200) -> FakeRequest:
+        if self.failures:
+            status = self.failures.pop(0)
+        return FakeRequest(result, self.delay, status)
+
+    def list_events(
+        self, sync_token: Optional[str], time_max: Optional[str] = None
+    ) -> FakeRequest:
+        self.list_calls += 1
+        if sync_token is None:
+            items = [e for e in self.items.values() if e.get("status") != "cancelled"]
+            if time_max is not None:
+                end = datetime.datetime.fromisoformat(time_max)
+                items = [
+                    e
+                    for e in items
+                    if datetime.datetime.fromisoformat(e["start"]["dateTime"]) < end
+                ]
+        elif self.tokens_expired:
+            self.tokens_expired = False
+            return self.request({}, status=410)
+        else:
+            items = [
+                self.items[event_id]
+                for event_id, version in self.versions.items()
+                if version > int(sync_token)
+            ]
+        return self.request({"items": items, "nextSyncToken": str(self.version)})
+
+    def calendars(self) -> FakeCalendars:
+        return FakeCalendars(self)
+
+    def events(self) -> FakeEvents:
+        return FakeEvents(self)
+
+    def freebusy(self) -> FakeFreebusy:
+        return FakeFreebusy(self)
+
+
+def fake_event(event_id: str, start: str, end: str) -> Dict:
+    return {
+        "id": event_id,
+        "summary": "Office hours",
+        "start": {"dateTime": start},
+        "end": {"dateTime": end},
+    }